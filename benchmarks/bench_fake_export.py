@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the synthetic DynamoDB export generation at the 10M+ items
+scale, it writes to a local folder and reports the throughput and the peak
+memory. Usage::
+
+    python benchmarks/bench_fake_export.py --n-items 10000000 --n-files 100 --max-workers 8
+"""
+
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+from pathlib import Path
+
+from dynamodb_to_datalake.fake_export import FakeExportGenerator
+
+
+def get_peak_rss_mb() -> float:
+    # ru_maxrss is in KB on linux
+    usage = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return usage / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-items", type=int, default=10_000_000)
+    parser.add_argument("--n-files", type=int, default=100)
+    parser.add_argument("--n-accounts", type=int, default=1_000_000)
+    parser.add_argument("--account-skew", type=float, default=1.0)
+    parser.add_argument("--max-workers", type=int, default=1)
+    parser.add_argument("--compress-level", type=int, default=6)
+    parser.add_argument(
+        "--dir", type=str, default=None, help="output folder, default is a temp dir"
+    )
+    args = parser.parse_args()
+
+    dir_root = Path(args.dir) if args.dir else Path(tempfile.mkdtemp())
+    generator = FakeExportGenerator(
+        n_items=args.n_items,
+        n_files=args.n_files,
+        n_accounts=args.n_accounts,
+        account_skew=args.account_skew,
+        compress_level=args.compress_level,
+        seed=1,
+    )
+    start = time.perf_counter()
+    try:
+        summary = generator.write_to_dir(
+            dir_root, max_workers=args.max_workers, verbose=False
+        )
+        elapsed = time.perf_counter() - start
+
+        # the manifest adds up to the requested item count
+        manifest_files = dir_root.joinpath(summary["manifestFilesS3Key"])
+        n_items = sum(
+            json.loads(line)["itemCount"]
+            for line in manifest_files.read_text().splitlines()
+        )
+        assert n_items == summary["itemCount"] == args.n_items
+    finally:
+        if args.dir is None:
+            shutil.rmtree(dir_root)
+
+    size_mb = summary["billedSizeBytes"] / 1024 / 1024
+    print(f"items      {args.n_items:>12,}")
+    print(f"files      {args.n_files:>12,}")
+    print(f"elapsed    {elapsed:>12.1f} s")
+    print(f"throughput {args.n_items / elapsed:>12,.0f} items/s")
+    print(f"size       {size_mb:>12,.1f} MB gzip")
+    print(f"peak rss   {get_peak_rss_mb():>12,.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
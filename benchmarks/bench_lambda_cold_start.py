@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+"""
+Measure the cold start cost of each Lambda handler module.
+
+Every sample runs in a fresh Python process (like a new Lambda execution
+environment), and measures:
+
+- import: the time to import the handler module, this is the Lambda "init"
+  phase, it should not make any network call.
+- first client: the time to create the boto3 clients used by the handler
+  on the first invocation.
+
+It uses dummy credentials and doesn't call AWS. Usage::
+
+    python benchmarks/bench_lambda_cold_start.py --n 10
+"""
+
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+dir_project_root = Path(__file__).absolute().parent.parent
+dir_lambda_functions = dir_project_root.joinpath("lambda_functions")
+
+# handler module name -> the clients it uses on invocation
+HANDLERS = {
+    "dynamodb_stream_consumer": [("s3", 8)],
+    "dynamodb_export_to_s3_post_processor_coordinator": [("s3", None), ("lambda", None)],
+    "dynamodb_export_to_s3_post_processor_worker": [("s3", None)],
+}
+
+ENV = {
+    "AWS_REGION": "us-east-1",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    # block the metadata endpoint lookup, it is a network call
+    "AWS_EC2_METADATA_DISABLED": "true",
+    "S3_BUCKET": "bucket",
+    "S3_PREFIX": "prefix",
+    "DYNAMODB_EXPORT_TO_S3_POST_PROCESS_WORKER_FUNCTION_NAME": "worker",
+}
+
+SCRIPT = """
+import sys, json, time
+sys.path[:0] = [{dir_project_root!r}, {dir_lambda_functions!r}]
+start = time.perf_counter()
+import {module}
+import_time = time.perf_counter() - start
+from dynamodb_to_datalake.lambda_runtime import get_client
+start = time.perf_counter()
+for service_name, max_pool_connections in {clients!r}:
+    get_client(service_name, max_pool_connections=max_pool_connections)
+client_time = time.perf_counter() - start
+print(json.dumps({{"import": import_time, "client": client_time}}))
+"""
+
+
+def measure(module: str, clients: list) -> dict:
+    script = SCRIPT.format(
+        dir_project_root=str(dir_project_root),
+        dir_lambda_functions=str(dir_lambda_functions),
+        module=module,
+        clients=clients,
+    )
+    res = subprocess.run(
+        [sys.executable, "-c", script],
+        env=ENV,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(res.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=10, help="number of samples")
+    args = parser.parse_args()
+
+    print(f"{'handler':<52} {'import (ms)':>12} {'first client (ms)':>18}")
+    for module, clients in HANDLERS.items():
+        samples = [measure(module, clients) for _ in range(args.n)]
+        import_ms = statistics.median(s["import"] for s in samples) * 1000
+        client_ms = statistics.median(s["client"] for s in samples) * 1000
+        print(f"{module:<52} {import_ms:>12.1f} {client_ms:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+"""
+Micro-benchmark of the dynamodb stream partition key derivation, the slicing
+fast path vs ``datetime.strptime``. Usage::
+
+    python benchmarks/bench_partition_key.py --n 100000
+"""
+
+import argparse
+import random
+import timeit
+from datetime import datetime, timedelta, timezone
+
+from dynamodb_to_datalake.stream_partition import (
+    _get_partition_key_slow,
+    get_partition_key,
+    group_by_partition,
+)
+
+
+def make_update_at_list(n: int) -> list:
+    start = datetime(2023, 8, 1, tzinfo=timezone.utc)
+    return [
+        (start + timedelta(seconds=random.randint(0, 3600))).strftime(
+            "%Y-%m-%dT%H:%M:%S.%f%z"
+        )
+        for _ in range(n)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=100000, help="number of records")
+    args = parser.parse_args()
+    update_at_list = make_update_at_list(args.n)
+
+    def slow():
+        for update_at in update_at_list:
+            _get_partition_key_slow(update_at)
+
+    def fast():
+        for update_at in update_at_list:
+            get_partition_key(update_at)
+
+    def group():
+        group_by_partition(update_at_list, lambda update_at: update_at)
+
+    for name, func in [("strptime", slow), ("slicing", fast), ("group", group)]:
+        elapsed = min(timeit.repeat(func, number=1, repeat=5))
+        print(f"{name:<10} {elapsed * 1000:>8.1f} ms, {elapsed / args.n * 1e9:>8.0f} ns/record")
+
+
+if __name__ == "__main__":
+    main()
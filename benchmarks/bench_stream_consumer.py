@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+"""
+Throughput benchmark of the dynamodb stream consumer Lambda function hot
+path. It replays generated DynamoDB stream events against a moto S3 backend
+(or the local sink) and reports records per second, per phase timings and
+memory allocations. Usage::
+
+    python benchmarks/bench_stream_consumer.py --n 20000 --skew 1.2 --sink s3_json
+"""
+
+import os
+import io
+import sys
+import argparse
+import tempfile
+import contextlib
+from pathlib import Path
+
+dir_project_root = Path(__file__).absolute().parent.parent
+# the replay harness is a test utility
+dir_tests = dir_project_root.joinpath("tests")
+
+ENV = {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    "AWS_EC2_METADATA_DISABLED": "true",
+}
+BUCKET = "bench-bucket"
+PREFIX = "dynamodb_stream"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=20000, help="number of records")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--n-accounts", type=int, default=1000)
+    parser.add_argument("--skew", type=float, default=1.0, help="zipf exponent")
+    parser.add_argument("--hot-items", type=int, default=100)
+    parser.add_argument("--events-per-second", type=float, default=50)
+    parser.add_argument(
+        "--sink", default="s3_json", choices=["s3_json", "s3_parquet", "local"]
+    )
+    parser.add_argument("--changed-columns-only", action="store_true")
+    parser.add_argument("--no-trace-memory", action="store_true")
+    args = parser.parse_args()
+
+    os.environ.update(ENV)
+    import boto3
+    from moto import mock_aws
+    sys.path[:0] = [str(dir_project_root), str(dir_tests)]
+    from stream_replay import (
+        StreamEventGenerator,
+        load_handler_module,
+        run_replay,
+    )
+
+    events = StreamEventGenerator(
+        n_accounts=args.n_accounts,
+        skew=args.skew,
+        hot_items=args.hot_items,
+        events_per_second=args.events_per_second,
+        seed=1,
+    ).generate_events(n_records=args.n, batch_size=args.batch_size)
+
+    with mock_aws(), tempfile.TemporaryDirectory() as dir_local_sink:
+        boto3.client("s3").create_bucket(Bucket=BUCKET)
+        module = load_handler_module(
+            {
+                "S3_BUCKET": BUCKET,
+                "S3_PREFIX": PREFIX,
+                "SINK_TYPE": args.sink,
+                "LOCAL_SINK_DIR": dir_local_sink,
+                "CHANGED_COLUMNS_ONLY": str(args.changed_columns_only).lower(),
+            }
+        )
+        # the handler logs every write
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = run_replay(
+                module, events, trace_memory=not args.no_trace_memory
+            )
+
+    print(f"sink: {args.sink}, records: {report.n_records}, events: {report.n_events}")
+    print(f"failures: {report.n_failures}")
+    print(f"elapsed: {report.elapsed:.3f} sec")
+    print(f"throughput: {report.records_per_second:,.0f} records / sec")
+    total = sum(report.phases.values())
+    for phase, seconds in report.phases.items():
+        print(
+            f"  {phase:<10} {seconds * 1000:>10.1f} ms "
+            f"({seconds / total * 100 if total else 0:>5.1f}%)"
+        )
+    if not args.no_trace_memory:
+        print(f"peak memory: {report.peak_memory / 1024:,.0f} KB")
+        print(f"allocations still alive: {report.n_allocations:,}")
+
+
+if __name__ == "__main__":
+    main()
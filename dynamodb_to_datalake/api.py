@@ -5,10 +5,17 @@ from .cdk_deploy import cdk_deploy_1_iam_role
 from .cdk_deploy import cdk_deploy_2_everything
 from .cdk_deploy import cdk_destroy
 from .data_faker import run_data_faker
+from .fake_export import FakeExportGenerator
+from .data_faker import run_load_generator
 from .dynamodb_export import export_dynamodb_to_s3
 from .glue_job import run_initial_load_glue_job
 from .glue_job import run_incremental_glue_job
+from .glue_job import run_clustering_glue_job
+from .glue_job import run_maintenance_glue_job
 from .athena import run_athena_query
 from .athena import preview_hudi_table
 from .compare import compare
+from .compare import compare_by_checksum
+from .incremental_compare import run_incremental_compare
+from .hudi_incremental import pull_incremental
 from .cleanup import cleanup
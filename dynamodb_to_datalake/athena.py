@@ -4,29 +4,142 @@
 Athena related functions.
 """
 
+import typing as T
+import io
+import uuid
+import asyncio
+import hashlib
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import fsspec
 import polars as pl
+from s3pathlib import S3Path
+from diskcache import Cache
 
 from .config_init import config
 from .boto_ses import bsm
-from .s3paths import s3dir_athena_result
-from .paths import path_query_result
+from .s3paths import s3dir_athena_result, s3dir_athena_unload, s3dir_table
+from .paths import path_query_result, dir_athena_result_cache
 from .waiter import Waiter
+from .athena_sql import wrap_unload, normalize_sql
+from .glue_catalog import get_glue_table
+from .hudi_reader import HudiSnapshotReader
 
+_athena_result_cache: T.Optional[Cache] = None
+_lock = threading.Lock()
 
-def run_athena_query(
-    database: str,
-    sql: str,
-    verbose: bool = True,
+
+def get_athena_result_cache() -> Cache:
+    """
+    Get the local athena result cache, open it on first use, so importing
+    this module doesn't create the cache folder.
+    """
+    global _athena_result_cache
+    if _athena_result_cache is None:
+        with _lock:
+            if _athena_result_cache is None:
+                _athena_result_cache = Cache(str(dir_athena_result_cache))
+    return _athena_result_cache
+
+
+class QueryStateEnum:
+    QUEUED = "QUEUED"
+    RUNNING = "RUNNING"
+    SUCCEEDED = "SUCCEEDED"
+    FAILED = "FAILED"
+    CANCELLED = "CANCELLED"
+
+
+def _read_parquet(s3path: S3Path) -> pl.DataFrame:
+    return pl.read_parquet(io.BytesIO(s3path.read_bytes()))
+
+
+def read_unload_result(
+    exec_id: str,
+    max_workers: int = 16,
 ) -> pl.DataFrame:
     """
-    Run athena query and get the result as a polars.DataFrame.
+    Read the parquet files produced by an UNLOAD query in parallel. The list
+    of data files is in the ``${exec_id}-manifest.csv`` file.
     """
-    if verbose:
-        print(f"run_athena_query:")
-        print(sql)
+    s3path_manifest = s3dir_athena_result.joinpath(f"{exec_id}-manifest.csv")
+    s3path_list = [
+        S3Path(uri)
+        for uri in s3path_manifest.read_text().splitlines()
+        if uri.strip()
+    ]
+    if len(s3path_list) == 0:
+        return pl.DataFrame()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        dfs = list(executor.map(_read_parquet, s3path_list))
+    return pl.concat(dfs, rechunk=True)
 
-    # ref: https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/athena/client/start_query_execution.html
-    response = bsm.athena_client.start_query_execution(
+
+def delete_query_result(
+    exec_id: str,
+    s3dir_unload: T.Optional[S3Path] = None,
+):
+    """
+    Delete the query result metadata files and the UNLOAD data files.
+    """
+    for filename in [
+        f"{exec_id}.csv",
+        f"{exec_id}.csv.metadata",
+        f"{exec_id}.metadata",
+        f"{exec_id}-manifest.csv",
+    ]:
+        s3dir_athena_result.joinpath(filename).delete()
+    if s3dir_unload is not None:
+        s3dir_unload.delete()
+
+
+def get_table_version(
+    database: str,
+    table: str,
+) -> str:
+    """
+    Get the version of a Glue table. For Hudi table, it is the last commit time
+    synced to the catalog, otherwise it is the Glue table version id.
+    """
+    table_details = get_glue_table(bsm.glue_client, database, table)
+    if table_details is None:
+        return ""
+    parameters = table_details.get("Parameters", {})
+    return parameters.get(
+        "last_commit_time_sync",
+        table_details.get("VersionId", ""),
+    )
+
+
+def get_cache_key(
+    database: str,
+    sql: str,
+    unload: bool,
+    cache_tables: T.List[str],
+) -> str:
+    versions = [
+        f"{table}@{get_table_version(database, table)}"
+        for table in sorted(cache_tables)
+    ]
+    key = "\n".join([database, normalize_sql(sql), str(unload), *versions])
+    return hashlib.md5(key.encode("utf-8")).hexdigest()
+
+
+def start_athena_query(
+    database: str,
+    sql: str,
+    result_reuse_max_age_minutes: T.Optional[int] = None,
+) -> str:
+    """
+    Start an athena query execution and return the execution id.
+
+    :param result_reuse_max_age_minutes: if given, let Athena reuse the result
+        of a previous identical query that is not older than this.
+        Ref: https://docs.aws.amazon.com/athena/latest/ug/reusing-query-results.html
+    """
+    kwargs = dict(
         QueryString=sql,
         QueryExecutionContext=dict(
             Catalog="AwsDataCatalog",
@@ -36,55 +149,338 @@ def run_athena_query(
             OutputLocation=s3dir_athena_result.uri,
         ),
     )
-    exec_id = response["QueryExecutionId"]
+    if result_reuse_max_age_minutes is not None:
+        kwargs["ResultReuseConfiguration"] = dict(
+            ResultReuseByAgeConfiguration=dict(
+                Enabled=True,
+                MaxAgeInMinutes=result_reuse_max_age_minutes,
+            )
+        )
+    # ref: https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/athena/client/start_query_execution.html
+    response = bsm.athena_client.start_query_execution(**kwargs)
+    return response["QueryExecutionId"]
 
+
+def is_athena_query_finished(exec_id: str) -> bool:
+    """
+    Check the query status, raise if it is failed or cancelled.
+    """
     # ref: https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/athena/client/get_query_execution.html
+    response = bsm.athena_client.get_query_execution(
+        QueryExecutionId=exec_id,
+    )
+    status = response["QueryExecution"]["Status"]["State"]
+    if status == QueryStateEnum.SUCCEEDED:
+        return True
+    elif status in [QueryStateEnum.FAILED, QueryStateEnum.CANCELLED]:
+        reason = response["QueryExecution"]["Status"].get("StateChangeReason")
+        raise RuntimeError(f"status = {status}, reason = {reason}")
+    else:
+        return False
+
+
+def wait_athena_query(
+    exec_id: str,
+    timeout: int = 600,
+    delays: float = 0.2,
+    backoff: float = 1.5,
+    max_delay: float = 5,
+    verbose: bool = True,
+):
+    """
+    Wait for the query to finish. The polling interval starts small, so
+    a short query returns quickly, and grows up to ``max_delay`` so a long
+    query doesn't make too many API calls.
+    """
     for _ in Waiter(
-        delays=1,
-        timeout=10,
+        delays=delays,
+        timeout=timeout,
         verbose=verbose,
+        backoff=backoff,
+        max_delay=max_delay,
     ):
-        response = bsm.athena_client.get_query_execution(
-            QueryExecutionId=exec_id,
-        )
-        status = response["QueryExecution"]["Status"]["State"]
-        if status == "SUCCEEDED":
+        if is_athena_query_finished(exec_id):
             break
-        elif status in ["FAILED", "CANCELLED"]:
-            raise RuntimeError(f"status = {status}")
-        else:
-            pass
 
     if verbose:
         print("")
 
+
+def read_athena_query_result(
+    exec_id: str,
+    s3dir_unload: T.Optional[S3Path] = None,
+) -> pl.DataFrame:
+    if s3dir_unload is not None:
+        return read_unload_result(exec_id)
+
     s3path_athena_result = s3dir_athena_result.joinpath(f"{exec_id}.csv")
     with s3path_athena_result.open("rb") as f:
         df = pl.read_csv(f.read())
     return df
 
 
+def run_athena_query(
+    database: str,
+    sql: str,
+    verbose: bool = True,
+    unload: bool = False,
+    timeout: int = 600,
+    cache_tables: T.Optional[T.List[str]] = None,
+    result_reuse_max_age_minutes: T.Optional[int] = None,
+) -> pl.DataFrame:
+    """
+    Run athena query and get the result as a polars.DataFrame.
+
+    :param unload: if True, wrap the query in an UNLOAD statement and read
+        the result from parquet files. It is a lot faster for large result set
+        and preserves the data type. The result files are deleted afterwards.
+    :param timeout: raise TimeoutError if the query is not finished in time.
+    :param cache_tables: if given, cache the result locally, the cache key
+        includes the version of these tables, so the cache is invalidated
+        automatically when any of them changes.
+    :param result_reuse_max_age_minutes: see :func:`start_athena_query`.
+    """
+    if cache_tables is not None:
+        cache_key = get_cache_key(database, sql, unload, cache_tables)
+        df = get_athena_result_cache().get(cache_key)
+        if df is not None:
+            if verbose:
+                print(f"hit local athena result cache: {cache_key}")
+            return df
+
+    s3dir_unload = None
+    if unload:
+        s3dir_unload = s3dir_athena_unload.joinpath(uuid.uuid4().hex).to_dir()
+        sql = wrap_unload(sql, s3dir_unload)
+        result_reuse_max_age_minutes = None  # UNLOAD doesn't support it
+
+    if verbose:
+        print("run_athena_query:")
+        print(sql)
+
+    exec_id = start_athena_query(
+        database=database,
+        sql=sql,
+        result_reuse_max_age_minutes=result_reuse_max_age_minutes,
+    )
+    try:
+        wait_athena_query(exec_id, timeout=timeout, verbose=verbose)
+        df = read_athena_query_result(exec_id, s3dir_unload=s3dir_unload)
+    finally:
+        if s3dir_unload is not None:
+            delete_query_result(exec_id, s3dir_unload=s3dir_unload)
+
+    if cache_tables is not None:
+        get_athena_result_cache().set(cache_key, df)
+    return df
+
+
+def iter_athena_query_batches(
+    database: str,
+    sql: str,
+    verbose: bool = True,
+    timeout: int = 600,
+) -> T.Iterable[pl.DataFrame]:
+    """
+    Run athena query with UNLOAD, yield the result one parquet file at a
+    time, so the caller doesn't need to hold the whole result in memory. The
+    result files are deleted afterwards.
+    """
+    s3dir_unload = s3dir_athena_unload.joinpath(uuid.uuid4().hex).to_dir()
+    sql = wrap_unload(sql, s3dir_unload)
+    if verbose:
+        print("run_athena_query:")
+        print(sql)
+    exec_id = start_athena_query(database=database, sql=sql)
+    wait_athena_query(exec_id, timeout=timeout, verbose=verbose)
+    s3path_manifest = s3dir_athena_result.joinpath(f"{exec_id}-manifest.csv")
+    try:
+        for uri in s3path_manifest.read_text().splitlines():
+            if uri.strip():
+                yield _read_parquet(S3Path(uri))
+    finally:
+        delete_query_result(exec_id, s3dir_unload=s3dir_unload)
+
+
+def run_athena_queries(
+    database: str,
+    sql_list: T.List[str],
+    max_workers: int = 8,
+    **kwargs,
+) -> T.List[pl.DataFrame]:
+    """
+    Run many athena queries concurrently, return the results in the same order.
+    The other keyword arguments are passed to :func:`run_athena_query`.
+    """
+    kwargs.setdefault("verbose", False)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(
+            executor.map(
+                functools.partial(run_athena_query, database, **kwargs),
+                sql_list,
+            )
+        )
+
+
+async def run_athena_query_async(
+    database: str,
+    sql: str,
+    unload: bool = False,
+    timeout: int = 600,
+    delays: float = 0.2,
+    backoff: float = 1.5,
+    max_delay: float = 5,
+    result_reuse_max_age_minutes: T.Optional[int] = None,
+) -> pl.DataFrame:
+    """
+    The asyncio version of :func:`run_athena_query`. The blocking boto3 calls
+    run in the default executor, and the polling doesn't block the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    s3dir_unload = None
+    if unload:
+        s3dir_unload = s3dir_athena_unload.joinpath(uuid.uuid4().hex).to_dir()
+        sql = wrap_unload(sql, s3dir_unload)
+        result_reuse_max_age_minutes = None
+    exec_id = await loop.run_in_executor(
+        None,
+        functools.partial(
+            start_athena_query,
+            database=database,
+            sql=sql,
+            result_reuse_max_age_minutes=result_reuse_max_age_minutes,
+        ),
+    )
+    try:
+        deadline = loop.time() + timeout
+        delay = delays
+        while 1:
+            if await loop.run_in_executor(None, is_athena_query_finished, exec_id):
+                break
+            if loop.time() > deadline:
+                raise TimeoutError(f"timed out in {timeout} seconds!")
+            await asyncio.sleep(delay)
+            delay = min(delay * backoff, max_delay)
+        return await loop.run_in_executor(
+            None,
+            functools.partial(
+                read_athena_query_result,
+                exec_id,
+                s3dir_unload=s3dir_unload,
+            ),
+        )
+    finally:
+        if s3dir_unload is not None:
+            await loop.run_in_executor(
+                None,
+                functools.partial(
+                    delete_query_result,
+                    exec_id,
+                    s3dir_unload=s3dir_unload,
+                ),
+            )
+
+
+async def run_athena_queries_async(
+    database: str,
+    sql_list: T.List[str],
+    **kwargs,
+) -> T.List[pl.DataFrame]:
+    """
+    Submit many athena queries at once and wait for all of them.
+    """
+    return await asyncio.gather(
+        *[run_athena_query_async(database, sql, **kwargs) for sql in sql_list]
+    )
+
+
+def get_hudi_table_reader() -> HudiSnapshotReader:
+    """
+    Create a :class:`~dynamodb_to_datalake.hudi_reader.HudiSnapshotReader`
+    that reads the Hudi table from S3 directly, using the same credential as
+    the project boto session.
+    """
+    credentials = bsm.boto_ses.get_credentials()
+    fs = fsspec.filesystem(
+        "s3",
+        key=credentials.access_key,
+        secret=credentials.secret_key,
+        token=credentials.token,
+    )
+    return HudiSnapshotReader(table_path=s3dir_table.uri, fs=fs)
+
+
+def read_hudi_table(
+    columns: T.Optional[T.List[str]] = None,
+    partition_filter=None,
+    as_of_instant: T.Optional[str] = None,
+) -> pl.DataFrame:
+    """
+    Read the Hudi table snapshot directly from S3 as a polars.DataFrame,
+    without Athena.
+    """
+    table = get_hudi_table_reader().read(
+        columns=columns,
+        partition_filter=partition_filter,
+        as_of_instant=as_of_instant,
+    )
+    return pl.from_arrow(table)
+
+
+def iter_hudi_table_batches(
+    columns: T.Optional[T.List[str]] = None,
+    partition_filter=None,
+    as_of_instant: T.Optional[str] = None,
+) -> T.Iterable[pl.DataFrame]:
+    """
+    Read the Hudi table snapshot directly from S3, one base file at a time.
+    """
+    for table in get_hudi_table_reader().iter_batches(
+        columns=columns,
+        partition_filter=partition_filter,
+        as_of_instant=as_of_instant,
+    ):
+        yield pl.from_arrow(table)
+
+
 def preview_hudi_table(
     limit: int = 10,
     verbose: bool = False,
+    use_hudi_reader: bool = False,
 ) -> pl.DataFrame:
     """
     Preview the Dynamodb equavilent Hudi table via Athena.
+
+    :param use_hudi_reader: if True, read the table from S3 directly
+        instead of using Athena.
     """
     print(f"preview hudi table '{config.glue_database}.{config.glue_table}'")
-    df = run_athena_query(
-        database=config.glue_database,
-        sql=f"SELECT COUNT(*) as n_rows FROM {config.glue_table}",
-        verbose=verbose,
-    )
-    n_rows = df.to_dicts()[0]["n_rows"]
+    if use_hudi_reader:
+        reader = get_hudi_table_reader()
+        n_rows = reader.count()
+        # only read the base files needed to fill the limit, one at a time
+        reader.max_workers = 1
+        dfs = list()
+        n_read = 0
+        for table in reader.iter_batches():
+            dfs.append(pl.from_arrow(table))
+            n_read += table.num_rows
+            if n_read >= limit:
+                break
+        df = pl.concat(dfs, how="diagonal").head(limit) if dfs else pl.DataFrame()
+    else:
+        df_count, df = run_athena_queries(
+            database=config.glue_database,
+            sql_list=[
+                f"SELECT COUNT(*) as n_rows FROM {config.glue_table}",
+                f"SELECT * FROM {config.glue_table} LIMIT {limit}",
+            ],
+            verbose=verbose,
+            cache_tables=[config.glue_table],
+        )
+        n_rows = df_count.to_dicts()[0]["n_rows"]
     print(f"n_rows = {n_rows}")
 
-    df = run_athena_query(
-        database=config.glue_database,
-        sql=f"SELECT * FROM {config.glue_table} LIMIT {limit}",
-        verbose=verbose,
-    )
     df.write_csv(str(path_query_result), has_header=True)
     print(f"preview data: file://{path_query_result}")
     return df
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+"""
+Athena SQL text helpers.
+
+It doesn't depend on the project config, so it can be tested without AWS.
+"""
+
+import re
+
+from s3pathlib import S3Path
+
+
+def wrap_unload(sql: str, s3dir: S3Path) -> str:
+    """
+    Wrap a SELECT query in an UNLOAD statement that writes the result to
+    ``s3dir`` as parquet files.
+
+    Ref: https://docs.aws.amazon.com/athena/latest/ug/unload.html
+    """
+    sql = sql.strip()
+    if sql.endswith(";"):
+        sql = sql[:-1]
+    return f"UNLOAD ({sql}) TO '{s3dir.uri}' WITH (format = 'PARQUET', compression = 'SNAPPY')"
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Collapse the white spaces outside the string literals and remove the
+    trailing semicolon, so that the same query in different format has the same
+    cache key.
+    """
+    parts = re.split(r"('(?:[^']|'')*')", sql.strip())
+    for i in range(0, len(parts), 2):  # even index parts are not string literal
+        parts[i] = re.sub(r"\s+", " ", parts[i])
+    sql = "".join(parts).strip()
+    if sql.endswith(";"):
+        sql = sql[:-1].rstrip()
+    return sql
@@ -13,6 +13,7 @@ import aws_cdk.aws_iam as iam
 import aws_cdk.aws_dynamodb as dynamodb
 import aws_cdk.aws_lambda as lambda_
 import aws_cdk.aws_lambda_event_sources as lambda_event_sources
+import aws_cdk.aws_sqs as sqs
 import aws_cdk.aws_glue as glue
 
 from constructs import Construct
@@ -116,6 +117,19 @@ class Stack(cdk.Stack):
             removal_policy=cdk.RemovalPolicy.DESTROY,
         )
 
+        # the Hudi optimistic concurrency control lock, the schema is the
+        # same as the one created by the Hudi DynamoDBBasedLockProvider
+        self.dynamodb_table_hudi_lock = dynamodb.Table(
+            self,
+            "DynamodbTableHudiLock",
+            table_name=self.config.hudi_lock_table,
+            partition_key=dynamodb.Attribute(
+                name="key", type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=cdk.RemovalPolicy.DESTROY,
+        )
+
     def declare_glue_catalog(self):
         self.glue_database = glue.CfnDatabase(
             self,
@@ -141,6 +155,17 @@ class Stack(cdk.Stack):
             "--TempDir": f"s3://{self.config.s3_bucket_glue_assets}/temporary/",
         }
 
+        # the helpers shared by the glue job scripts
+        s3path_utils = s3paths.s3dir_glue_artifacts.joinpath(
+            paths.path_glue_script_utils.basename
+        )
+        s3path_utils.write_text(
+            paths.path_glue_script_utils.read_text(),
+            content_type="text/plain",
+        )
+        default_arguments["--extra-py-files"] = s3path_utils.uri
+        default_arguments["--UTILS_CODE_ETAG"] = s3path_utils.etag
+
         s3path_artifact = s3paths.s3dir_glue_artifacts.joinpath(
             paths.path_glue_script_initial_load.basename
         )
@@ -172,10 +197,21 @@ class Stack(cdk.Stack):
                 "--S3URI_TABLE": s3paths.s3dir_table.uri,
                 "--DATABASE_NAME": self.config.glue_database,
                 "--TABLE_NAME": self.config.glue_table,
+                "--PARTITION_FIELDS": self.config.hudi_partition_fields,
+                "--LOCK_TABLE_NAME": self.config.hudi_lock_table,
                 "--CODE_ETAG": s3path_artifact.etag,
             },
         )
 
+        if self.config.enable_aggregates:
+            aggregate_arguments = {
+                "--ENABLE_AGGREGATES": "true",
+                "--S3URI_AGG_TABLE": s3paths.s3dir_table_daily_account_summary.uri,
+                "--AGG_TABLE_NAME": self.config.glue_table_daily_account_summary,
+            }
+        else:
+            aggregate_arguments = {}
+
         s3path_artifact = s3paths.s3dir_glue_artifacts.joinpath(
             paths.path_glue_script_incremental.basename
         )
@@ -207,6 +243,104 @@ class Stack(cdk.Stack):
                 "--DATABASE_NAME": self.config.glue_database,
                 "--TABLE_NAME": self.config.glue_table,
                 "--CODE_ETAG": s3path_artifact.etag,
+                "--PARTITION_FIELDS": self.config.hudi_partition_fields,
+                "--PARTIAL_UPDATE": str(self.config.enable_changed_columns_only).lower(),
+                "--LOCK_TABLE_NAME": self.config.hudi_lock_table,
+                **aggregate_arguments,
+            },
+        )
+
+        s3path_artifact = s3paths.s3dir_glue_artifacts.joinpath(
+            paths.path_glue_script_clustering.basename
+        )
+        s3path_artifact.write_text(
+            paths.path_glue_script_clustering.read_text(),
+            content_type="text/plain",
+        )
+        self.glue_job_clustering = glue.CfnJob(
+            self,
+            "GlueJobClustering",
+            name=self.config.glue_job_name_clustering,
+            role=self.glue_role.role_arn,
+            command=glue.CfnJob.JobCommandProperty(
+                name="glueetl",
+                script_location=s3path_artifact.uri,
+            ),
+            glue_version="4.0",
+            worker_type="G.1X",
+            number_of_workers=2,
+            execution_property=glue.CfnJob.ExecutionPropertyProperty(
+                max_concurrent_runs=1,
+            ),
+            max_retries=0,
+            timeout=60,
+            default_arguments={
+                **default_arguments,
+                "--S3URI_TABLE": s3paths.s3dir_table.uri,
+                "--DATABASE_NAME": self.config.glue_database,
+                "--TABLE_NAME": self.config.glue_table,
+                "--SORT_COLUMNS": self.config.clustering_sort_columns,
+                "--LAYOUT_STRATEGY": self.config.clustering_layout_strategy,
+                "--MIN_PARTITION_AGE_DAYS": str(
+                    self.config.clustering_min_partition_age_days
+                ),
+                "--PARTITION_FIELDS": self.config.hudi_partition_fields,
+                "--LOCK_TABLE_NAME": self.config.hudi_lock_table,
+                "--CODE_ETAG": s3path_artifact.etag,
+            },
+        )
+
+        s3path_artifact = s3paths.s3dir_glue_artifacts.joinpath(
+            paths.path_glue_script_maintenance.basename
+        )
+        s3path_artifact.write_text(
+            paths.path_glue_script_maintenance.read_text(),
+            content_type="text/plain",
+        )
+        self.glue_job_maintenance = glue.CfnJob(
+            self,
+            "GlueJobMaintenance",
+            name=self.config.glue_job_name_maintenance,
+            role=self.glue_role.role_arn,
+            command=glue.CfnJob.JobCommandProperty(
+                name="glueetl",
+                script_location=s3path_artifact.uri,
+            ),
+            glue_version="4.0",
+            worker_type="G.1X",
+            number_of_workers=2,
+            execution_property=glue.CfnJob.ExecutionPropertyProperty(
+                max_concurrent_runs=1,
+            ),
+            max_retries=0,
+            timeout=60,
+            default_arguments={
+                **default_arguments,
+                "--S3URI_TABLE": s3paths.s3dir_table.uri,
+                "--S3URI_MAINTENANCE_REPORT": s3paths.s3dir_maintenance_report.uri,
+                "--DATABASE_NAME": self.config.glue_database,
+                "--TABLE_NAME": self.config.glue_table,
+                "--CLEANER_COMMITS_RETAINED": str(
+                    self.config.maintenance_cleaner_commits_retained
+                ),
+                "--ARCHIVE_MIN_COMMITS": str(
+                    self.config.maintenance_archive_min_commits
+                ),
+                "--ARCHIVE_MAX_COMMITS": str(
+                    self.config.maintenance_archive_max_commits
+                ),
+                "--SMALL_FILE_LIMIT_MB": str(
+                    self.config.maintenance_small_file_limit_mb
+                ),
+                "--TARGET_FILE_SIZE_MB": str(
+                    self.config.maintenance_target_file_size_mb
+                ),
+                "--MIN_PARTITION_AGE_DAYS": str(
+                    self.config.clustering_min_partition_age_days
+                ),
+                "--PARTITION_FIELDS": self.config.hudi_partition_fields,
+                "--LOCK_TABLE_NAME": self.config.hudi_lock_table,
+                "--CODE_ETAG": s3path_artifact.etag,
             },
         )
 
@@ -242,16 +376,39 @@ class Stack(cdk.Stack):
             environment={
                 "S3_BUCKET": s3paths.s3dir_dynamodb_stream.bucket,
                 "S3_PREFIX": s3paths.s3dir_dynamodb_stream.key,
+                "MAX_WORKERS": "8",
+                "FUNCTION_TIMEOUT": "3",
+                "SINK_TYPE": self.config.stream_sink_type,
+                "CHANGED_COLUMNS_ONLY": str(
+                    self.config.enable_changed_columns_only
+                ).lower(),
                 "CODE_ETAG": source_artifacts_deployment.s3path_source_zip.etag,
             },
         )
 
+        # the records still failing after the retries are dropped from the
+        # shard, the failure destination keeps the shard and the sequence
+        # number range of them, so they can be re-read from the stream
+        # (24 hours retention) or reconciled by the compare, instead of the
+        # data lake diverging silently
+        self.sqs_queue_dynamodb_stream_consumer_dlq = sqs.Queue(
+            self,
+            "SqsQueueDynamoDBStreamConsumerDlq",
+            queue_name=self.config.sqs_queue_name_dynamodb_stream_consumer_dlq,
+            retention_period=cdk.Duration.days(14),
+        )
         self.lambda_function_dynamodb_stream_consumer.add_event_source(
             lambda_event_sources.DynamoEventSource(
                 self.dynamodb_table_transaction,
                 starting_position=lambda_.StartingPosition.LATEST,
                 batch_size=100,
                 max_batching_window=cdk.Duration.seconds(10),
+                report_batch_item_failures=True,
+                bisect_batch_on_error=True,
+                retry_attempts=10,
+                on_failure=lambda_event_sources.SqsDlq(
+                    self.sqs_queue_dynamodb_stream_consumer_dlq
+                ),
             )
         )
 
@@ -1,79 +1,559 @@
 # -*- coding: utf-8 -*-
 
+"""
+Compare the data in DynamoDB and Hudi.
+
+The DynamoDB table is scanned with parallel segment scan, each segment is
+converted into columnar (Arrow backed) polars DataFrame batches, so we never
+hold millions of python dict in memory. The batches of both sides are spilled
+into hash buckets of the record key on the local disk, then we do a key based
+join diff one bucket at a time, so the memory is bounded by the bucket size
+instead of the table size, and a missing row won't misalign the rest of the
+comparison. See :mod:`~dynamodb_to_datalake.compare_diff`.
+
+For large table, :func:`compare_by_checksum` only moves per bucket checksum
+to the client, and only drill into the bucket that doesn't match, the
+source rows are spilled with their bucket during the checksum pass so the
+source is scanned only once. See :mod:`~dynamodb_to_datalake.compare_checksum`.
+
+Both comparison can use a DynamoDB export as the source instead of scanning
+the live table, it doesn't consume any read capacity and it is a consistent
+point-in-time view of the table.
+"""
+
 import typing as T
 import textwrap
+import tempfile
+import functools
+from pathlib import Path
+from datetime import datetime, timezone, timedelta
+from concurrent.futures import ThreadPoolExecutor
 
 import polars as pl
-from rich import print as rprint
+from s3pathlib import S3Path
 
 from .config_init import config
-from .dynamodb_table import Transaction
-from .athena import run_athena_query
+from .boto_ses import bsm
+from .s3paths import (
+    s3dir_dynamodb_stream,
+    s3dir_incremental_glue_job_input,
+    s3path_incremental_glue_job_tracker,
+    s3path_dynamodb_stream_compaction_manifest,
+)
+from .dynamodb_table import Transaction, DATE_FORMAT
+from .athena import (
+    run_athena_query,
+    iter_athena_query_batches,
+    iter_hudi_table_batches,
+)
+from .incremental_load_orchestration import PARTITION_DATETIME_FORMAT, CDCTracker
+from .stream_compaction import read_stream_file
+from .vendor.aws_dynamodb_export_to_s3 import Export, DataFile
+from .compare_diff import (
+    T_RECORDS,
+    KEY,
+    COLUMNS,
+    to_df,
+    normalize_df,
+    DiffResult,
+    diff,
+    print_diff_result,
+    BucketSpill,
+    diff_by_bucket,
+    make_id,
+    watermark_to_instant,
+    cap_watermark,
+    exclude_changed_after,
+)
+from .compare_checksum import (
+    row_hash_sql,
+    Bucketizer,
+    T_CHECKSUMS,
+    CHECKSUM_SCHEMA,
+    merge_checksums,
+    to_checksum_df,
+    find_mismatch_buckets,
+    ChecksumSpill,
+    checksum_records,
+)
+
 
+T_BATCH_READER = T.Callable[[], T.Iterable[T_RECORDS]]
 
-T_RECORDS = T.List[T.Dict[str, T.Any]]
 
+def scan_dynamodb_table_segment(
+    segment: int,
+    total_segments: int,
+    batch_size: int = 10000,
+) -> T.Iterable[T_RECORDS]:
+    """
+    Scan one segment of the DynamoDB table, yield hudified records in batches.
 
-def read_from_dynamodb_table() -> T_RECORDS:
-    rows = list()
+    Ref: https://docs.aws.amazon.com/amazondynamodb/latest/developerguide/Scan.html#Scan.ParallelScan
+    """
+    batch = list()
     for transaction in Transaction.scan(
-        # limit=10,
+        segment=segment,
+        total_segments=total_segments,
     ):
-        rows.append(transaction.hudify())
-    df = pl.DataFrame(rows)
-    df = df.sort("id")
-    records = df.to_dicts()
-    return records
+        batch.append(transaction.hudify())
+        if len(batch) >= batch_size:
+            yield batch
+            batch = list()
+    if len(batch):
+        yield batch
+
+
+def get_dynamodb_table_batch_readers(
+    total_segments: int = 8,
+    batch_size: int = 10000,
+) -> T.List[T_BATCH_READER]:
+    """
+    Create one batch reader per DynamoDB scan segment.
+    """
+    return [
+        functools.partial(
+            scan_dynamodb_table_segment,
+            segment=segment,
+            total_segments=total_segments,
+            batch_size=batch_size,
+        )
+        for segment in range(total_segments)
+    ]
+
+
+def _spill_batches(batch_reader: T_BATCH_READER, spill: BucketSpill) -> int:
+    return spill.write_batches(to_df(records) for records in batch_reader())
+
+
+def spill_batches_in_parallel(
+    batch_readers: T.List[T_BATCH_READER],
+    spill: BucketSpill,
+    max_workers: T.Optional[int] = None,
+) -> int:
+    """
+    Run the batch readers in parallel threads, spill each batch into the
+    buckets, only the batches being read are in memory.
+
+    :return: number of the rows.
+    """
+    if max_workers is None:
+        max_workers = len(batch_readers)
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        return sum(
+            executor.map(
+                functools.partial(_spill_batches, spill=spill),
+                batch_readers,
+            )
+        )
+
+
+def read_export_data_file(
+    data_file: DataFile,
+    batch_size: int = 10000,
+) -> T.Iterable[T_RECORDS]:
+    """
+    Read one DynamoDB export data file, yield hudified records in batches.
+    """
+    batch = list()
+    for item in data_file.read_items(s3_client=bsm.s3_client):
+        batch.append(Transaction.from_raw_data(item).hudify())
+        if len(batch) >= batch_size:
+            yield batch
+            batch = list()
+    if len(batch):
+        yield batch
+
+
+def get_export_batch_readers(
+    export: Export,
+    batch_size: int = 10000,
+) -> T.List[T_BATCH_READER]:
+    """
+    Create one batch reader per DynamoDB export data file.
+    """
+    data_file_list = export.get_data_files(
+        dynamodb_client=bsm.dynamodb_client,
+        s3_client=bsm.s3_client,
+    )
+    return [
+        functools.partial(
+            read_export_data_file,
+            data_file=data_file,
+            batch_size=batch_size,
+        )
+        for data_file in data_file_list
+    ]
+
+
+def get_export_watermark(export: Export) -> str:
+    """
+    Get the export point-in-time in the same format as the ``update_at`` field.
+    """
+    if export.export_time is None:
+        export.get_details(dynamodb_client=bsm.dynamodb_client)
+    export_time: datetime = export.export_time
+    if export_time.tzinfo is None:
+        export_time = export_time.replace(tzinfo=timezone.utc)
+    return export_time.astimezone(timezone.utc).strftime(DATE_FORMAT)
 
 
-def read_from_hudi_table() -> T_RECORDS:
+def cap_watermark_at_cdc_tracker(watermark: str) -> str:
+    """
+    Cap the watermark at the stream data the incremental glue job has loaded
+    into Hudi, see :func:`~dynamodb_to_datalake.compare_diff.cap_watermark`.
+    Without the tracker no incremental glue job has run yet, the watermark is
+    returned as it is.
+    """
+    if s3path_incremental_glue_job_tracker.exists(bsm=bsm) is False:
+        return watermark
+    if config.enable_stream_compaction:
+        s3path_compaction_manifest = s3path_dynamodb_stream_compaction_manifest
+    else:
+        s3path_compaction_manifest = None
+    tracker = CDCTracker.read(
+        bsm=bsm,
+        s3path_tracker=s3path_incremental_glue_job_tracker,
+        s3dir_glue_job_input=s3dir_incremental_glue_job_input,
+        s3dir_dynamodb_stream=s3dir_dynamodb_stream,
+        glue_job_name=config.glue_job_name_incremental,
+        epoch_processed_partition=datetime.strptime(watermark, DATE_FORMAT)
+        .astimezone(timezone.utc)
+        .strftime(PARTITION_DATETIME_FORMAT),
+        s3path_compaction_manifest=s3path_compaction_manifest,
+    )
+    capped = cap_watermark(watermark, tracker.last_processed_datetime)
+    if capped != watermark:
+        print(f"hudi is loaded until {capped}, cap the watermark {watermark}")
+    return capped
+
+
+def _read_changed_keys(s3uri: str, watermark: str) -> T.Set[str]:
+    return {
+        make_id(account=record["account"], create_at=record["create_at"])
+        for record in read_stream_file(S3Path(s3uri), bsm=bsm)
+        if record["update_at"] > watermark
+    }
+
+
+def get_changed_keys_after(
+    watermark: str,
+    max_workers: int = 16,
+) -> T.Set[str]:
+    """
+    Get the keys updated or deleted after the watermark from the dynamodb
+    stream data. The tombstone is the only trace of a deleted record, it is
+    already gone from Hudi.
+
+    The stream data is partitioned by ``update_at``, we only read the
+    partitions after the watermark minute, the result is about the number of
+    the changes since the export.
+    """
+    start = (
+        datetime.strptime(watermark, DATE_FORMAT)
+        .astimezone(timezone.utc)
+        .replace(tzinfo=None, second=0, microsecond=0)
+    )
+    if config.enable_stream_compaction:
+        s3path_compaction_manifest = s3path_dynamodb_stream_compaction_manifest
+    else:
+        s3path_compaction_manifest = None
+    tracker = CDCTracker(
+        s3path_tracker=s3path_incremental_glue_job_tracker,
+        s3dir_glue_job_input=s3dir_incremental_glue_job_input,
+        s3dir_dynamodb_stream=s3dir_dynamodb_stream,
+        glue_job_name=config.glue_job_name_incremental,
+        epoch_processed_partition=start.strftime(PARTITION_DATETIME_FORMAT),
+        s3path_compaction_manifest=s3path_compaction_manifest,
+    )
+    s3uri_list = tracker.list_stream_files(
+        bsm=bsm,
+        start_after_datetime=start,
+        end_before_datetime=datetime.utcnow() + timedelta(minutes=1),
+    )
+    keys = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for other in executor.map(
+            functools.partial(_read_changed_keys, watermark=watermark),
+            s3uri_list,
+        ):
+            keys.update(other)
+    print(f"{len(keys)} keys changed after {watermark}")
+    return keys
+
+
+def get_hudi_table_sql() -> str:
+    return textwrap.dedent(f"""
+    SELECT
+        id,
+        {Transaction.account.attr_name},
+        {Transaction.create_at.attr_name},
+        {Transaction.update_at.attr_name},
+        {Transaction.entity.attr_name},
+        {Transaction.amount.attr_name},
+        {Transaction.is_credit.attr_name},
+        {Transaction.note.attr_name}
+    FROM {config.glue_database}.{config.glue_table}
+    """)
+
+
+def iter_hudi_table(
+    use_hudi_reader: bool = False,
+    as_of_instant: T.Optional[str] = None,
+) -> T.Iterable[pl.DataFrame]:
+    """
+    Read the Hudi table in batches.
+
+    :param use_hudi_reader: if True, read the table from S3 directly instead of
+        using Athena.
+    :param as_of_instant: time travel to this Hudi instant, only works with
+        ``use_hudi_reader=True``.
+    """
+    if use_hudi_reader:
+        batches = iter_hudi_table_batches(columns=COLUMNS, as_of_instant=as_of_instant)
+    else:
+        batches = iter_athena_query_batches(
+            database=config.glue_database,
+            sql=get_hudi_table_sql(),
+            verbose=False,
+        )
+    for df in batches:
+        yield normalize_df(df)
+
+
+def compare(
+    total_segments: int = 8,
+    batch_size: int = 10000,
+    export: T.Optional[Export] = None,
+    use_hudi_reader: bool = False,
+    n_buckets: int = 64,
+    dir_spill: T.Optional[str] = None,
+) -> DiffResult:
+    """
+    Compare the data in dynamodb and hudi, see if they are exactly the same.
+
+    :param export: if given, read the source data from this DynamoDB export
+        instead of scanning the live table.
+    :param use_hudi_reader: if True, read the Hudi table from S3 directly
+        instead of using Athena. With an export, it time travels the Hudi
+        table to the export time.
+    :param n_buckets: the rows of both sides are spilled into this many hash
+        buckets, the peak memory is about the size of one bucket of each side.
+    :param dir_spill: the local folder to spill, default a temp folder that is
+        deleted afterwards.
+    """
+    watermark = None if export is None else get_export_watermark(export)
+    as_of_instant = None
+    if watermark is not None and use_hudi_reader:
+        as_of_instant = watermark_to_instant(watermark)
+    if export is None:
+        batch_readers = get_dynamodb_table_batch_readers(
+            total_segments=total_segments,
+            batch_size=batch_size,
+        )
+    else:
+        batch_readers = get_export_batch_readers(export, batch_size=batch_size)
+
+    with tempfile.TemporaryDirectory(dir=dir_spill) as dir_tmp:
+        spill_dynamodb = BucketSpill(Path(dir_tmp, "dynamodb"), n_buckets=n_buckets)
+        spill_hudi = BucketSpill(Path(dir_tmp, "hudi"), n_buckets=n_buckets)
+        # read the hudi side while reading the source side
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(
+                spill_hudi.write_batches,
+                iter_hudi_table(
+                    use_hudi_reader=use_hudi_reader,
+                    as_of_instant=as_of_instant,
+                ),
+            )
+            n_dynamodb_rows = spill_batches_in_parallel(batch_readers, spill_dynamodb)
+            n_hudi_rows = future.result()
+        print(f"n_dynamodb_rows: {n_dynamodb_rows}")
+        print(f"n_hudi_rows: {n_hudi_rows}")
+        prepare = None
+        if watermark is not None and as_of_instant is None:
+            watermark = cap_watermark_at_cdc_tracker(watermark)
+            prepare = functools.partial(
+                exclude_changed_after,
+                watermark=watermark,
+                changed_keys=get_changed_keys_after(watermark),
+            )
+        diff_result = diff_by_bucket(spill_dynamodb, spill_hudi, prepare=prepare)
+    print_diff_result(diff_result)
+    return diff_result
+
+
+# ------------------------------------------------------------------------------
+# Checksum based reconciliation
+# ------------------------------------------------------------------------------
+def _checksum_batches(
+    batch_reader: T_BATCH_READER,
+    bucketizer: Bucketizer,
+    spill: T.Optional[ChecksumSpill] = None,
+) -> T_CHECKSUMS:
+    checksums = dict()
+    for records in batch_reader():
+        checksum_records(records, bucketizer, checksums, spill=spill)
+    return checksums
+
+
+def get_source_checksums(
+    batch_readers: T.List[T_BATCH_READER],
+    bucketizer: Bucketizer,
+    max_workers: T.Optional[int] = None,
+    spill: T.Optional[ChecksumSpill] = None,
+) -> pl.DataFrame:
+    """
+    Compute the per bucket checksum of the source data in parallel. Only the
+    checksum is kept in memory.
+
+    :param spill: if given, the source rows are also spilled to the local disk
+        with their bucket, so the mismatch buckets can be read from it later.
+    """
+    if max_workers is None:
+        max_workers = len(batch_readers)
+    checksums = dict()
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        for other in executor.map(
+            functools.partial(_checksum_batches, bucketizer=bucketizer, spill=spill),
+            batch_readers,
+        ):
+            merge_checksums(checksums, other)
+    return to_checksum_df(checksums)
+
+
+def _exclude_batch_reader(
+    batch_reader: T_BATCH_READER,
+    keys: T.Set[str],
+) -> T.Iterable[T_RECORDS]:
+    for records in batch_reader():
+        records = [row for row in records if row[KEY] not in keys]
+        if len(records):
+            yield records
+
+
+def get_hudi_checksums(
+    bucketizer: Bucketizer,
+    watermark: T.Optional[str] = None,
+) -> pl.DataFrame:
+    """
+    Compute the per bucket checksum of the Hudi table in Athena.
+
+    :param watermark: if given, only the records not changed after the
+        watermark are hashed.
+    """
+    where = ""
+    if watermark is not None:
+        where = f"WHERE {Transaction.update_at.attr_name} <= '{watermark}'"
     df = run_athena_query(
         database=config.glue_database,
         sql=textwrap.dedent(f"""
         SELECT
-            id,
-            {Transaction.account.attr_name},
-            {Transaction.create_at.attr_name},
-            {Transaction.update_at.attr_name},
-            {Transaction.entity.attr_name},
-            {Transaction.amount.attr_name},
-            {Transaction.is_credit.attr_name},
-            {Transaction.note.attr_name}
-        FROM {config.glue_database}.{config.glue_table} ORDER BY id
+            {bucketizer.bucket_sql()} AS bucket,
+            COUNT(*) AS n_rows,
+            bitwise_xor_agg({row_hash_sql()}) AS checksum
+        FROM {config.glue_database}.{config.glue_table}
+        {where}
+        GROUP BY 1
+        """),
+        verbose=False,
+        cache_tables=[config.glue_table],
+    )
+    return df.select([pl.col(col).cast(dtype) for col, dtype in CHECKSUM_SCHEMA.items()])
+
+
+def read_from_hudi_table_by_buckets(
+    bucketizer: Bucketizer,
+    buckets: T.List[str],
+) -> pl.DataFrame:
+    in_list = ", ".join([f"'{bucket}'" for bucket in buckets])
+    df = run_athena_query(
+        database=config.glue_database,
+        sql=textwrap.dedent(f"""
+        SELECT {", ".join(COLUMNS)}
+        FROM {config.glue_database}.{config.glue_table}
+        WHERE {bucketizer.bucket_sql()} IN ({in_list})
         """),
         verbose=False,
+        unload=True,
     )
-    rows = df.to_dicts()
-    return rows
+    return normalize_df(df)
 
 
-def compare():
+def compare_by_checksum(
+    bucketizer: T.Optional[Bucketizer] = None,
+    batch_readers: T.Optional[T.List[T_BATCH_READER]] = None,
+    max_workers: T.Optional[int] = None,
+    export: T.Optional[Export] = None,
+    dir_spill: T.Optional[str] = None,
+) -> DiffResult:
     """
-    Compare the data in dynamodb and hudi, see if they are exactly the same.
+    Compare the data in dynamodb and hudi by per bucket checksum, and only
+    drill into the mismatch buckets to find out the row level difference.
+
+    The source is scanned only once, the source rows are spilled to the local
+    disk with their bucket while computing the checksum, the mismatch buckets
+    are read back from the spill.
+
+    With an export, the records changed after the export time are excluded
+    from both side before hashing: the Hudi side only hashes the records with
+    ``update_at`` <= watermark, the source side drops the keys updated or
+    deleted after the watermark in the dynamodb stream data. A change not
+    loaded into Hudi yet still makes its bucket mismatch, the drill down
+    excludes it from the row level diff.
+
+    :param bucketizer: how to group rows into buckets, default bucket by id.
+    :param batch_readers: the source side batch readers, default is the
+        DynamoDB table parallel segment scan.
+    :param export: if given, read the source data from this DynamoDB export
+        instead of scanning the live table.
+    :param dir_spill: the local folder to spill, default a temp folder that is
+        deleted afterwards.
     """
-    dynamodb_rows = read_from_dynamodb_table()
-    hudi_rows = read_from_hudi_table()
-    n_dynamodb_rows = len(dynamodb_rows)
-    n_hudi_rows = len(hudi_rows)
-    print(f"n_dynamodb_rows: {n_dynamodb_rows}")
-    print(f"n_hudi_rows: {n_hudi_rows}")
-    if n_dynamodb_rows != n_hudi_rows:
-        raise ValueError("n_dynamodb_rows != n_hudi_rows")
-    else:
-        print("NICE! n_dynamodb_rows == n_hudi_rows")
-
-    # print first 10 rows that are different
-    is_same = True
-    diff_count = 0
-    for dynamodb_row, hudi_row in zip(dynamodb_rows, hudi_rows):
-        if dynamodb_row != hudi_row:
-            is_same = False
-            diff_count += 1
-            if diff_count <= 10:
-                print(f"dynamodb_row: {dynamodb_row}")
-                print(f"hudi_row: {hudi_row}")
-
-    if is_same is True:
-        print("NICE! The data in dynamodb and hudi are exactly the same.")
-    else:
-        print("OPS! The data in dynamodb and hudi are not the same.")
+    if bucketizer is None:
+        bucketizer = Bucketizer()
+    if batch_readers is None:
+        if export is None:
+            batch_readers = get_dynamodb_table_batch_readers()
+        else:
+            batch_readers = get_export_batch_readers(export)
+    watermark = None
+    changed_keys = None
+    if export is not None:
+        watermark = cap_watermark_at_cdc_tracker(get_export_watermark(export))
+        changed_keys = get_changed_keys_after(watermark)
+        batch_readers = [
+            functools.partial(_exclude_batch_reader, batch_reader, keys=changed_keys)
+            for batch_reader in batch_readers
+        ]
+
+    with tempfile.TemporaryDirectory(dir=dir_spill) as dir_tmp:
+        spill = ChecksumSpill(dir_root=Path(dir_tmp))
+        # run the athena query while computing the source side checksum
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(get_hudi_checksums, bucketizer, watermark)
+            df_source_checksums = get_source_checksums(
+                batch_readers,
+                bucketizer,
+                max_workers=max_workers,
+                spill=spill,
+            )
+            df_hudi_checksums = future.result()
+        buckets = find_mismatch_buckets(df_source_checksums, df_hudi_checksums)
+        print(f"n buckets: {df_source_checksums.shape[0]}")
+        print(f"n mismatch buckets: {len(buckets)}")
+        if len(buckets) == 0:
+            diff_result = diff(to_df([]), to_df([]))
+        else:
+            df_source = spill.read(buckets)
+            df_hudi = read_from_hudi_table_by_buckets(bucketizer, buckets)
+            if watermark is not None:
+                df_source, df_hudi = exclude_changed_after(
+                    df_source,
+                    df_hudi,
+                    watermark=watermark,
+                    changed_keys=changed_keys,
+                )
+            diff_result = diff(df_source, df_hudi)
+    print_diff_result(diff_result)
+    return diff_result
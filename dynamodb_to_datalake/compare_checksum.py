@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+
+"""
+The per bucket checksum used by the checksum based reconciliation.
+
+It doesn't depend on the project config, so it can be tested without AWS.
+Every python function here has an Athena SQL twin (:func:`row_hash` and
+:func:`row_hash_sql`, :meth:`Bucketizer.get_bucket` and
+:meth:`Bucketizer.bucket_sql`), the two sides of the comparison are only
+comparable if the twins return the same value for the same row.
+
+While the source side checksum is computed, the source rows are also spilled
+to the local disk with their bucket (:class:`ChecksumSpill`), so drilling
+into the mismatch buckets doesn't need a second scan of the source.
+"""
+
+import typing as T
+import uuid
+import hashlib
+import dataclasses
+from pathlib import Path
+
+import polars as pl
+
+from .compare_diff import (
+    T_RECORDS,
+    KEY,
+    SCHEMA,
+    HUDI_SUFFIX,
+    to_df,
+    _is_different,
+)
+from .glue_catalog import PARTITION_GRANULARITY_LIST
+
+
+class BucketByEnum:
+    id = "id"
+    partition = "partition"
+
+
+# create_at string layout: 2023-08-01T00:00:00.000000+0000
+PARTITION_SPECS = [
+    ("year", "create_year", 0, 4),
+    ("month", "create_month", 5, 7),
+    ("day", "create_day", 8, 10),
+    ("hour", "create_hour", 11, 13),
+    ("minute", "create_minute", 14, 16),
+]
+GRANULARITY_LIST = PARTITION_GRANULARITY_LIST
+
+ROW_HASH_COLUMNS = [
+    KEY,
+    "update_at",
+    "entity",
+    "amount",
+    "is_credit",
+    "note",
+]
+
+
+def _md5(s: str) -> bytes:
+    return hashlib.md5(s.encode("utf-8")).digest()
+
+
+def _md5_sql(expr: str) -> str:
+    return f"md5(to_utf8({expr}))"
+
+
+def row_hash(row: T.Dict[str, T.Any]) -> int:
+    """
+    Signed 64 bits hash of a hudified row, it is equivalent to
+    :func:`row_hash_sql` in Athena.
+    """
+    s = "|".join(
+        ["" if row[col] is None else str(row[col]) for col in ROW_HASH_COLUMNS]
+    )
+    return int.from_bytes(_md5(s)[:8], "big", signed=True)
+
+
+def row_hash_sql() -> str:
+    parts = list()
+    for col in ROW_HASH_COLUMNS:
+        if SCHEMA[col] == pl.Utf8:
+            parts.append(f"coalesce({col}, '')")
+        else:
+            parts.append(f"coalesce(CAST({col} AS varchar), '')")
+    expr = ", '|', ".join(parts)
+    return f"from_big_endian_64(substr({_md5_sql(f'concat({expr})')}, 1, 8))"
+
+
+@dataclasses.dataclass
+class Bucketizer:
+    """
+    Define how to group rows into checksum buckets.
+
+    :param bucket_by: ``"id"`` or ``"partition"``. ``"id"`` hash the record
+        key into ``n_buckets`` buckets, ``"partition"`` use the
+        ``create_year/.../create_${granularity}`` hudi partition as bucket.
+    :param n_buckets: number of buckets, only used when bucket by id.
+    :param granularity: one of year, month, day, hour, minute, only used
+        when bucket by partition. It cannot be finer than the partition
+        granularity of the Hudi table.
+    """
+
+    bucket_by: str = dataclasses.field(default=BucketByEnum.id)
+    n_buckets: int = dataclasses.field(default=1024)
+    granularity: str = dataclasses.field(default="day")
+
+    def __post_init__(self):
+        if self.bucket_by not in [BucketByEnum.id, BucketByEnum.partition]:
+            raise ValueError(f"invalid bucket_by: {self.bucket_by!r}")
+        if self.granularity not in GRANULARITY_LIST:
+            raise ValueError(f"invalid granularity: {self.granularity!r}")
+
+    @property
+    def _partition_specs(self):
+        return PARTITION_SPECS[: GRANULARITY_LIST.index(self.granularity) + 1]
+
+    def get_bucket(self, row: T.Dict[str, T.Any]) -> str:
+        if self.bucket_by == BucketByEnum.id:
+            n = int.from_bytes(_md5(row[KEY])[:4], "big", signed=True)
+            return str(n % self.n_buckets)
+        else:
+            create_at = row["create_at"]
+            return "-".join(
+                [create_at[start:end] for _, _, start, end in self._partition_specs]
+            )
+
+    def bucket_sql(self) -> str:
+        """
+        The Athena SQL expression that is equivalent to :meth:`get_bucket`.
+        """
+        if self.bucket_by == BucketByEnum.id:
+            n = f"from_big_endian_32(substr({_md5_sql(KEY)}, 1, 4))"
+            return (
+                f"CAST(mod(mod({n}, {self.n_buckets}) + {self.n_buckets}, "
+                f"{self.n_buckets}) AS varchar)"
+            )
+        else:
+            cols = ", '-', ".join([col for _, col, _, _ in self._partition_specs])
+            return f"concat({cols})"
+
+
+T_CHECKSUMS = T.Dict[str, T.Tuple[int, int]]  # bucket -> (n_rows, checksum)
+
+BUCKET = "bucket"
+CHECKSUM_SCHEMA = {
+    BUCKET: pl.Utf8,
+    "n_rows": pl.Int64,
+    "checksum": pl.Int64,
+}
+
+
+def merge_checksums(checksums: T_CHECKSUMS, other: T_CHECKSUMS):
+    """
+    Merge the ``other`` checksums into ``checksums`` in place.
+    """
+    for bucket, (n_rows, checksum) in other.items():
+        n_rows_, checksum_ = checksums.get(bucket, (0, 0))
+        checksums[bucket] = (n_rows + n_rows_, checksum ^ checksum_)
+
+
+def to_checksum_df(checksums: T_CHECKSUMS) -> pl.DataFrame:
+    return pl.DataFrame(
+        [
+            {BUCKET: bucket, "n_rows": n_rows, "checksum": checksum}
+            for bucket, (n_rows, checksum) in checksums.items()
+        ],
+        schema=CHECKSUM_SCHEMA,
+    )
+
+
+def find_mismatch_buckets(
+    df_source_checksums: pl.DataFrame,
+    df_hudi_checksums: pl.DataFrame,
+) -> T.List[str]:
+    df = df_source_checksums.join(
+        df_hudi_checksums,
+        on=BUCKET,
+        how="outer",
+        suffix=HUDI_SUFFIX,
+    ).filter(_is_different("n_rows") | _is_different("checksum"))
+    return sorted(df[BUCKET].to_list())
+
+
+@dataclasses.dataclass
+class ChecksumSpill:
+    """
+    Spill the source batches with their checksum bucket into a local folder,
+    one parquet file per batch, ``${dir_root}/${uuid}.parquet``. It is thread
+    safe, the batches can be written from many threads.
+
+    :param dir_root: the local folder.
+    """
+
+    dir_root: Path = dataclasses.field()
+
+    def write(self, records: T_RECORDS, buckets: T.List[str]):
+        if len(records) == 0:
+            return
+        df = to_df(records).with_columns(
+            pl.Series(BUCKET, buckets, dtype=pl.Utf8)
+        )
+        dir_root = Path(self.dir_root)
+        dir_root.mkdir(parents=True, exist_ok=True)
+        df.write_parquet(dir_root.joinpath(f"{uuid.uuid4().hex}.parquet"))
+
+    def read(self, buckets: T.Iterable[str]) -> pl.DataFrame:
+        """
+        Read the rows of the given buckets, only the matching rows are loaded.
+        """
+        buckets = list(buckets)
+        if len(buckets) == 0 or not any(Path(self.dir_root).glob("*.parquet")):
+            return to_df([])
+        return (
+            pl.scan_parquet(str(Path(self.dir_root).joinpath("*.parquet")))
+            .filter(pl.col(BUCKET).is_in(buckets))
+            .drop(BUCKET)
+            .collect()
+        )
+
+
+def checksum_records(
+    records: T_RECORDS,
+    bucketizer: Bucketizer,
+    checksums: T_CHECKSUMS,
+    spill: T.Optional[ChecksumSpill] = None,
+):
+    """
+    Add the records into the per bucket ``checksums`` in place, and spill them
+    with their bucket if ``spill`` is given.
+    """
+    buckets = list()
+    for row in records:
+        bucket = bucketizer.get_bucket(row)
+        n_rows, checksum = checksums.get(bucket, (0, 0))
+        checksums[bucket] = (n_rows + 1, checksum ^ row_hash(row))
+        buckets.append(bucket)
+    if spill is not None:
+        spill.write(records, buckets)
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+
+"""
+The key based diff between the DynamoDB side and the Hudi side.
+
+It doesn't depend on the project config, so it can be tested without AWS.
+
+To compare a large table in bounded memory, both sides are spilled into the
+same ``n_buckets`` hash buckets of the record key on the local disk
+(:class:`BucketSpill`), then :func:`diff_by_bucket` diffs one bucket at a
+time. A key always falls into the same bucket on both sides, so the per
+bucket diffs add up to the full diff.
+"""
+
+import typing as T
+import uuid
+import functools
+import dataclasses
+from pathlib import Path
+from datetime import datetime, timezone
+
+import polars as pl
+
+
+T_RECORDS = T.List[T.Dict[str, T.Any]]
+
+KEY = "id"
+# the same as :data:`~dynamodb_to_datalake.dynamodb_table.DATE_FORMAT`
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%z"
+SCHEMA = {
+    KEY: pl.Utf8,
+    "account": pl.Utf8,
+    "create_at": pl.Utf8,
+    "update_at": pl.Utf8,
+    "entity": pl.Utf8,
+    "amount": pl.Int64,
+    "is_credit": pl.Int64,
+    "note": pl.Utf8,
+}
+COLUMNS = list(SCHEMA)
+VALUE_COLUMNS = [col for col in COLUMNS if col != KEY]
+HUDI_SUFFIX = "_hudi"
+BUCKET = "bucket"
+
+
+def make_id(account: str, create_at: str) -> str:
+    """
+    The hudi record key of the transaction.
+    """
+    return f"account:{account},create_at:{create_at}"
+
+
+def to_df(records: T_RECORDS) -> pl.DataFrame:
+    """
+    Convert hudified records into a DataFrame with the canonical schema.
+    """
+    return pl.DataFrame(records, schema=SCHEMA)
+
+
+def normalize_df(df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Select the canonical columns and cast them to the canonical data type.
+    """
+    if df.width == 0:  # empty query result doesn't have column
+        return to_df([])
+    return df.select([pl.col(col).cast(dtype) for col, dtype in SCHEMA.items()])
+
+
+def _is_different(col: str) -> pl.Expr:
+    left = pl.col(col)
+    right = pl.col(f"{col}{HUDI_SUFFIX}")
+    return (
+        pl.when(left.is_null() & right.is_null())
+        .then(False)
+        .when(left.is_null() | right.is_null())
+        .then(True)
+        .otherwise(left != right)
+    )
+
+
+@dataclasses.dataclass
+class DiffResult:
+    """
+    The key based diff result between DynamoDB and Hudi.
+
+    :param missing: rows in DynamoDB but not in Hudi.
+    :param extra: rows in Hudi but not in DynamoDB.
+    :param changed: rows in both side but the value is different, the Hudi
+        side columns are suffixed with ``_hudi``.
+    """
+
+    missing: pl.DataFrame
+    extra: pl.DataFrame
+    changed: pl.DataFrame
+
+    @property
+    def is_same(self) -> bool:
+        return (
+            self.missing.shape[0] == 0
+            and self.extra.shape[0] == 0
+            and self.changed.shape[0] == 0
+        )
+
+    @classmethod
+    def concat(cls, diff_results: T.List["DiffResult"]) -> "DiffResult":
+        if len(diff_results) == 0:
+            return diff(to_df([]), to_df([]))
+        return cls(
+            missing=pl.concat([result.missing for result in diff_results]),
+            extra=pl.concat([result.extra for result in diff_results]),
+            changed=pl.concat([result.changed for result in diff_results]),
+        )
+
+
+def diff(
+    df_dynamodb: pl.DataFrame,
+    df_hudi: pl.DataFrame,
+) -> DiffResult:
+    """
+    Key based join diff between the DynamoDB side and the Hudi side.
+    """
+    df_dynamodb = normalize_df(df_dynamodb)
+    df_hudi = normalize_df(df_hudi)
+    missing = df_dynamodb.join(df_hudi, on=KEY, how="anti")
+    extra = df_hudi.join(df_dynamodb, on=KEY, how="anti")
+    changed = df_dynamodb.join(df_hudi, on=KEY, how="inner", suffix=HUDI_SUFFIX)
+    changed = changed.filter(
+        functools.reduce(
+            lambda x, y: x | y,
+            [_is_different(col) for col in VALUE_COLUMNS],
+        )
+    )
+    return DiffResult(missing=missing, extra=extra, changed=changed)
+
+
+def print_diff_result(
+    diff_result: DiffResult,
+    n_sample: int = 10,
+):
+    for name, df in [
+        ("missing in hudi", diff_result.missing),
+        ("extra in hudi", diff_result.extra),
+        ("changed", diff_result.changed),
+    ]:
+        print(f"n rows {name}: {df.shape[0]}")
+        for row in df.head(n_sample).to_dicts():
+            print(f"  {row}")
+
+    if diff_result.is_same:
+        print("NICE! The data in dynamodb and hudi are exactly the same.")
+    else:
+        print("OPS! The data in dynamodb and hudi are not the same.")
+
+
+def watermark_to_instant(watermark: str) -> str:
+    """
+    Convert the ``update_at`` format watermark into a Hudi instant time
+    ``yyyyMMddHHmmssSSS``.
+    """
+    return (
+        datetime.strptime(watermark, DATE_FORMAT)
+        .astimezone(timezone.utc)
+        .strftime("%Y%m%d%H%M%S%f")[:17]
+    )
+
+
+def cap_watermark(watermark: str, last_processed_datetime: datetime) -> str:
+    """
+    A record changed before the watermark may not have reached Hudi yet
+    because of the pipeline lag, the incremental glue job has only loaded the
+    stream data up to the end of its last processed partition minute. Cap the
+    watermark there, so :func:`exclude_changed_after` also excludes the
+    records changed in the lag.
+
+    :param last_processed_datetime: the naive UTC datetime of
+        ``CDCTracker.last_processed_partition``.
+    """
+    loaded_until = last_processed_datetime.replace(
+        second=59,
+        microsecond=999999,
+        tzinfo=timezone.utc,
+    )
+    if datetime.strptime(watermark, DATE_FORMAT) <= loaded_until:
+        return watermark
+    return loaded_until.strftime(DATE_FORMAT)
+
+
+def exclude_changed_after(
+    df_source: pl.DataFrame,
+    df_hudi: pl.DataFrame,
+    watermark: str,
+    changed_keys: T.Optional[T.Iterable[str]] = None,
+) -> T.Tuple[pl.DataFrame, pl.DataFrame]:
+    """
+    Athena cannot time travel a Hudi table, so we exclude the records that
+    has been changed after the watermark from both side. The rest of the
+    records should be exactly the same as the point-in-time snapshot.
+
+    A record changed after the watermark is either updated in Hudi
+    (``update_at`` > watermark), or in ``changed_keys``, the keys updated or
+    deleted (tombstones) after the watermark in the dynamodb stream data. A
+    deleted record is gone from Hudi, only the tombstone tells us it has been
+    changed.
+    """
+    df_changed = df_hudi.filter(pl.col("update_at") > watermark).select(KEY)
+    if changed_keys is not None:
+        df_changed = pl.concat(
+            [
+                df_changed,
+                pl.DataFrame({KEY: list(changed_keys)}, schema={KEY: pl.Utf8}),
+            ]
+        ).unique()
+    return (
+        df_source.join(df_changed, on=KEY, how="anti"),
+        df_hudi.join(df_changed, on=KEY, how="anti"),
+    )
+
+
+@dataclasses.dataclass
+class BucketSpill:
+    """
+    Spill the DataFrame batches into per bucket parquet files in a local
+    folder, ``${dir_root}/bucket=${bucket}/${uuid}.parquet``. It is thread
+    safe, the batches can be written from many threads.
+
+    :param dir_root: the local folder.
+    :param n_buckets: number of the hash buckets of the record key.
+    """
+
+    dir_root: Path = dataclasses.field()
+    n_buckets: int = dataclasses.field(default=64)
+
+    def get_bucket_dir(self, bucket: int) -> Path:
+        return Path(self.dir_root).joinpath(f"{BUCKET}={bucket}")
+
+    def write(self, df: pl.DataFrame) -> int:
+        """
+        Split the batch by bucket and write each part to a new file.
+
+        :return: number of the rows written.
+        """
+        df = normalize_df(df)
+        if df.shape[0] == 0:
+            return 0
+        df = df.with_columns(
+            (pl.col(KEY).hash(seed=0) % self.n_buckets).alias(BUCKET)
+        )
+        for df_part in df.partition_by(BUCKET):
+            bucket = df_part[BUCKET][0]
+            dir_bucket = self.get_bucket_dir(bucket)
+            dir_bucket.mkdir(parents=True, exist_ok=True)
+            df_part.drop(BUCKET).write_parquet(
+                dir_bucket.joinpath(f"{uuid.uuid4().hex}.parquet")
+            )
+        return df.shape[0]
+
+    def write_batches(self, dfs: T.Iterable[pl.DataFrame]) -> int:
+        return sum(self.write(df) for df in dfs)
+
+    def read(self, bucket: int) -> pl.DataFrame:
+        """
+        Read all rows of a bucket.
+        """
+        path_list = sorted(self.get_bucket_dir(bucket).glob("*.parquet"))
+        if len(path_list) == 0:
+            return to_df([])
+        return pl.concat([pl.read_parquet(path) for path in path_list])
+
+
+T_PREPARE = T.Callable[
+    [pl.DataFrame, pl.DataFrame],
+    T.Tuple[pl.DataFrame, pl.DataFrame],
+]
+
+
+def diff_by_bucket(
+    spill_dynamodb: BucketSpill,
+    spill_hudi: BucketSpill,
+    prepare: T.Optional[T_PREPARE] = None,
+) -> DiffResult:
+    """
+    Diff the two sides one bucket at a time, only one bucket of each side is
+    in memory.
+
+    :param prepare: a function to filter the two sides of a bucket before the
+        diff, for example exclude the records changed after a watermark.
+    """
+    if spill_dynamodb.n_buckets != spill_hudi.n_buckets:
+        raise ValueError("the two sides must have the same number of buckets")
+    diff_results = list()
+    for bucket in range(spill_dynamodb.n_buckets):
+        df_dynamodb = spill_dynamodb.read(bucket)
+        df_hudi = spill_hudi.read(bucket)
+        if prepare is not None:
+            df_dynamodb, df_hudi = prepare(df_dynamodb, df_hudi)
+        diff_result = diff(df_dynamodb, df_hudi)
+        if diff_result.is_same is False:
+            diff_results.append(diff_result)
+    return DiffResult.concat(diff_results)
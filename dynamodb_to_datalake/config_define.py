@@ -8,6 +8,11 @@ import dataclasses
 from boto_session_manager import BotoSesManager
 
 from .compat import cached_property
+from .glue_catalog import (
+    PARTITION_GRANULARITY_LIST,
+    DEFAULT_PARTITION_GRANULARITY,
+    get_partition_fields,
+)
 
 
 @dataclasses.dataclass
@@ -17,10 +22,84 @@ class Config:
 
     :param app_name: app name, common prefix for all resources
     :param aws_profile: AWS cli profile for this project
+    :param partition_granularity: the Hudi table is partitioned by the
+        ``create_at`` year, month, day, hour or minute. The default "minute"
+        is the layout of the existing tables. Changing it on an existing table
+        conflicts with the partition path in its ``hoodie.properties`` and
+        the Glue partition projection, it requires a new initial load into a
+        new table location. "day" is recommended for a new table: Hudi
+        clustering only merges the files inside a partition, an hour or
+        minute partition is usually too small to produce a target size file,
+        and a year or month partition is only clustered after the whole year
+        or month is older than ``clustering_min_partition_age_days``.
+    :param enable_partition_projection: whether to enable Athena partition
+        projection on the Hudi table, so Athena doesn't need to enumerate
+        the partitions in Glue catalog.
+    :param enable_aggregates: whether to let the incremental glue job maintain
+        the daily per account aggregate table.
+    :param clustering_sort_columns: the Hudi clustering job rewrites the
+        table files sorted by these columns.
+    :param clustering_layout_strategy: "linear" or "z-order".
+    :param clustering_min_partition_age_days: only cluster the partitions
+        older than this, the recent partitions are still being written. The
+        age is compared at the day level at most, see ``partition_granularity``.
+    :param clustering_interval_hours: how often the clustering glue job runs.
+    :param enable_changed_columns_only: whether the dynamodb stream consumer
+        only emits the changed columns of an update, and the incremental glue
+        job applies it as a Hudi partial update. A null means "not changed",
+        a partial update cannot set a column to null.
+    :param enable_stream_compaction: whether to compact the dynamodb stream
+        consumer minute files into hourly parquet files, and let the
+        incremental glue job read the compacted files.
+    :param stream_compaction_lag_minutes: an hour is compacted when it ends
+        more than this minutes ago, it should cover the Lambda retries and the
+        stream iterator age.
+    :param stream_compaction_source_retention_minutes: the compacted minute
+        files are deleted after this, an incremental glue job may have listed
+        them before the compaction.
+    :param stream_sink_type: the output of the dynamodb stream consumer,
+        "s3_json" or "s3_parquet", see
+        :mod:`~dynamodb_to_datalake.stream_sink`.
+    :param maintenance_interval_hours: how often the table maintenance glue
+        job runs.
+    :param maintenance_cleaner_commits_retained: the cleaner keeps the file
+        versions needed by the last N commits.
+    :param maintenance_archive_min_commits: the archival keeps at least N
+        instants in the active timeline.
+    :param maintenance_archive_max_commits: the archival is triggered when the
+        active timeline has more than N instants.
+    :param maintenance_small_file_limit_mb: parquet files smaller than this
+        are merged by the maintenance job.
+    :param maintenance_target_file_size_mb: the target parquet file size.
     """
 
     app_name: str
     aws_profile: str
+    partition_granularity: str = DEFAULT_PARTITION_GRANULARITY
+    enable_partition_projection: bool = False
+    enable_aggregates: bool = False
+    clustering_sort_columns: str = "account,create_at"
+    clustering_layout_strategy: str = "linear"
+    clustering_min_partition_age_days: int = 1
+    clustering_interval_hours: int = 24
+    enable_changed_columns_only: bool = False
+    enable_stream_compaction: bool = False
+    stream_compaction_lag_minutes: int = 60
+    stream_compaction_source_retention_minutes: int = 180
+    stream_sink_type: str = "s3_json"
+    maintenance_interval_hours: int = 24
+    maintenance_cleaner_commits_retained: int = 10
+    maintenance_archive_min_commits: int = 20
+    maintenance_archive_max_commits: int = 30
+    maintenance_small_file_limit_mb: int = 100
+    maintenance_target_file_size_mb: int = 128
+
+    def __post_init__(self):
+        if self.partition_granularity not in PARTITION_GRANULARITY_LIST:
+            raise ValueError(
+                f"invalid partition_granularity {self.partition_granularity!r}, "
+                f"has to be one of {PARTITION_GRANULARITY_LIST}"
+            )
 
     @cached_property
     def bsm(self) -> BotoSesManager:
@@ -34,6 +113,13 @@ class Config:
     def aws_region(self) -> str:
         return self.bsm.aws_region
 
+    @property
+    def hudi_partition_fields(self) -> str:
+        """
+        The comma separated Hudi partition fields, the glue job parameter.
+        """
+        return ",".join(get_partition_fields(self.partition_granularity))
+
     @property
     def app_name_slug(self) -> str:
         return self.app_name.replace("_", "-")
@@ -78,10 +164,30 @@ class Config:
     def glue_table(self) -> str:
         return "transactions"
 
+    @property
+    def glue_table_daily_account_summary(self) -> str:
+        return "daily_account_summary"
+
+    @property
+    def hudi_lock_table(self) -> str:
+        """
+        The DynamoDB table of the Hudi optimistic concurrency control lock,
+        shared by all writers of the Hudi tables.
+        """
+        return f"{self.app_name_snake}-hudi_lock"
+
     @property
     def lambda_function_name_dynamodb_stream_consumer(self) -> str:
         return f"{self.app_name_snake}_dynamodb_stream_consumer"
 
+    @property
+    def sqs_queue_name_dynamodb_stream_consumer_dlq(self) -> str:
+        """
+        The on-failure destination of the dynamodb stream consumer, it keeps
+        the shard and the sequence number range of the dropped records.
+        """
+        return f"{self.app_name_snake}_dynamodb_stream_consumer_dlq"
+
     @property
     def lambda_function_name_dynamodb_export_to_s3_post_process_coordinator(
         self,
@@ -100,6 +206,14 @@ class Config:
     def glue_job_name_incremental(self) -> str:
         return f"{self.app_name_snake}_incremental"
 
+    @property
+    def glue_job_name_clustering(self) -> str:
+        return f"{self.app_name_snake}_clustering"
+
+    @property
+    def glue_job_name_maintenance(self) -> str:
+        return f"{self.app_name_snake}_maintenance"
+
     @property
     def s3_bucket_artifacts(self) -> str:
         return f"{self.aws_account_id}-{self.aws_region}-artifacts"
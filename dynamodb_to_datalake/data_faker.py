@@ -1,23 +1,36 @@
 # -*- coding: utf-8 -*-
 
 """
-This script continuously ingest data into DynamoDB table
+This script continuously ingest data into DynamoDB table. The synthetic
+DynamoDB table export is generated by
+:class:`~dynamodb_to_datalake.fake_export.FakeExportGenerator`.
 """
 
-import json
+import typing as T
 import time
 import random
+import threading
+import itertools
+import dataclasses
 from datetime import datetime, timezone
 
 from faker import Faker
-from ordered_set import OrderedSet
 import pynamodb_mate as pm
+from pynamodb.exceptions import UpdateError
 from rich import print as rprint
 
 from .config_init import config
 from .boto_ses import bsm
 from .dynamodb_table import Transaction
-from .athena import run_athena_query
+from .fake_export import get_zipf_cum_weights
+from .athena import run_athena_query, iter_hudi_table_batches
+from .faker_load import RateLimiter, LoadStats, get_percentile
+from .faker_sampling import (
+    AccountReservoir,
+    RecentTransactionCache,
+    AccountHashSample,
+    get_sample_accounts_sql,
+)
 
 fake = Faker()
 
@@ -43,8 +56,22 @@ def random_account() -> str:
     )
 
 
-def get_existing_account_set() -> OrderedSet[str]:
-    # try to read all account from Hudi table via Athena
+def get_existing_account_set(
+    use_hudi_reader: bool = False,
+    n_sample: int = 10000,
+    seed: int = 0,
+) -> AccountReservoir:
+    """
+    Sample the existing accounts, so we can simulate the update event.
+
+    :param use_hudi_reader: if True, read the account column from the Hudi
+        table on S3 directly instead of using Athena.
+    :param n_sample: the max number of accounts to keep.
+    :param seed: the same seed samples the same accounts, both readers
+        return the same sample.
+    """
+    account_set = AccountReservoir(max_size=n_sample)
+    # try to read the accounts from Hudi table via Athena
     try:
         bsm.glue_client.get_table(
             CatalogId=bsm.aws_account_id,
@@ -60,19 +87,39 @@ def get_existing_account_set() -> OrderedSet[str]:
             print(e)
             raise NotImplementedError
 
-    if table_exists:
+    if table_exists and use_hudi_reader:
+        # read the account column one base file at a time, only the sample
+        # is kept in memory
+        sample = AccountHashSample(max_size=n_sample, seed=seed)
+        for df in iter_hudi_table_batches(columns=[Transaction.account.attr_name]):
+            sample.add_many(df[Transaction.account.attr_name])
+        for account in sample.accounts:
+            account_set.add(account)
+    elif table_exists:
+        # only bring back n_sample accounts instead of all of them, the
+        # DISTINCT ... LIMIT returns whatever accounts the first splits have,
+        # order by the hash to get a uniform sample. The sql is deterministic,
+        # so the result cache still works.
         df = run_athena_query(
             database=config.glue_database,
-            sql=f"SELECT DISTINCT account FROM {config.glue_database}.{config.glue_table}",
+            sql=get_sample_accounts_sql(
+                database=config.glue_database,
+                table=config.glue_table,
+                n_sample=n_sample,
+                seed=seed,
+            ),
+            unload=True,
+            cache_tables=[config.glue_table],
         )
-        account_set = OrderedSet(df[Transaction.account.attr_name])
-    else:
-        account_set = OrderedSet()  # in memory cache of all account
+        if df.shape[0]:
+            for account in df[Transaction.account.attr_name]:
+                account_set.add(account)
     return account_set
 
 
 def new_transaction(
-    account_set: OrderedSet[str],
+    account_set: AccountReservoir,
+    cache: T.Optional[RecentTransactionCache] = None,
 ):
     """
     Simulate an event that create a new transaction.
@@ -90,28 +137,34 @@ def new_transaction(
         note=fake.sentence(),
     )
     transaction.save()
+    if cache is not None:
+        cache.put(transaction)
     return transaction
 
 
 def update_transaction_note(
-    account_set: OrderedSet[str],
+    account_set: AccountReservoir,
+    cache: T.Optional[RecentTransactionCache] = None,
 ):
     """
     Simulate an event that update an existing transaction.
+
+    It picks a recently written transaction from the cache first, it only
+    queries DynamoDB for the 3 most recent transactions of a sampled account
+    when the cache is empty or disabled.
     """
-    account = random.choice(account_set)  # choose an existing account
-
-    # get 3 most recent related transaction
-    transaction_list = list(
-        Transaction.query(
-            hash_key=account,
-            scan_index_forward=False,
-            limit=3,
+    transaction = None if cache is None else cache.pick()
+    if transaction is None:
+        account = random.choice(account_set)  # choose an existing account
+        transaction_list = list(
+            Transaction.query(
+                hash_key=account,
+                scan_index_forward=False,
+                limit=3,
+            )
         )
-    )
-
-    # randomly choose one to update
-    transaction = random.choice(transaction_list)
+        # randomly choose one to update
+        transaction = random.choice(transaction_list)
 
     now = get_utc_now()
     note = fake.sentence()
@@ -124,6 +177,8 @@ def update_transaction_note(
             Transaction.note.set(note),
         ]
     )
+    if cache is not None:
+        cache.put(transaction)
 
     return transaction
 
@@ -131,15 +186,24 @@ def update_transaction_note(
 def run_data_faker(
     sleep_millisecond: int = 10,
     verbose: bool = True,
+    n_sample_accounts: int = 10000,
+    cache_size: int = 10000,
 ):
+    """
+    :param n_sample_accounts: the size of the sampled account set that the
+        updates pick from.
+    :param cache_size: the max number of accounts in the recent transaction
+        cache, 0 means no cache, every update queries DynamoDB first.
+    """
     with bsm.awscli():  # connect to AWS
         pm.Connection()
 
-        account_set = get_existing_account_set()
+        account_set = get_existing_account_set(n_sample=n_sample_accounts)
+        cache = RecentTransactionCache(max_accounts=cache_size) if cache_size else None
 
         # create 1 initial transaction first
         # so that it's safe to call update_transaction_note()
-        new_transaction(account_set)
+        new_transaction(account_set, cache)
 
         sleep_lower = int(sleep_millisecond * 0.5)
         sleep_upper = int(sleep_millisecond * 1.5)
@@ -151,12 +215,261 @@ def run_data_faker(
             # 70% = insert, 30% = update
             if random.randint(1, 100) <= 70:
                 operation = "insert"
-                transaction = new_transaction(account_set)
+                transaction = new_transaction(account_set, cache)
             else:
                 operation = "update"
-                transaction = update_transaction_note(account_set)
+                transaction = update_transaction_note(account_set, cache)
             if verbose:
                 # format the data for logging
                 data = transaction.hudify()
                 del data["id"]
                 print(f"Simulate {ith} ith event: {operation} {data}")
+
+
+@dataclasses.dataclass
+class LoadGenerator:
+    """
+    Generate write traffic to the DynamoDB table at a target TPS with
+    multiple worker threads. The inserts are sent with ``BatchWriteItem``,
+    the updates and deletes pick from the recently inserted keys.
+
+    :param target_tps: the target number of item writes per second.
+    :param n_workers: number of the worker threads, each one has at most one
+        request in flight.
+    :param insert_ratio: the share of the inserts in the item writes.
+    :param update_ratio: the share of the updates in the item writes.
+    :param delete_ratio: the share of the deletes in the item writes.
+    :param batch_size: number of items per ``BatchWriteItem``, at most 25.
+    :param n_accounts: number of distinct accounts.
+    :param account_skew: the account of a new transaction follows a zipf
+        like distribution, 0 means uniform, the larger the more hot accounts.
+    :param n_recent_keys: the updates and deletes pick from the most recent N
+        inserted keys.
+    :param report_interval_seconds: how often to print the throughput and
+        latency.
+    :param seed: random seed.
+    """
+
+    target_tps: float = dataclasses.field(default=100)
+    n_workers: int = dataclasses.field(default=8)
+    insert_ratio: float = dataclasses.field(default=0.7)
+    update_ratio: float = dataclasses.field(default=0.25)
+    delete_ratio: float = dataclasses.field(default=0.05)
+    batch_size: int = dataclasses.field(default=25)
+    n_accounts: int = dataclasses.field(default=10000)
+    account_skew: float = dataclasses.field(default=1.0)
+    n_recent_keys: int = dataclasses.field(default=10000)
+    report_interval_seconds: float = dataclasses.field(default=5)
+    seed: T.Optional[int] = dataclasses.field(default=None)
+
+    def __post_init__(self):
+        if not (1 <= self.batch_size <= 25):
+            raise ValueError("batch_size has to be between 1 and 25!")
+        self._random = random.Random(self.seed)
+        _fake = Faker()
+        _fake.seed_instance(self.seed)
+        rnd = self._random
+        self._accounts = [
+            f"{rnd.randint(0, 999):03d}-{rnd.randint(0, 999):03d}-{rnd.randint(0, 9999):04d}"
+            for _ in range(self.n_accounts)
+        ]
+        self._cum_weights = get_zipf_cum_weights(self.n_accounts, self.account_skew)
+        self._entities = [_fake.company() for _ in range(100)]
+        self._notes = [_fake.sentence() for _ in range(1000)]
+        self._operations = ["insert", "update", "delete"]
+        # one insert operation writes batch_size items
+        self._operation_cum_weights = list(
+            itertools.accumulate(
+                [
+                    self.insert_ratio / self.batch_size,
+                    self.update_ratio,
+                    self.delete_ratio,
+                ]
+            )
+        )
+        self._recent_keys: T.List[T.Tuple[str, datetime]] = list()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.rate_limiter = RateLimiter(self.target_tps)
+        self.stats = LoadStats()
+
+    def new_transaction(self, rnd: random.Random) -> Transaction:
+        now = get_utc_now()
+        return Transaction(
+            account=rnd.choices(self._accounts, cum_weights=self._cum_weights)[0],
+            create_at=now,
+            update_at=now,
+            entity=rnd.choice(self._entities),
+            amount=rnd.randint(1, 1000),
+            is_credit=rnd.randint(0, 1),
+            note=rnd.choice(self._notes),
+        )
+
+    def add_recent_keys(self, keys: T.List[T.Tuple[str, datetime]]):
+        with self._lock:
+            self._recent_keys.extend(keys)
+            if len(self._recent_keys) > 2 * self.n_recent_keys:
+                self._recent_keys = self._recent_keys[-self.n_recent_keys :]
+
+    def pick_recent_key(
+        self,
+        rnd: random.Random,
+        remove: bool,
+    ) -> T.Optional[T.Tuple[str, datetime]]:
+        with self._lock:
+            if len(self._recent_keys) == 0:
+                return None
+            index = rnd.randrange(len(self._recent_keys))
+            if remove:
+                # swap with the last one, so the removal is O(1)
+                self._recent_keys[index], self._recent_keys[-1] = (
+                    self._recent_keys[-1],
+                    self._recent_keys[index],
+                )
+                return self._recent_keys.pop()
+            return self._recent_keys[index]
+
+    def do_insert(self, rnd: random.Random):
+        self.rate_limiter.acquire(self.batch_size)
+        # BatchWriteItem rejects duplicated keys in the same request
+        transactions = {
+            (transaction.account, transaction.create_at): transaction
+            for transaction in (
+                self.new_transaction(rnd) for _ in range(self.batch_size)
+            )
+        }
+        start = time.perf_counter()
+        with Transaction.batch_write() as batch:
+            for transaction in transactions.values():
+                batch.save(transaction)
+        self.stats.add("insert", len(transactions), time.perf_counter() - start)
+        self.add_recent_keys(list(transactions))
+
+    def do_update(self, rnd: random.Random):
+        key = self.pick_recent_key(rnd, remove=False)
+        if key is None:
+            return self.do_insert(rnd)
+        self.rate_limiter.acquire(1)
+        account, create_at = key
+        start = time.perf_counter()
+        try:
+            Transaction(hash_key=account, range_key=create_at).update(
+                actions=[
+                    Transaction.update_at.set(get_utc_now()),
+                    Transaction.note.set(rnd.choice(self._notes)),
+                ],
+                # don't create a partial item if it is deleted by another worker
+                condition=Transaction.account.exists(),
+            )
+        except UpdateError as e:
+            if e.cause_response_code == "ConditionalCheckFailedException":
+                self.stats.add_conflict(1)
+                return
+            raise
+        self.stats.add("update", 1, time.perf_counter() - start)
+
+    def do_delete(self, rnd: random.Random):
+        key = self.pick_recent_key(rnd, remove=True)
+        if key is None:
+            return self.do_insert(rnd)
+        self.rate_limiter.acquire(1)
+        account, create_at = key
+        start = time.perf_counter()
+        Transaction(hash_key=account, range_key=create_at).delete()
+        self.stats.add("delete", 1, time.perf_counter() - start)
+
+    def run_worker(self, ith: int):
+        rnd = random.Random(None if self.seed is None else self.seed + ith + 1)
+        while not self._stop.is_set():
+            operation = rnd.choices(
+                self._operations, cum_weights=self._operation_cum_weights
+            )[0]
+            try:
+                getattr(self, f"do_{operation}")(rnd)
+            except Exception as e:
+                self.stats.add_error(1)
+                print(f"worker {ith} failed to {operation}: {e!r}")
+
+    def report(self, elapsed: float, window: float, n_window: int):
+        latencies = sorted(self.stats.pop_latencies())
+        print(
+            f"{elapsed:>8.1f}s | "
+            f"tps: {n_window / window:>8.1f} (target {self.target_tps}) | "
+            f"insert: {self.stats.n_insert}, update: {self.stats.n_update}, "
+            f"delete: {self.stats.n_delete}, conflict: {self.stats.n_conflict}, "
+            f"error: {self.stats.n_error} | "
+            f"latency ms p50: {get_percentile(latencies, 0.5) * 1000:.1f}, "
+            f"p99: {get_percentile(latencies, 0.99) * 1000:.1f}, "
+            f"max: {(latencies[-1] if latencies else 0) * 1000:.1f}"
+        )
+
+    def run(
+        self,
+        duration_seconds: T.Optional[float] = None,
+    ) -> LoadStats:
+        """
+        Run the workers until the duration is reached or Ctrl + C.
+        """
+        threads = [
+            threading.Thread(target=self.run_worker, args=(ith,), daemon=True)
+            for ith in range(self.n_workers)
+        ]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        last_time, last_total = start, 0
+        try:
+            while 1:
+                time.sleep(self.report_interval_seconds)
+                now = time.monotonic()
+                n_total = self.stats.n_total
+                self.report(now - start, now - last_time, n_total - last_total)
+                last_time, last_total = now, n_total
+                if duration_seconds is not None and now - start >= duration_seconds:
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+        elapsed = time.monotonic() - start
+        print(
+            f"done, {self.stats.n_total} writes in {elapsed:.1f}s, "
+            f"average tps: {self.stats.n_total / elapsed:.1f}"
+        )
+        return self.stats
+
+
+def run_load_generator(
+    target_tps: float = 100,
+    n_workers: int = 8,
+    duration_seconds: T.Optional[float] = None,
+    insert_ratio: float = 0.7,
+    update_ratio: float = 0.25,
+    delete_ratio: float = 0.05,
+    batch_size: int = 25,
+    n_accounts: int = 10000,
+    account_skew: float = 1.0,
+    report_interval_seconds: float = 5,
+) -> LoadStats:
+    """
+    The high TPS alternative of :func:`run_data_faker`, see
+    :class:`LoadGenerator`.
+
+    :param n_workers: the botocore connection pool should fit the workers,
+        it is 10 by default.
+    """
+    with bsm.awscli():  # connect to AWS
+        pm.Connection()
+        return LoadGenerator(
+            target_tps=target_tps,
+            n_workers=n_workers,
+            insert_ratio=insert_ratio,
+            update_ratio=update_ratio,
+            delete_ratio=delete_ratio,
+            batch_size=batch_size,
+            n_accounts=n_accounts,
+            account_skew=account_skew,
+            report_interval_seconds=report_interval_seconds,
+        ).run(duration_seconds=duration_seconds)
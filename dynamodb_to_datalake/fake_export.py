@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+
+"""
+Generate a synthetic DynamoDB table export offline, see
+:class:`FakeExportGenerator`.
+
+It doesn't depend on the project config, so it can be tested without AWS.
+"""
+
+import typing as T
+import json
+import gzip
+import uuid
+import base64
+import random
+import hashlib
+import itertools
+import dataclasses
+from pathlib import Path
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+
+from faker import Faker
+
+from .compare_diff import DATE_FORMAT
+
+
+def get_utc_now():
+    return datetime.utcnow().replace(tzinfo=timezone.utc)
+
+
+EXPORT_ALPHABET = "abcdefghijklmnopqrstuvwxyz234567"
+
+
+def get_zipf_cum_weights(n: int, skew: float) -> T.List[float]:
+    """
+    The cumulative weights of a zipf like distribution, the weight of the
+    ``rank`` th value is ``1 / rank ** skew``. 0 means uniform.
+    """
+    return list(itertools.accumulate(1 / (rank**skew) for rank in range(1, n + 1)))
+
+
+def to_export_time_str(dt: datetime) -> str:
+    """
+    The ``manifest-summary.json`` time layout, for example
+    ``2023-08-01T00:00:00.000Z``.
+    """
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+@dataclasses.dataclass
+class FakeExportGenerator:
+    """
+    Generate a synthetic DynamoDB table export offline, with the same layout
+    as the ``export_table_to_point_in_time`` API in ``DYNAMODB_JSON`` format::
+
+        ${prefix}/AWSDynamoDB/${export_id}/manifest-summary.json
+        ${prefix}/AWSDynamoDB/${export_id}/manifest-files.json
+        ${prefix}/AWSDynamoDB/${export_id}/data/${random_str}.json.gz
+
+    The files are generated one by one, so the memory usage only depends on
+    the file size. The same ``seed`` generates the same data.
+
+    Ref: https://docs.aws.amazon.com/amazondynamodb/latest/developerguide/S3DataExport.Output.html
+
+    :param n_items: total number of items.
+    :param n_files: number of data files, the items are evenly distributed.
+    :param n_accounts: number of distinct accounts.
+    :param account_skew: the account follows a zipf like distribution,
+        weight = 1 / rank ** skew. 0 means uniform.
+    :param amount_range: the ``amount`` is uniformly distributed in this range.
+    :param credit_ratio: the chance of ``is_credit = 1``.
+    :param update_ratio: the chance of an item being updated after created,
+        the ``update_at`` is later than the ``create_at``.
+    :param n_entities: size of the ``entity`` value pool.
+    :param n_notes: size of the ``note`` value pool.
+    :param start: the ``create_at`` range start.
+    :param end: the ``create_at`` range end, also the export time.
+    :param table_arn: the DynamoDB table arn in the manifest.
+    :param compress_level: the gzip compression level of the data files.
+    :param seed: random seed.
+    """
+
+    n_items: int = dataclasses.field(default=10000)
+    n_files: int = dataclasses.field(default=4)
+    n_accounts: int = dataclasses.field(default=1000)
+    account_skew: float = dataclasses.field(default=0.0)
+    amount_range: T.Tuple[int, int] = dataclasses.field(default=(1, 1000))
+    credit_ratio: float = dataclasses.field(default=0.5)
+    update_ratio: float = dataclasses.field(default=0.3)
+    n_entities: int = dataclasses.field(default=100)
+    n_notes: int = dataclasses.field(default=1000)
+    start: datetime = dataclasses.field(
+        default_factory=lambda: datetime(2023, 1, 1, tzinfo=timezone.utc)
+    )
+    end: datetime = dataclasses.field(
+        default_factory=lambda: datetime(2023, 8, 1, tzinfo=timezone.utc)
+    )
+    table_arn: str = dataclasses.field(
+        default="arn:aws:dynamodb:us-east-1:111122223333:table/transactions"
+    )
+    compress_level: int = dataclasses.field(default=6)
+    seed: T.Optional[int] = dataclasses.field(default=None)
+
+    def __post_init__(self):
+        rnd = random.Random(self.seed)
+        _fake = Faker()
+        _fake.seed_instance(self.seed)
+        self._accounts = [
+            f"{rnd.randint(0, 999):03d}-{rnd.randint(0, 999):03d}-{rnd.randint(0, 9999):04d}"
+            for _ in range(self.n_accounts)
+        ]
+        self._cum_weights = get_zipf_cum_weights(self.n_accounts, self.account_skew)
+        self._entities = [_fake.company() for _ in range(self.n_entities)]
+        self._notes = [_fake.sentence() for _ in range(self.n_notes)]
+        self.export_id = "{}-{}".format(
+            int(self.end.timestamp() * 1000),
+            "".join(rnd.choices("0123456789abcdef", k=8)),
+        )
+        self.export_arn = f"{self.table_arn}/export/{self.export_id}"
+
+    def get_file_item_count(self, ith: int) -> int:
+        n, remainder = divmod(self.n_items, self.n_files)
+        return n + (1 if ith < remainder else 0)
+
+    def generate_data_file(self, ith: int) -> T.Tuple[str, bytes, int]:
+        """
+        Generate the ``ith`` data file.
+
+        :return: the file name, the gzip compressed content and the item count.
+        """
+        rnd = random.Random(None if self.seed is None else self.seed + ith + 1)
+        start_ts = self.start.timestamp()
+        span = self.end.timestamp() - start_ts
+        amount_min, amount_max = self.amount_range
+        n_items = self.get_file_item_count(ith)
+        accounts = rnd.choices(self._accounts, cum_weights=self._cum_weights, k=n_items)
+        lines = list()
+        for account in accounts:
+            create_ts = start_ts + rnd.random() * span
+            if rnd.random() < self.update_ratio:
+                update_ts = create_ts + rnd.random() * (start_ts + span - create_ts)
+            else:
+                update_ts = create_ts
+            item = {
+                "account": {"S": account},
+                "create_at": {
+                    "S": datetime.fromtimestamp(create_ts, tz=timezone.utc).strftime(
+                        DATE_FORMAT
+                    )
+                },
+                "update_at": {
+                    "S": datetime.fromtimestamp(update_ts, tz=timezone.utc).strftime(
+                        DATE_FORMAT
+                    )
+                },
+                "entity": {"S": rnd.choice(self._entities)},
+                "amount": {"N": str(rnd.randint(amount_min, amount_max))},
+                "is_credit": {"N": "1" if rnd.random() < self.credit_ratio else "0"},
+                "note": {"S": rnd.choice(self._notes)},
+            }
+            lines.append(json.dumps({"Item": item}))
+        lines.append("")
+        content = gzip.compress(
+            "\n".join(lines).encode("utf-8"),
+            compresslevel=self.compress_level,
+            mtime=0,  # reproducible md5
+        )
+        fname = "".join(rnd.choices(EXPORT_ALPHABET, k=26)) + ".json.gz"
+        return fname, content, n_items
+
+    def iter_data_files(
+        self,
+        max_workers: int = 1,
+    ) -> T.Iterable[T.Tuple[str, bytes, int]]:
+        """
+        Generate the data files in order. The generation is CPU bound, with
+        ``max_workers > 1`` the files are generated by a process pool, at most
+        ``max_workers`` files are held in memory.
+        """
+        if max_workers <= 1:
+            for ith in range(self.n_files):
+                yield self.generate_data_file(ith)
+            return
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for i in range(0, self.n_files, max_workers):
+                yield from executor.map(
+                    self.generate_data_file,
+                    range(i, min(i + max_workers, self.n_files)),
+                )
+
+    def write(
+        self,
+        write_file: T.Callable[[str, bytes], T.Any],
+        s3_bucket: str,
+        s3_prefix: str,
+        max_workers: int = 1,
+        verbose: bool = True,
+    ) -> dict:
+        """
+        Generate the export and write the files with ``write_file(key, content)``.
+
+        :return: the manifest summary data.
+        """
+        start_time = get_utc_now()
+        s3_prefix = s3_prefix.strip("/")
+        root_key = f"{s3_prefix}/" if s3_prefix else ""
+        export_root_key = f"{root_key}AWSDynamoDB/{self.export_id}"
+
+        manifest_lines = list()
+        billed_size_bytes = 0
+        for ith, (fname, content, n_items) in enumerate(
+            self.iter_data_files(max_workers=max_workers)
+        ):
+            key = f"{export_root_key}/data/{fname}"
+            write_file(key, content)
+            md5 = hashlib.md5(content)
+            manifest_lines.append(
+                json.dumps(
+                    {
+                        "itemCount": n_items,
+                        "md5Checksum": base64.b64encode(md5.digest()).decode("utf-8"),
+                        "etag": md5.hexdigest(),
+                        "dataFileS3Key": key,
+                    }
+                )
+            )
+            billed_size_bytes += len(content)
+            if verbose:
+                print(f"wrote {ith + 1}/{self.n_files} data file {key} ({n_items} items)")
+
+        manifest_files_key = f"{export_root_key}/manifest-files.json"
+        write_file(manifest_files_key, "\n".join(manifest_lines).encode("utf-8"))
+        summary = {
+            "version": "2020-06-30",
+            "exportArn": self.export_arn,
+            "startTime": to_export_time_str(start_time),
+            "endTime": to_export_time_str(get_utc_now()),
+            "tableArn": self.table_arn,
+            "tableId": str(uuid.UUID(int=random.Random(self.table_arn).getrandbits(128))),
+            "exportTime": to_export_time_str(self.end),
+            "s3Bucket": s3_bucket,
+            "s3Prefix": s3_prefix,
+            "s3SseAlgorithm": "AES256",
+            "s3SseKmsKeyId": None,
+            "manifestFilesS3Key": manifest_files_key,
+            "billedSizeBytes": billed_size_bytes,
+            "itemCount": self.n_items,
+            "outputFormat": "DYNAMODB_JSON",
+        }
+        write_file(
+            f"{export_root_key}/manifest-summary.json",
+            json.dumps(summary, indent=4).encode("utf-8"),
+        )
+        return summary
+
+    def write_to_dir(
+        self,
+        dir_root: T.Union[str, Path],
+        s3_bucket: str = "local",
+        s3_prefix: str = "",
+        max_workers: int = 1,
+        verbose: bool = True,
+    ) -> dict:
+        """
+        Write the export to a local folder, the ``dir_root`` is the bucket root.
+        """
+
+        def write_file(key: str, content: bytes):
+            path = Path(dir_root).joinpath(key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(content)
+
+        return self.write(
+            write_file, s3_bucket, s3_prefix, max_workers=max_workers, verbose=verbose
+        )
+
+    def write_to_s3(
+        self,
+        s3_client,
+        s3_bucket: str,
+        s3_prefix: str,
+        max_workers: int = 1,
+        verbose: bool = True,
+    ) -> dict:
+        """
+        Write the export to s3, it works with a moto mocked bucket too.
+        """
+
+        def write_file(key: str, content: bytes):
+            s3_client.put_object(Bucket=s3_bucket, Key=key, Body=content)
+
+        return self.write(
+            write_file, s3_bucket, s3_prefix, max_workers=max_workers, verbose=verbose
+        )
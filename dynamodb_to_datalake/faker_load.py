@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""
+The pacing and the statistics of the DynamoDB load generator, see
+:class:`~dynamodb_to_datalake.data_faker.LoadGenerator`.
+
+It doesn't depend on the project config, so it can be tested without AWS.
+"""
+
+import typing as T
+import time
+import threading
+import dataclasses
+
+
+class RateLimiter:
+    """
+    A thread safe pacer, the permits are spread evenly at ``rate`` per second
+    across all the threads.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, n: int = 1):
+        with self._lock:
+            now = time.monotonic()
+            # don't accumulate the unused permits when the workers fall behind
+            start = max(self._next, now)
+            self._next = start + n * self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+@dataclasses.dataclass
+class LoadStats:
+    """
+    Thread safe counters of the load generator. The latencies are kept for
+    the current report window only.
+
+    The ``n_conflict`` counts the conditional updates rejected because the
+    item was deleted by another worker, it is expected under load and not an
+    error.
+    """
+
+    n_insert: int = dataclasses.field(default=0)
+    n_update: int = dataclasses.field(default=0)
+    n_delete: int = dataclasses.field(default=0)
+    n_conflict: int = dataclasses.field(default=0)
+    n_error: int = dataclasses.field(default=0)
+    latencies: T.List[float] = dataclasses.field(default_factory=list)
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+
+    def add(self, operation: str, n: int, latency: float):
+        with self._lock:
+            setattr(self, f"n_{operation}", getattr(self, f"n_{operation}") + n)
+            self.latencies.append(latency)
+
+    def add_conflict(self, n: int):
+        with self._lock:
+            self.n_conflict += n
+
+    def add_error(self, n: int):
+        with self._lock:
+            self.n_error += n
+
+    @property
+    def n_total(self) -> int:
+        return self.n_insert + self.n_update + self.n_delete
+
+    def pop_latencies(self) -> T.List[float]:
+        with self._lock:
+            latencies, self.latencies = self.latencies, list()
+        return latencies
+
+
+def get_percentile(sorted_values: T.List[float], p: float) -> float:
+    """
+    The nearest rank percentile of the sorted values, 0.0 if empty.
+    """
+    if len(sorted_values) == 0:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+"""
+The account samples and the recent transaction cache of the data faker.
+
+It doesn't depend on the project config, so it can be tested without AWS.
+The updates pick from the :class:`RecentTransactionCache` first, it is the
+accounts written by this run, they don't need a DynamoDB query. The
+:class:`AccountReservoir` is the fallback, it is seeded with the existing
+accounts sampled from the Hudi table by :class:`AccountHashSample` or the
+equivalent Athena SQL :func:`get_sample_accounts_sql`.
+"""
+
+import typing as T
+import heapq
+import random
+import hashlib
+from collections import OrderedDict
+
+
+class AccountReservoir:
+    """
+    A fixed size uniform random sample of all the accounts seen so far
+    (reservoir sampling, algorithm R). It supports ``len()`` and indexing,
+    so ``random.choice`` works on it. The accounts are expected to be
+    distinct, an account already in the sample is ignored.
+
+    :param max_size: the sample size.
+    :param rnd: the random generator, default is the ``random`` module.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        rnd: T.Optional[random.Random] = None,
+    ):
+        self.max_size = max_size
+        self.n_seen = 0
+        self._random = random if rnd is None else rnd
+        self._accounts: T.List[str] = list()
+        self._account_set: T.Set[str] = set()
+
+    def add(self, account: str):
+        if account in self._account_set:
+            return
+        self.n_seen += 1
+        if len(self._accounts) < self.max_size:
+            self._accounts.append(account)
+            self._account_set.add(account)
+        else:
+            index = self._random.randrange(self.n_seen)
+            if index < self.max_size:
+                self._account_set.remove(self._accounts[index])
+                self._accounts[index] = account
+                self._account_set.add(account)
+
+    def __len__(self) -> int:
+        return len(self._accounts)
+
+    def __getitem__(self, index: int) -> str:
+        return self._accounts[index]
+
+    def __contains__(self, account: str) -> bool:
+        return account in self._account_set
+
+
+class RecentTransactionCache:
+    """
+    A bounded LRU cache of the recently written transactions. It keeps the
+    ``n_per_account`` most recent transactions of the ``max_accounts`` most
+    recently written accounts. A transaction is anything with the ``account``
+    and ``create_at`` attributes.
+
+    :meth:`pick` returns a random cached transaction in O(1), the accounts
+    are also kept in a list, an evicted account is swapped with the last one.
+    """
+
+    def __init__(
+        self,
+        max_accounts: int = 10000,
+        n_per_account: int = 3,
+    ):
+        self.max_accounts = max_accounts
+        self.n_per_account = n_per_account
+        self._data: T.OrderedDict[str, T.List[T.Any]] = OrderedDict()
+        self._accounts: T.List[str] = list()
+        self._account_index: T.Dict[str, int] = dict()
+
+    def _remove_account(self, account: str):
+        index = self._account_index.pop(account)
+        last = self._accounts.pop()
+        if last != account:
+            self._accounts[index] = last
+            self._account_index[last] = index
+
+    def put(self, transaction):
+        account = transaction.account
+        transaction_list = self._data.pop(account, None)
+        if transaction_list is None:
+            transaction_list = list()
+            self._account_index[account] = len(self._accounts)
+            self._accounts.append(account)
+        transaction_list = [
+            t for t in transaction_list if t.create_at != transaction.create_at
+        ]
+        transaction_list.append(transaction)
+        self._data[account] = transaction_list[-self.n_per_account :]
+        if len(self._data) > self.max_accounts:
+            evicted, _ = self._data.popitem(last=False)
+            self._remove_account(evicted)
+
+    def get(self, account: str) -> T.List[T.Any]:
+        return self._data.get(account, [])
+
+    def pick(self, rnd: T.Optional[random.Random] = None) -> T.Optional[T.Any]:
+        """
+        Pick a random cached transaction, None if the cache is empty.
+        """
+        if len(self._accounts) == 0:
+            return None
+        rnd = random if rnd is None else rnd
+        account = self._accounts[rnd.randrange(len(self._accounts))]
+        return rnd.choice(self._data[account])
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def get_account_hash(account: str, seed: int = 0) -> bytes:
+    """
+    It is equivalent to the ``ORDER BY`` key of :func:`get_sample_accounts_sql`.
+    """
+    return hashlib.md5(f"{seed}:{account}".encode("utf-8")).digest()
+
+
+class AccountHashSample:
+    """
+    A uniform sample of the distinct accounts, it keeps the ``max_size``
+    accounts with the smallest hash (bottom-k sampling). Unlike the reservoir,
+    an account repeated in the input doesn't change the chance, so it can
+    read the account column of the table batch by batch, only the sample is
+    in memory.
+
+    :param max_size: the sample size.
+    :param seed: the same seed selects the same accounts.
+    """
+
+    def __init__(self, max_size: int = 10000, seed: int = 0):
+        self.max_size = max_size
+        self.seed = seed
+        # min heap of (complemented hash, account), the root is the largest hash
+        self._heap: T.List[T.Tuple[bytes, str]] = list()
+        self._account_set: T.Set[str] = set()
+
+    def add(self, account: str):
+        if account in self._account_set:
+            return
+        key = bytes(255 - b for b in get_account_hash(account, self.seed))
+        if len(self._heap) < self.max_size:
+            heapq.heappush(self._heap, (key, account))
+            self._account_set.add(account)
+        elif key > self._heap[0][0]:
+            _, evicted = heapq.heapreplace(self._heap, (key, account))
+            self._account_set.remove(evicted)
+            self._account_set.add(account)
+
+    def add_many(self, accounts: T.Iterable[str]):
+        for account in accounts:
+            self.add(account)
+
+    @property
+    def accounts(self) -> T.List[str]:
+        """
+        The sampled accounts, ordered by hash.
+        """
+        return [account for _, account in sorted(self._heap, reverse=True)]
+
+
+def get_sample_accounts_sql(
+    database: str,
+    table: str,
+    n_sample: int,
+    seed: int = 0,
+) -> str:
+    """
+    The Athena SQL of :class:`AccountHashSample`, it returns the same accounts
+    in the same order. Athena only keeps the top ``n_sample`` rows while
+    scanning the account column, the result size doesn't depend on the table.
+    """
+    return (
+        f"SELECT account FROM "
+        f"(SELECT DISTINCT account FROM {database}.{table}) "
+        f"ORDER BY md5(to_utf8(concat('{seed}:', account))) "
+        f"LIMIT {n_sample}"
+    )
@@ -105,3 +105,144 @@ def get_glue_database_console_url(
         f"https://{aws_region}.console.aws.amazon.com"
         f"/glue/home?region={aws_region}#/v2/data-catalog/databases/view/{database}"
     )
+
+
+# Hudi partition fields, partition value and the projection range
+PARTITION_PROJECTION_SPECS = [
+    ("create_year", "2020,2099", 4),
+    ("create_month", "1,12", 2),
+    ("create_day", "1,31", 2),
+    ("create_hour", "0,23", 2),
+    ("create_minute", "0,59", 2),
+]
+HUDI_PARTITION_FIELDS = [field for field, _, _ in PARTITION_PROJECTION_SPECS]
+# the finest partition field of each granularity
+PARTITION_GRANULARITY_LIST = ["year", "month", "day", "hour", "minute"]
+# the partitions of the existing tables, the hudi partition path of a table
+# cannot change without a new initial load
+DEFAULT_PARTITION_GRANULARITY = "minute"
+# minute level partitions are too many for Athena to project and too small for
+# Hudi to cluster, use the daily partitions for a new table
+RECOMMENDED_PARTITION_GRANULARITY = "day"
+
+
+def get_partition_fields(granularity: str) -> T.List[str]:
+    """
+    Get the Hudi partition fields of the granularity, example: ``"day"`` ->
+    ``["create_year", "create_month", "create_day"]``.
+    """
+    if granularity not in PARTITION_GRANULARITY_LIST:
+        raise ValueError(f"invalid partition granularity: {granularity!r}")
+    return HUDI_PARTITION_FIELDS[: PARTITION_GRANULARITY_LIST.index(granularity) + 1]
+
+
+# the keys in get_table response that are allowed in update_table TableInput
+_TABLE_INPUT_KEYS = [
+    "Name",
+    "Description",
+    "Owner",
+    "LastAccessTime",
+    "LastAnalyzedTime",
+    "Retention",
+    "StorageDescriptor",
+    "PartitionKeys",
+    "ViewOriginalText",
+    "ViewExpandedText",
+    "TableType",
+    "Parameters",
+    "TargetTable",
+]
+
+
+def get_partition_projection_parameters(
+    s3uri_table: str,
+    partition_fields: T.Optional[T.List[str]] = None,
+    year_range: T.Optional[str] = None,
+) -> T.Dict[str, str]:
+    """
+    Get the Glue table parameters to enable Athena partition projection on
+    the hive style ``create_year=.../create_month=.../...`` partitions.
+
+    Ref: https://docs.aws.amazon.com/athena/latest/ug/partition-projection.html
+
+    :param s3uri_table: the Hudi table s3 location.
+    :param partition_fields: the partition fields of the Hudi table, it has to
+        be a prefix of ``create_year, ..., create_minute``, default the
+        :data:`DEFAULT_PARTITION_GRANULARITY` fields.
+    :param year_range: the ``create_year`` range, example ``"2020,2099"``.
+    """
+    if partition_fields is None:
+        partition_fields = get_partition_fields(DEFAULT_PARTITION_GRANULARITY)
+    if partition_fields != HUDI_PARTITION_FIELDS[: len(partition_fields)]:
+        raise ValueError(f"invalid partition fields: {partition_fields}")
+    if s3uri_table.endswith("/") is False:
+        s3uri_table = s3uri_table + "/"
+    parameters = {"projection.enabled": "true"}
+    for field, range_, digits in PARTITION_PROJECTION_SPECS[: len(partition_fields)]:
+        if field == "create_year" and year_range is not None:
+            range_ = year_range
+        parameters[f"projection.{field}.type"] = "integer"
+        parameters[f"projection.{field}.range"] = range_
+        parameters[f"projection.{field}.digits"] = str(digits)
+    template = "/".join(
+        [f"{field}=${{{field}}}" for field in partition_fields]
+    )
+    parameters["storage.location.template"] = f"{s3uri_table}{template}/"
+    return parameters
+
+
+def update_glue_table_parameters(
+    glue_client,
+    database: str,
+    table: str,
+    parameters: T.Dict[str, str],
+) -> bool:
+    """
+    Add or update the Glue table parameters. Do nothing if they are already
+    up-to-date.
+
+    :return: a boolean flag to indicate if the table is updated.
+    """
+    table_details = get_glue_table(glue_client, database, table)
+    if table_details is None:
+        return False
+    existing_parameters = table_details.get("Parameters", {})
+    if all(existing_parameters.get(k) == v for k, v in parameters.items()):
+        return False
+    table_input = {
+        key: table_details[key] for key in _TABLE_INPUT_KEYS if key in table_details
+    }
+    table_input["Parameters"] = {**existing_parameters, **parameters}
+    # ref: https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/glue/client/update_table.html
+    glue_client.update_table(
+        DatabaseName=database,
+        TableInput=table_input,
+    )
+    return True
+
+
+def ensure_partition_projection(
+    glue_client,
+    database: str,
+    table: str,
+    s3uri_table: str,
+    partition_fields: T.Optional[T.List[str]] = None,
+    year_range: T.Optional[str] = None,
+) -> bool:
+    """
+    Make sure the partition projection is enabled on the table. Hudi hive sync
+    creates the table and may alter it later, so it is safe to call this
+    after every sync.
+
+    :return: a boolean flag to indicate if the table is updated.
+    """
+    return update_glue_table_parameters(
+        glue_client=glue_client,
+        database=database,
+        table=table,
+        parameters=get_partition_projection_parameters(
+            s3uri_table=s3uri_table,
+            partition_fields=partition_fields,
+            year_range=year_range,
+        ),
+    )
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
 import typing as T
+from datetime import datetime, timezone, timedelta
+
 from pathlib_mate import Path
 
 from .config_init import config
@@ -10,14 +12,26 @@ from .s3paths import (
     s3dir_dynamodb_export_processed,
     s3dir_dynamodb_stream,
     s3dir_table,
+    s3dir_table_daily_account_summary,
     s3dir_incremental_glue_job_input,
     s3path_incremental_glue_job_tracker,
+    s3dir_maintenance_report,
+    s3dir_dynamodb_stream_compacted,
+    s3path_dynamodb_stream_compaction_manifest,
 )
 from .paths import (
+    path_glue_script_utils,
     path_glue_script_initial_load,
     path_glue_script_incremental,
+    path_glue_script_clustering,
+    path_glue_script_maintenance,
+)
+from .incremental_load_orchestration import (
+    CDCTracker,
+    PARTITION_DATETIME_FORMAT,
 )
-from .incremental_load_orchestration import CDCTracker
+from .stream_compaction import StreamCompactor
+from .glue_catalog import ensure_partition_projection
 
 
 def get_glue_job_console_url(
@@ -79,6 +93,12 @@ def create_hudi_glue_job(
         job_script.read_text(),
         content_type="text/plain",
     )
+    # upload the shared helpers, the scripts import them by --extra-py-files
+    s3path_utils = s3dir_glue_artifacts.joinpath(path_glue_script_utils.basename)
+    s3path_utils.write_text(
+        path_glue_script_utils.read_text(),
+        content_type="text/plain",
+    )
     print(f"create glue job {job_name!r} from {s3path_artifact.uri}")
     print(f"preview etl script at: {s3path_artifact.console_url}")
     console_url = get_glue_job_console_url(
@@ -105,6 +125,8 @@ def create_hudi_glue_job(
         "--spark-event-logs-path": f"s3://{config.s3_bucket_glue_assets}/sparkHistoryLogs/",
         "--TempDir": f"s3://{config.s3_bucket_glue_assets}/temporary/",
         "--CODE_ETAG": s3path_artifact.etag,
+        "--extra-py-files": s3path_utils.uri,
+        "--UTILS_CODE_ETAG": s3path_utils.etag,
     }
     default_arguments.update(additional_params)
     bsm.glue_client.create_job(
@@ -136,10 +158,26 @@ def create_initial_load_glue_job():
             "--S3URI_TABLE": s3dir_table.uri,
             "--DATABASE_NAME": config.glue_database,
             "--TABLE_NAME": config.glue_table,
+            "--PARTITION_FIELDS": config.hudi_partition_fields,
+            "--LOCK_TABLE_NAME": config.hudi_lock_table,
         },
     )
 
 
+def get_aggregate_params() -> T.Dict[str, str]:
+    """
+    Incremental glue job parameters for the daily per account aggregate table.
+    """
+    if config.enable_aggregates:
+        return {
+            "--ENABLE_AGGREGATES": "true",
+            "--S3URI_AGG_TABLE": s3dir_table_daily_account_summary.uri,
+            "--AGG_TABLE_NAME": config.glue_table_daily_account_summary,
+        }
+    else:
+        return {}
+
+
 def create_incremental_glue_job():
     create_hudi_glue_job(
         glue_client=bsm.glue_client,
@@ -151,10 +189,64 @@ def create_incremental_glue_job():
             "--S3URI_TABLE": s3dir_table.uri,
             "--DATABASE_NAME": config.glue_database,
             "--TABLE_NAME": config.glue_table,
+            "--PARTITION_FIELDS": config.hudi_partition_fields,
+            "--PARTIAL_UPDATE": str(config.enable_changed_columns_only).lower(),
+            "--LOCK_TABLE_NAME": config.hudi_lock_table,
+            **get_aggregate_params(),
         },
     )
 
 
+def get_clustering_params() -> T.Dict[str, str]:
+    return {
+        "--S3URI_TABLE": s3dir_table.uri,
+        "--DATABASE_NAME": config.glue_database,
+        "--TABLE_NAME": config.glue_table,
+        "--SORT_COLUMNS": config.clustering_sort_columns,
+        "--LAYOUT_STRATEGY": config.clustering_layout_strategy,
+        "--MIN_PARTITION_AGE_DAYS": str(config.clustering_min_partition_age_days),
+        "--PARTITION_FIELDS": config.hudi_partition_fields,
+        "--LOCK_TABLE_NAME": config.hudi_lock_table,
+    }
+
+
+def create_clustering_glue_job():
+    create_hudi_glue_job(
+        glue_client=bsm.glue_client,
+        job_name=config.glue_job_name_clustering,
+        job_script=path_glue_script_clustering,
+        glue_role_arn=config.glue_role_arn,
+        additional_params=get_clustering_params(),
+    )
+
+
+def get_maintenance_params() -> T.Dict[str, str]:
+    return {
+        "--S3URI_TABLE": s3dir_table.uri,
+        "--S3URI_MAINTENANCE_REPORT": s3dir_maintenance_report.uri,
+        "--DATABASE_NAME": config.glue_database,
+        "--TABLE_NAME": config.glue_table,
+        "--CLEANER_COMMITS_RETAINED": str(config.maintenance_cleaner_commits_retained),
+        "--ARCHIVE_MIN_COMMITS": str(config.maintenance_archive_min_commits),
+        "--ARCHIVE_MAX_COMMITS": str(config.maintenance_archive_max_commits),
+        "--SMALL_FILE_LIMIT_MB": str(config.maintenance_small_file_limit_mb),
+        "--TARGET_FILE_SIZE_MB": str(config.maintenance_target_file_size_mb),
+        "--MIN_PARTITION_AGE_DAYS": str(config.clustering_min_partition_age_days),
+        "--PARTITION_FIELDS": config.hudi_partition_fields,
+        "--LOCK_TABLE_NAME": config.hudi_lock_table,
+    }
+
+
+def create_maintenance_glue_job():
+    create_hudi_glue_job(
+        glue_client=bsm.glue_client,
+        job_name=config.glue_job_name_maintenance,
+        job_script=path_glue_script_maintenance,
+        glue_role_arn=config.glue_role_arn,
+        additional_params=get_maintenance_params(),
+    )
+
+
 def run_initial_load_glue_job():
     print(f"run initial load glue job {config.glue_job_name_initial_load!r}")
     console_url = get_glue_job_console_url(
@@ -167,7 +259,27 @@ def run_initial_load_glue_job():
     )
 
 
+def get_last_job_run(
+    glue_client,
+    job_name: str,
+) -> T.Optional[dict]:
+    # ref: https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/glue/client/get_job_runs.html
+    res = glue_client.get_job_runs(
+        JobName=job_name,
+        MaxResults=1,
+    )
+    job_runs = res.get("JobRuns", [])
+    if len(job_runs) == 0:
+        return None
+    else:
+        return job_runs[0]
+
+
 def run_incremental_glue_job(epoch_processed_partition: str):
+    if config.enable_stream_compaction:
+        s3path_compaction_manifest = s3path_dynamodb_stream_compaction_manifest
+    else:
+        s3path_compaction_manifest = None
     tracker = CDCTracker.read(
         bsm=bsm,
         s3path_tracker=s3path_incremental_glue_job_tracker,
@@ -175,5 +287,118 @@ def run_incremental_glue_job(epoch_processed_partition: str):
         s3dir_dynamodb_stream=s3dir_dynamodb_stream,
         glue_job_name=config.glue_job_name_incremental,
         epoch_processed_partition=epoch_processed_partition,
+        s3path_compaction_manifest=s3path_compaction_manifest,
     )
     tracker.try_to_run_glue_job(bsm=bsm)
+    # hudi hive sync may create or alter the table, make sure the
+    # partition projection is still there
+    if config.enable_partition_projection:
+        if ensure_partition_projection(
+            glue_client=bsm.glue_client,
+            database=config.glue_database,
+            table=config.glue_table,
+            s3uri_table=s3dir_table.uri,
+            partition_fields=config.hudi_partition_fields.split(","),
+        ):
+            print(f"enabled partition projection on {config.glue_table!r}")
+
+
+def run_table_service_glue_job(job_name: str) -> bool:
+    """
+    Run a table service glue job.
+
+    The incremental, clustering and maintenance glue jobs may write the Hudi
+    table at the same time, the commits are serialized by the Hudi optimistic
+    concurrency control with the DynamoDB based lock
+    (``config.hudi_lock_table``). A conflicting commit fails instead of
+    corrupting the table, the incremental glue job retries the same input
+    in the next run, the table service runs again next time.
+
+    :return: a boolean flag to indicate if it runs the glue job,
+    """
+    print(f"run glue job {job_name!r}")
+    console_url = get_glue_job_console_url(
+        aws_region=config.aws_region,
+        job_name=job_name,
+    )
+    print(f"preview the job run status at: {console_url}")
+    try:
+        bsm.glue_client.start_job_run(
+            JobName=job_name,
+        )
+        return True
+    except Exception as e:
+        if "concurrent runs exceeded" in str(e).lower():
+            return False
+        else:
+            raise NotImplementedError(
+                f"didn't implement the error handling logic for exception: {e!r}"
+            )
+
+
+def is_glue_job_due(
+    glue_client,
+    job_name: str,
+    interval_hours: int,
+) -> bool:
+    """
+    Whether the last run of the glue job started more than ``interval_hours``
+    ago, or it never runs.
+    """
+    job_run = get_last_job_run(glue_client, job_name)
+    if job_run is None:
+        return True
+    next_run_at = job_run["StartedOn"] + timedelta(hours=interval_hours)
+    return datetime.now(timezone.utc) >= next_run_at
+
+
+def run_clustering_glue_job() -> bool:
+    """
+    Orchestration hook for the Hudi clustering glue job. It runs at most once
+    every ``config.clustering_interval_hours``, you can call it in the same
+    loop as :func:`run_incremental_glue_job`.
+    """
+    if not is_glue_job_due(
+        bsm.glue_client,
+        config.glue_job_name_clustering,
+        config.clustering_interval_hours,
+    ):
+        return False
+    return run_table_service_glue_job(config.glue_job_name_clustering)
+
+
+def run_maintenance_glue_job() -> bool:
+    """
+    Orchestration hook for the table maintenance glue job (clean, archival,
+    file sizing). It runs at most once every ``config.maintenance_interval_hours``,
+    you can call it in the same loop as :func:`run_incremental_glue_job`.
+    """
+    if not is_glue_job_due(
+        bsm.glue_client,
+        config.glue_job_name_maintenance,
+        config.maintenance_interval_hours,
+    ):
+        return False
+    print(f"preview the reports at: {s3dir_maintenance_report.console_url}")
+    return run_table_service_glue_job(config.glue_job_name_maintenance)
+
+
+def run_stream_compaction(epoch_processed_partition: str):
+    """
+    Orchestration hook to compact the closed hours of the dynamodb stream
+    data, you can call it in the same loop as :func:`run_incremental_glue_job`.
+    """
+    if config.enable_stream_compaction is False:
+        return
+    compactor = StreamCompactor(
+        s3dir_dynamodb_stream=s3dir_dynamodb_stream,
+        s3dir_compacted=s3dir_dynamodb_stream_compacted,
+        s3path_manifest=s3path_dynamodb_stream_compaction_manifest,
+        epoch_hour=datetime.strptime(
+            epoch_processed_partition,
+            PARTITION_DATETIME_FORMAT,
+        ),
+        lag_minutes=config.stream_compaction_lag_minutes,
+        source_retention_minutes=config.stream_compaction_source_retention_minutes,
+    )
+    compactor.run(bsm=bsm)
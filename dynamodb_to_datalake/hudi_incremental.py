@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+"""
+Hudi incremental query API for the downstream consumers of the Hudi table,
+the consumer and its checkpoint are in
+:mod:`~dynamodb_to_datalake.incremental_consumer`.
+
+[CN]
+
+下游的消费者不需要每次都扫描全表来找出变化的数据. 每个消费者都有一个自己的
+checkpoint (上一次读到的 Hudi commit instant), 每次只读取这个 instant 之后的
+commit 所写入的数据, 处理成功后再将 checkpoint 向前推进.
+"""
+
+import typing as T
+import textwrap
+
+import polars as pl
+
+from .config_init import config
+from .boto_ses import bsm
+from .s3paths import s3dir_hudi_incremental_pull_checkpoint
+from .athena import run_athena_query, get_hudi_table_reader
+from .hudi_reader import COMMIT_TIME_FIELD
+from .incremental_consumer import IncrementalConsumer
+
+
+def read_incremental_via_athena(
+    begin_instant: str,
+    end_instant: str,
+    columns: T.Optional[T.List[str]] = None,
+) -> pl.DataFrame:
+    """
+    Read the latest version of the records written by the commits in
+    ``(begin_instant, end_instant]`` via Athena.
+
+    ``_hoodie_commit_time`` is not a partition column, Athena cannot prune
+    by it, so every pull scans (and bills) the whole table no matter how few
+    records changed. Use it only for small tables or rare pulls, the default
+    direct reader only reads the file slices written in the range.
+    """
+    if columns is None:
+        select = "*"
+    else:
+        select = ", ".join(columns)
+    return run_athena_query(
+        database=config.glue_database,
+        sql=textwrap.dedent(f"""
+        SELECT {select}
+        FROM {config.glue_database}.{config.glue_table}
+        WHERE {COMMIT_TIME_FIELD} > '{begin_instant}'
+            AND {COMMIT_TIME_FIELD} <= '{end_instant}'
+        """),
+        verbose=False,
+        unload=True,
+    )
+
+
+def pull_incremental(
+    consumer_id: str,
+    callback: T.Callable[[pl.DataFrame], T.Any],
+    columns: T.Optional[T.List[str]] = None,
+    use_athena: bool = False,
+    with_tombstones: bool = True,
+) -> str:
+    """
+    Pull the records written since the consumer's last pull, and process
+    them with the ``callback`` function. The checkpoint is advanced only if
+    the callback succeeded.
+
+    The deleted records are passed to the callback as tombstone rows, see
+    :meth:`~dynamodb_to_datalake.incremental_consumer.IncrementalConsumer.pull`.
+
+    :return: the consumer's new checkpoint instant.
+    """
+    consumer = IncrementalConsumer.read(
+        bsm=bsm,
+        consumer_id=consumer_id,
+        s3dir_checkpoint=s3dir_hudi_incremental_pull_checkpoint,
+    )
+    df, end_instant = consumer.pull(
+        reader=get_hudi_table_reader(),
+        columns=columns,
+        athena_reader=read_incremental_via_athena if use_athena else None,
+        with_tombstones=with_tombstones,
+    )
+    if end_instant == consumer.last_pulled_instant:
+        print(f"consumer {consumer_id!r} is up to date at {end_instant!r}")
+        return end_instant
+    print(
+        f"consumer {consumer_id!r} pulled {df.shape[0]} records in "
+        f"({consumer.last_pulled_instant!r}, {end_instant!r}]"
+    )
+    callback(df)
+    consumer.commit(bsm=bsm, end_instant=end_instant)
+    return end_instant
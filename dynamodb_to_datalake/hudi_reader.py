@@ -0,0 +1,546 @@
+# -*- coding: utf-8 -*-
+
+"""
+A minimal copy-on-write Hudi table snapshot reader, it reads the table
+directly from the storage without Athena or Spark.
+
+It resolves the latest committed file slice of each file group from the
+``.hoodie`` timeline, then reads the parquet base files with pyarrow. It works
+with any fsspec filesystem, for example ``s3fs`` for S3 or the local
+filesystem for testing.
+
+Ref:
+
+- Hudi timeline: https://hudi.apache.org/docs/timeline
+- Hudi file layouts: https://hudi.apache.org/docs/file_layouts
+
+Usage:
+
+.. code-block:: python
+
+    reader = HudiSnapshotReader(table_path="s3://bucket/table/", fs=s3fs.S3FileSystem())
+    table = reader.read(
+        columns=["id", "account"],
+        partition_filter={"create_year": "2023", "create_month": "08"},
+    )
+"""
+
+import typing as T
+import json
+import dataclasses
+from concurrent.futures import ThreadPoolExecutor
+
+import fsspec
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from .compat import cached_property
+
+
+HOODIE_FOLDER = ".hoodie"
+HOODIE_PROPERTIES = "hoodie.properties"
+PARTITION_METADATA = ".hoodie_partition_metadata"
+BASE_FILE_EXTENSION = ".parquet"
+COMMIT_TIME_FIELD = "_hoodie_commit_time"
+RECORD_KEY_FIELD = "_hoodie_record_key"
+
+
+class InstantStateEnum:
+    REQUESTED = "requested"
+    INFLIGHT = "inflight"
+    COMPLETED = "completed"
+
+
+class ActionEnum:
+    COMMIT = "commit"
+    DELTA_COMMIT = "deltacommit"
+    REPLACE_COMMIT = "replacecommit"
+    CLEAN = "clean"
+    ROLLBACK = "rollback"
+    SAVEPOINT = "savepoint"
+    RESTORE = "restore"
+    COMPACTION = "compaction"
+
+
+WRITE_ACTIONS = [ActionEnum.COMMIT, ActionEnum.REPLACE_COMMIT]
+
+T_PARTITION_VALUES = T.Dict[str, str]
+T_PARTITION_FILTER = T.Union[
+    T_PARTITION_VALUES,
+    T.Callable[[T_PARTITION_VALUES], bool],
+]
+
+
+@dataclasses.dataclass
+class Instant:
+    """
+    A Hudi timeline instant, parsed from the file name in ``.hoodie`` folder.
+    Examples: ``20230801000000000.commit``, ``20230801000000000.inflight``,
+    ``20230801000000000.replacecommit.requested``.
+    """
+
+    timestamp: str
+    action: str
+    state: str
+    filename: str
+
+    @classmethod
+    def from_filename(cls, filename: str) -> T.Optional["Instant"]:
+        parts = filename.split(".")
+        if parts[0].isdigit() is False:
+            return None
+        if len(parts) == 2:
+            if parts[1] == InstantStateEnum.INFLIGHT:  # commit inflight
+                return cls(
+                    timestamp=parts[0],
+                    action=ActionEnum.COMMIT,
+                    state=InstantStateEnum.INFLIGHT,
+                    filename=filename,
+                )
+            return cls(
+                timestamp=parts[0],
+                action=parts[1],
+                state=InstantStateEnum.COMPLETED,
+                filename=filename,
+            )
+        elif len(parts) == 3:
+            return cls(
+                timestamp=parts[0],
+                action=parts[1],
+                state=parts[2],
+                filename=filename,
+            )
+        else:
+            return None
+
+    @property
+    def is_completed(self) -> bool:
+        return self.state == InstantStateEnum.COMPLETED
+
+
+@dataclasses.dataclass
+class BaseFile:
+    """
+    A parquet base file, the file name is
+    ``${file_id}_${write_token}_${instant_time}.parquet``.
+    """
+
+    path: str
+    partition: str
+    file_id: str
+    instant_time: str
+
+    @classmethod
+    def from_path(cls, path: str, partition: str) -> T.Optional["BaseFile"]:
+        """
+        :return: None if it is not a base file, for example the
+            ``.hoodie_partition_metadata.parquet`` written when
+            ``hoodie.partition.metafile.use.base.format`` is true.
+        """
+        filename = path.rsplit("/", 1)[-1]
+        if filename.startswith(PARTITION_METADATA):
+            return None
+        if filename.endswith(BASE_FILE_EXTENSION) is False:
+            return None
+        parts = filename[: -len(BASE_FILE_EXTENSION)].split("_")
+        if len(parts) != 3:
+            return None
+        file_id, _, instant_time = parts
+        return cls(
+            path=path,
+            partition=partition,
+            file_id=file_id,
+            instant_time=instant_time,
+        )
+
+
+def parse_partition(partition: str) -> T_PARTITION_VALUES:
+    """
+    Parse hive style partition path into dict. Example::
+
+        >>> parse_partition("create_year=2023/create_month=08")
+        {'create_year': '2023', 'create_month': '08'}
+    """
+    values = dict()
+    for part in partition.split("/"):
+        if "=" in part:
+            key, value = part.split("=", 1)
+            values[key] = value
+    return values
+
+
+def _concat_tables(tables: T.List[pa.Table]) -> pa.Table:
+    try:
+        return pa.concat_tables(tables, promote_options="default")
+    except TypeError:  # pragma: no cover, pyarrow < 14.0.0
+        return pa.concat_tables(tables, promote=True)
+
+
+@dataclasses.dataclass
+class HudiSnapshotReader:
+    """
+    Copy-on-write Hudi table snapshot reader.
+
+    :param table_path: the Hudi table base path, without the protocol prefix
+        for non local filesystem is fine as well.
+    :param fs: the fsspec filesystem, default is the local filesystem.
+    :param max_workers: number of threads to read the base files.
+    """
+
+    table_path: str
+    fs: fsspec.AbstractFileSystem = dataclasses.field(
+        default_factory=lambda: fsspec.filesystem("file")
+    )
+    max_workers: int = dataclasses.field(default=16)
+
+    def __post_init__(self):
+        self.table_path = self.fs._strip_protocol(self.table_path).rstrip("/")
+
+    @property
+    def hoodie_path(self) -> str:
+        return f"{self.table_path}/{HOODIE_FOLDER}"
+
+    @cached_property
+    def properties(self) -> T.Dict[str, str]:
+        """
+        The ``.hoodie/hoodie.properties`` table config.
+        """
+        properties = dict()
+        with self.fs.open(f"{self.hoodie_path}/{HOODIE_PROPERTIES}", "r") as f:
+            for line in f.read().splitlines():
+                line = line.strip()
+                if line and not line.startswith("#") and "=" in line:
+                    key, value = line.split("=", 1)
+                    properties[key.strip()] = value.strip()
+        return properties
+
+    @property
+    def partition_fields(self) -> T.List[str]:
+        value = self.properties.get("hoodie.table.partition.fields", "")
+        return [field for field in value.split(",") if field]
+
+    def get_instants(self) -> T.List[Instant]:
+        """
+        Get all instants on the active timeline, sorted by timestamp.
+        """
+        instants = list()
+        for path in self.fs.ls(self.hoodie_path, detail=False):
+            instant = Instant.from_filename(path.rsplit("/", 1)[-1])
+            if instant is not None:
+                instants.append(instant)
+        return sorted(instants, key=lambda instant: instant.timestamp)
+
+    def get_completed_write_instants(
+        self,
+        as_of_instant: T.Optional[str] = None,
+    ) -> T.List[Instant]:
+        return [
+            instant
+            for instant in self.get_instants()
+            if instant.is_completed
+            and instant.action in WRITE_ACTIONS
+            and (as_of_instant is None or instant.timestamp <= as_of_instant)
+        ]
+
+    def get_latest_instant(self) -> T.Optional[str]:
+        """
+        Get the latest completed write instant time.
+        """
+        instants = self.get_completed_write_instants()
+        if len(instants):
+            return instants[-1].timestamp
+        return None
+
+    def _read_replaced_file_ids(self, instant: Instant) -> T.Set[T.Tuple[str, str]]:
+        with self.fs.open(f"{self.hoodie_path}/{instant.filename}", "r") as f:
+            content = f.read()
+        if not content.strip():
+            return set()
+        data = json.loads(content)
+        return {
+            (partition, file_id)
+            for partition, file_ids in data.get("partitionToReplaceFileIds", {}).items()
+            for file_id in file_ids
+        }
+
+    def _match_partition(
+        self,
+        partition: str,
+        partition_filter: T.Optional[T_PARTITION_FILTER],
+    ) -> bool:
+        if partition_filter is None:
+            return True
+        values = parse_partition(partition)
+        if callable(partition_filter):
+            return partition_filter(values)
+        return all(values.get(k) == v for k, v in partition_filter.items())
+
+    def _get_list_root(
+        self,
+        partition_filter: T.Optional[T_PARTITION_FILTER],
+    ) -> str:
+        """
+        If the leading partition fields are fixed in the partition filter, we
+        only need to list the files under that sub folder.
+        """
+        root = self.table_path
+        if isinstance(partition_filter, dict):
+            for field in self.partition_fields:
+                if field in partition_filter:
+                    root = f"{root}/{field}={partition_filter[field]}"
+                else:
+                    break
+        return root
+
+    def list_base_files(
+        self,
+        partition_filter: T.Optional[T_PARTITION_FILTER] = None,
+    ) -> T.List[BaseFile]:
+        """
+        List all parquet base files in the matched partitions.
+        """
+        root = self._get_list_root(partition_filter)
+        if self.fs.exists(root) is False:
+            return []
+        base_files = list()
+        for path in self.fs.find(root):
+            relpath = path[len(self.table_path) + 1 :]
+            if relpath.startswith(HOODIE_FOLDER):
+                continue
+            partition = relpath.rsplit("/", 1)[0] if "/" in relpath else ""
+            base_file = BaseFile.from_path(path, partition)
+            if base_file is None:
+                continue
+            if self._match_partition(partition, partition_filter):
+                base_files.append(base_file)
+        return base_files
+
+    def get_latest_base_files(
+        self,
+        partition_filter: T.Optional[T_PARTITION_FILTER] = None,
+        as_of_instant: T.Optional[str] = None,
+    ) -> T.List[BaseFile]:
+        """
+        Resolve the latest committed base file of each file group.
+
+        :param partition_filter: a dict of partition field values, or a function
+            that takes the partition values dict and returns a boolean.
+        :param as_of_instant: if given, time travel to this instant, only
+            commits before and at this instant are visible.
+        """
+        all_instants = self.get_instants()
+        if len(all_instants) == 0:
+            return []
+        # commits older than the active timeline are archived, they are committed
+        earliest_active = all_instants[0].timestamp
+        write_instants = self.get_completed_write_instants(as_of_instant)
+        committed = {instant.timestamp for instant in write_instants}
+        replaced = set()
+        for instant in write_instants:
+            if instant.action == ActionEnum.REPLACE_COMMIT:
+                replaced.update(self._read_replaced_file_ids(instant))
+
+        latest: T.Dict[T.Tuple[str, str], BaseFile] = dict()
+        for base_file in self.list_base_files(partition_filter):
+            instant_time = base_file.instant_time
+            if as_of_instant is not None and instant_time > as_of_instant:
+                continue
+            if instant_time not in committed and instant_time >= earliest_active:
+                continue
+            key = (base_file.partition, base_file.file_id)
+            if key in replaced:
+                continue
+            if key not in latest or latest[key].instant_time < instant_time:
+                latest[key] = base_file
+        return sorted(latest.values(), key=lambda base_file: base_file.path)
+
+    def _read_base_file(
+        self,
+        base_file: BaseFile,
+        columns: T.Optional[T.List[str]],
+    ) -> pa.Table:
+        with self.fs.open(base_file.path, "rb") as f:
+            return pq.read_table(f, columns=columns)
+
+    def read(
+        self,
+        columns: T.Optional[T.List[str]] = None,
+        partition_filter: T.Optional[T_PARTITION_FILTER] = None,
+        as_of_instant: T.Optional[str] = None,
+    ) -> pa.Table:
+        """
+        Read the snapshot of the table as a pyarrow Table.
+
+        :param columns: only read these columns, default all columns.
+        """
+        base_files = self.get_latest_base_files(
+            partition_filter=partition_filter,
+            as_of_instant=as_of_instant,
+        )
+        if len(base_files) == 0:
+            return pa.table({})
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            tables = list(
+                executor.map(
+                    lambda base_file: self._read_base_file(base_file, columns),
+                    base_files,
+                )
+            )
+        return _concat_tables(tables)
+
+    def _count_base_file(self, base_file: BaseFile) -> int:
+        with self.fs.open(base_file.path, "rb") as f:
+            return pq.ParquetFile(f).metadata.num_rows
+
+    def count(
+        self,
+        partition_filter: T.Optional[T_PARTITION_FILTER] = None,
+        as_of_instant: T.Optional[str] = None,
+    ) -> int:
+        """
+        Count the rows of the snapshot from the parquet footers, the data
+        pages are not read.
+        """
+        base_files = self.get_latest_base_files(
+            partition_filter=partition_filter,
+            as_of_instant=as_of_instant,
+        )
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return sum(executor.map(self._count_base_file, base_files))
+
+    def iter_batches(
+        self,
+        columns: T.Optional[T.List[str]] = None,
+        partition_filter: T.Optional[T_PARTITION_FILTER] = None,
+        as_of_instant: T.Optional[str] = None,
+    ) -> T.Iterable[pa.Table]:
+        """
+        Read the snapshot of the table one base file at a time, so the caller
+        doesn't need to hold the whole table in memory. The base files are
+        read ahead in threads.
+        """
+        base_files = self.get_latest_base_files(
+            partition_filter=partition_filter,
+            as_of_instant=as_of_instant,
+        )
+        for i in range(0, len(base_files), self.max_workers):
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                yield from executor.map(
+                    lambda base_file: self._read_base_file(base_file, columns),
+                    base_files[i : i + self.max_workers],
+                )
+
+    def read_incremental(
+        self,
+        begin_instant: str,
+        end_instant: T.Optional[str] = None,
+        columns: T.Optional[T.List[str]] = None,
+        partition_filter: T.Optional[T_PARTITION_FILTER] = None,
+    ) -> pa.Table:
+        """
+        Hudi incremental query, read the latest version of the records that
+        are written by the commits in ``(begin_instant, end_instant]``.
+
+        Only the file slices written after ``begin_instant`` are read, then
+        the rows are filtered by the ``_hoodie_commit_time`` meta field.
+
+        :param end_instant: default is the latest completed instant.
+        """
+        if end_instant is None:
+            end_instant = self.get_latest_instant()
+            if end_instant is None:
+                return pa.table({})
+        base_files = [
+            base_file
+            for base_file in self.get_latest_base_files(
+                partition_filter=partition_filter,
+                as_of_instant=end_instant,
+            )
+            if base_file.instant_time > begin_instant
+        ]
+        if len(base_files) == 0:
+            return pa.table({})
+        read_columns = columns
+        if columns is not None and COMMIT_TIME_FIELD not in columns:
+            read_columns = [COMMIT_TIME_FIELD, *columns]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            tables = list(
+                executor.map(
+                    lambda base_file: self._read_base_file(base_file, read_columns),
+                    base_files,
+                )
+            )
+        table = _concat_tables(tables)
+        commit_time = table[COMMIT_TIME_FIELD]
+        mask = pc.and_(
+            pc.greater(commit_time, begin_instant),
+            pc.less_equal(commit_time, end_instant),
+        )
+        table = table.filter(mask)
+        if columns is not None:
+            table = table.select(columns)
+        return table
+
+    def _read_keys(
+        self,
+        base_files: T.List[BaseFile],
+        key_column: str,
+    ) -> T.Set[str]:
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            tables = executor.map(
+                lambda base_file: self._read_base_file(base_file, [key_column]),
+                base_files,
+            )
+            return {key for table in tables for key in table[key_column].to_pylist()}
+
+    def read_deleted_keys(
+        self,
+        begin_instant: str,
+        end_instant: T.Optional[str] = None,
+        partition_filter: T.Optional[T_PARTITION_FILTER] = None,
+        key_column: str = RECORD_KEY_FIELD,
+    ) -> T.List[str]:
+        """
+        Find the record keys deleted by the commits in
+        ``(begin_instant, end_instant]``. A deleted record is simply gone from
+        the latest file slice, so we compare the record keys of the partitions
+        written in the range, as of ``begin_instant`` and as of
+        ``end_instant``. Only the key column is read.
+
+        The file slices as of ``begin_instant`` must not be cleaned yet, the
+        deletes in a partition whose old file slices are cleaned are missed.
+        """
+        if end_instant is None:
+            end_instant = self.get_latest_instant()
+            if end_instant is None:
+                return []
+        new_base_files = self.get_latest_base_files(
+            partition_filter=partition_filter,
+            as_of_instant=end_instant,
+        )
+        partitions = {
+            base_file.partition
+            for base_file in new_base_files
+            if base_file.instant_time > begin_instant
+        }
+        if len(partitions) == 0:
+            return []
+        old_base_files = [
+            base_file
+            for base_file in self.get_latest_base_files(
+                partition_filter=partition_filter,
+                as_of_instant=begin_instant,
+            )
+            if base_file.partition in partitions
+        ]
+        if len(old_base_files) == 0:
+            return []
+        new_base_files = [
+            base_file
+            for base_file in new_base_files
+            if base_file.partition in partitions
+        ]
+        old_keys = self._read_keys(old_base_files, key_column)
+        new_keys = self._read_keys(new_base_files, key_column)
+        return sorted(old_keys.difference(new_keys))
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+"""
+Incremental, windowed reconciliation between DynamoDB and Hudi, the diff
+logic and the checkpoint are in
+:mod:`~dynamodb_to_datalake.incremental_compare_diff`.
+
+[CN]
+
+这个模块只验证上一次验证过的 checkpoint 之后发生变化的数据. 数据源是 DynamoDB
+Stream Consumer 写入 S3 的增量数据, 然后到 Hudi 表中查询这些 key 对应的数据进行
+对比. 验证通过后将 checkpoint 向前推进. 这样验证的成本只和数据的变化量有关,
+而和表的大小无关.
+"""
+
+import typing as T
+import textwrap
+
+import polars as pl
+
+from .config_init import config
+from .boto_ses import bsm
+from .s3paths import (
+    s3dir_dynamodb_stream,
+    s3dir_incremental_glue_job_input,
+    s3path_incremental_glue_job_tracker,
+    s3path_incremental_compare_tracker,
+    s3path_dynamodb_stream_compaction_manifest,
+)
+from .athena import run_athena_queries
+from .incremental_load_orchestration import CDCTracker
+from .compare_diff import (
+    KEY,
+    COLUMNS,
+    DiffResult,
+    to_df,
+    normalize_df,
+)
+from .incremental_compare_diff import CompareTracker
+
+
+def read_from_hudi_table_by_ids(
+    ids: T.List[str],
+    chunk_size: int = 1000,
+) -> pl.DataFrame:
+    sql_list = list()
+    for i in range(0, len(ids), chunk_size):
+        in_list = ", ".join([f"'{id}'" for id in ids[i : i + chunk_size]])
+        sql_list.append(
+            textwrap.dedent(f"""
+            SELECT {", ".join(COLUMNS)}
+            FROM {config.glue_database}.{config.glue_table}
+            WHERE {KEY} IN ({in_list})
+            """)
+        )
+    if len(sql_list) == 0:
+        return to_df([])
+    dfs = run_athena_queries(
+        database=config.glue_database,
+        sql_list=sql_list,
+    )
+    return pl.concat([normalize_df(df) for df in dfs], rechunk=True)
+
+
+def run_incremental_compare(epoch_verified_partition: str) -> DiffResult:
+    """
+    Verify the changes that has been loaded into Hudi by the incremental
+    glue job since the last verified checkpoint.
+    """
+    if config.enable_stream_compaction:
+        s3path_compaction_manifest = s3path_dynamodb_stream_compaction_manifest
+    else:
+        s3path_compaction_manifest = None
+    cdc_tracker = CDCTracker.read(
+        bsm=bsm,
+        s3path_tracker=s3path_incremental_glue_job_tracker,
+        s3dir_glue_job_input=s3dir_incremental_glue_job_input,
+        s3dir_dynamodb_stream=s3dir_dynamodb_stream,
+        glue_job_name=config.glue_job_name_incremental,
+        epoch_processed_partition=epoch_verified_partition,
+        s3path_compaction_manifest=s3path_compaction_manifest,
+    )
+    compare_tracker = CompareTracker.read(
+        bsm=bsm,
+        s3path_tracker=s3path_incremental_compare_tracker,
+        s3dir_dynamodb_stream=s3dir_dynamodb_stream,
+        epoch_verified_partition=epoch_verified_partition,
+        s3path_compaction_manifest=s3path_compaction_manifest,
+    )
+    return compare_tracker.verify(
+        bsm=bsm,
+        end_partition=cdc_tracker.last_processed_partition,
+        hudi_reader=read_from_hudi_table_by_ids,
+    )
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+
+"""
+The change based diff and the checkpoint of the incremental reconciliation.
+
+It doesn't depend on the project config, so it can be tested without AWS,
+see :mod:`~dynamodb_to_datalake.incremental_compare` for the project level
+API.
+"""
+
+import typing as T
+import json
+import dataclasses
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import polars as pl
+from s3pathlib import S3Path
+from boto_session_manager import BotoSesManager
+
+from .incremental_load_orchestration import (
+    PARTITION_DATETIME_FORMAT,
+    is_update_at_in_range,
+    list_stream_files,
+)
+from .stream_compaction import read_stream_file
+from .compare_diff import (
+    KEY,
+    SCHEMA,
+    COLUMNS,
+    VALUE_COLUMNS,
+    HUDI_SUFFIX,
+    T_RECORDS,
+    DiffResult,
+    to_df,
+    normalize_df,
+    diff,
+    print_diff_result,
+    make_id,
+)
+
+
+# the tombstone flag of the REMOVE event
+IS_DELETED = "is_deleted"
+UPDATE_AT = "update_at"
+
+# (ids) -> the current Hudi rows of the ids
+T_HUDI_READER = T.Callable[[T.List[str]], pl.DataFrame]
+
+
+def read_cdc_file(s3path: S3Path, bsm: BotoSesManager) -> T_RECORDS:
+    """
+    Read one dynamodb stream consumer output file (json lines or parquet,
+    minute or hourly compacted file), add the hudi record key.
+    """
+    records = read_stream_file(s3path, bsm=bsm)
+    for record in records:
+        record[KEY] = make_id(
+            account=record["account"],
+            create_at=record["create_at"],
+        )
+    return records
+
+
+def to_changes_df(records: T_RECORDS) -> pl.DataFrame:
+    """
+    Convert the cdc records (including tombstones) into a DataFrame.
+    """
+    return pl.DataFrame(records, schema={**SCHEMA, IS_DELETED: pl.Boolean})
+
+
+def get_latest_version(df: pl.DataFrame) -> pl.DataFrame:
+    """
+    Only keep the latest version of each record. If the stream consumer only
+    emits the changed columns, a column takes its latest non null value.
+    """
+    return (
+        df.sort(UPDATE_AT)
+        .groupby(KEY, maintain_order=True)
+        .agg(
+            [pl.col(col).drop_nulls().last() for col in VALUE_COLUMNS]
+            + [pl.col(IS_DELETED).last().fill_null(False)]
+        )
+        .select(COLUMNS + [IS_DELETED])
+    )
+
+
+def diff_changes(
+    df_changes: pl.DataFrame,
+    df_hudi: pl.DataFrame,
+) -> DiffResult:
+    """
+    Compare the latest version of the changed records with the Hudi table.
+    If the Hudi side has an even newer version (changed after the window),
+    the record is skipped. The columns not in the change (partial update)
+    are not verified. The deleted record should not be in Hudi, otherwise
+    it is reported as extra.
+    """
+    df_hudi = normalize_df(df_hudi)
+    if IS_DELETED in df_changes.columns:
+        # only the tombstones have the flag
+        is_deleted = pl.col(IS_DELETED).fill_null(False)
+        df_deleted = df_changes.filter(is_deleted).select(KEY, UPDATE_AT)
+        df_changes = df_changes.filter(~is_deleted)
+        # the record is created again after it is deleted
+        df_recreated = (
+            df_hudi.join(df_deleted, on=KEY, how="inner", suffix="_deleted")
+            .filter(pl.col(UPDATE_AT) > pl.col(f"{UPDATE_AT}_deleted"))
+            .select(KEY)
+        )
+        df_hudi = df_hudi.join(df_recreated, on=KEY, how="anti")
+    df_changes = normalize_df(df_changes)
+    df_changes = (
+        df_changes.join(df_hudi, on=KEY, how="left", suffix=HUDI_SUFFIX)
+        .with_columns(
+            [
+                pl.coalesce([pl.col(col), pl.col(f"{col}{HUDI_SUFFIX}")]).alias(col)
+                for col in VALUE_COLUMNS
+            ]
+        )
+        .select(COLUMNS)
+    )
+    df_newer = (
+        df_changes.join(df_hudi, on=KEY, how="inner", suffix=HUDI_SUFFIX)
+        .filter(pl.col(f"{UPDATE_AT}{HUDI_SUFFIX}") > pl.col(UPDATE_AT))
+        .select(KEY)
+    )
+    return diff(
+        df_changes.join(df_newer, on=KEY, how="anti"),
+        df_hudi.join(df_newer, on=KEY, how="anti"),
+    )
+
+
+@dataclasses.dataclass
+class CompareTracker:
+    """
+    Incremental reconciliation checkpoint.
+
+    :param s3path_tracker: where you store the checkpoint data.
+    :param s3dir_dynamodb_stream: where you store the processed dynamodb stream data.
+    :param epoch_verified_partition: where the reconciliation starts from.
+    :param s3path_compaction_manifest: the
+        :class:`~dynamodb_to_datalake.stream_compaction.CompactionManifest`
+        location. If set, the compacted hours are read from the compacted
+        files, the same as the incremental glue job, their minute files may
+        have been deleted.
+    :param last_verified_partition: all changes before and at this partition
+        has been verified.
+    :param last_verified_at: when the last successful verification happened.
+    """
+
+    # static attributes
+    s3path_tracker: S3Path = dataclasses.field()
+    s3dir_dynamodb_stream: S3Path = dataclasses.field()
+    epoch_verified_partition: str = dataclasses.field()
+    s3path_compaction_manifest: T.Optional[S3Path] = dataclasses.field(default=None)
+
+    # dynamic attributes
+    last_verified_partition: T.Optional[str] = dataclasses.field(default=None)
+    last_verified_at: T.Optional[str] = dataclasses.field(default=None)
+
+    @classmethod
+    def read(
+        cls,
+        bsm: BotoSesManager,
+        s3path_tracker: S3Path,
+        s3dir_dynamodb_stream: S3Path,
+        epoch_verified_partition: str,
+        s3path_compaction_manifest: T.Optional[S3Path] = None,
+    ):
+        """
+        Read the tracker data from s3. If not exists, create a new one with
+        initial value.
+        """
+        if s3path_tracker.exists(bsm=bsm) is False:
+            tracker = cls(
+                s3path_tracker=s3path_tracker,
+                s3dir_dynamodb_stream=s3dir_dynamodb_stream,
+                epoch_verified_partition=epoch_verified_partition,
+                s3path_compaction_manifest=s3path_compaction_manifest,
+                last_verified_partition=epoch_verified_partition,
+            )
+            tracker.write(bsm=bsm)
+            return tracker
+        else:
+            data = json.loads(s3path_tracker.read_text(bsm=bsm))
+            return cls(
+                s3path_tracker=s3path_tracker,
+                s3dir_dynamodb_stream=s3dir_dynamodb_stream,
+                epoch_verified_partition=epoch_verified_partition,
+                s3path_compaction_manifest=s3path_compaction_manifest,
+                last_verified_partition=data["last_verified_partition"],
+                last_verified_at=data["last_verified_at"],
+            )
+
+    def write(
+        self,
+        bsm: BotoSesManager,
+    ):
+        """
+        Write the tracker data to s3.
+        """
+        self.s3path_tracker.write_text(
+            json.dumps(
+                {
+                    "last_verified_partition": self.last_verified_partition,
+                    "last_verified_at": self.last_verified_at,
+                },
+                indent=4,
+            ),
+            content_type="application/json",
+            bsm=bsm,
+        )
+
+    @property
+    def last_verified_datetime(self) -> datetime:
+        return datetime.strptime(
+            self.last_verified_partition,
+            PARTITION_DATETIME_FORMAT,
+        )
+
+    @staticmethod
+    def get_end_before_datetime(end_partition: str) -> datetime:
+        return datetime.strptime(
+            end_partition, PARTITION_DATETIME_FORMAT
+        ) + timedelta(minutes=1)
+
+    def list_cdc_files(
+        self,
+        bsm: BotoSesManager,
+        end_partition: str,
+    ) -> T.List[S3Path]:
+        """
+        List the cdc files after the last verified partition, until (and
+        include) the ``end_partition``.
+        """
+        end_before_datetime = self.get_end_before_datetime(end_partition)
+        return [
+            S3Path(s3uri)
+            for s3uri in list_stream_files(
+                bsm=bsm,
+                s3dir_dynamodb_stream=self.s3dir_dynamodb_stream,
+                start_after_datetime=self.last_verified_datetime
+                + timedelta(minutes=1),
+                end_before_datetime=end_before_datetime,
+                s3path_compaction_manifest=self.s3path_compaction_manifest,
+            )
+        ]
+
+    def verify(
+        self,
+        bsm: BotoSesManager,
+        end_partition: str,
+        hudi_reader: T_HUDI_READER,
+        max_workers: int = 16,
+    ) -> DiffResult:
+        """
+        Verify the changes between the last verified partition and the
+        ``end_partition``. Advance the checkpoint if there is no difference.
+
+        :param end_partition: usually it is the last processed partition of
+            the incremental glue job, the changes after that may not be
+            loaded into Hudi yet.
+        :param hudi_reader: read the current Hudi rows of the changed ids.
+        """
+        if end_partition <= self.last_verified_partition:
+            print(f"already verified until {self.last_verified_partition!r}")
+            return diff(to_df([]), to_df([]))
+
+        print(
+            f"verify changes in ({self.last_verified_partition!r}, "
+            f"{end_partition!r}]"
+        )
+        s3path_list = self.list_cdc_files(bsm=bsm, end_partition=end_partition)
+        print(f"found {len(s3path_list)} cdc files")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            records = [
+                record
+                for record_list in executor.map(
+                    lambda s3path: read_cdc_file(s3path, bsm=bsm),
+                    s3path_list,
+                )
+                for record in record_list
+            ]
+        # a compacted file may have the records out of the range
+        start_after_datetime = self.last_verified_datetime + timedelta(minutes=1)
+        end_before_datetime = self.get_end_before_datetime(end_partition)
+        records = [
+            record
+            for record in records
+            if is_update_at_in_range(
+                record[UPDATE_AT], start_after_datetime, end_before_datetime
+            )
+        ]
+        df_changes = get_latest_version(to_changes_df(records))
+        print(f"n changed records: {df_changes.shape[0]}")
+        df_hudi = hudi_reader(df_changes[KEY].to_list())
+        diff_result = diff_changes(df_changes, df_hudi)
+        print_diff_result(diff_result)
+
+        if diff_result.is_same:
+            self.last_verified_partition = end_partition
+            self.last_verified_at = datetime.utcnow().isoformat()
+            self.write(bsm=bsm)
+            print(f"advance checkpoint to {end_partition!r}")
+        return diff_result
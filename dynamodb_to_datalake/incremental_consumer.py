@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+"""
+The downstream consumer of the Hudi table and its incremental pull checkpoint.
+
+It doesn't depend on the project config, so it can be tested without AWS,
+see :mod:`~dynamodb_to_datalake.hudi_incremental` for the project level API.
+
+[CN]
+
+下游的消费者不需要每次都扫描全表来找出变化的数据. 每个消费者都有一个自己的
+checkpoint (上一次读到的 Hudi commit instant), 每次只读取这个 instant 之后的
+commit 所写入的数据, 处理成功后再将 checkpoint 向前推进.
+"""
+
+import typing as T
+import json
+import dataclasses
+from datetime import datetime
+
+import polars as pl
+from s3pathlib import S3Path
+from boto_session_manager import BotoSesManager
+
+from .hudi_reader import HudiSnapshotReader
+from .compare_diff import KEY
+
+# the instant before any commit, pull from here means read everything
+EPOCH_INSTANT = "00000000000000000"
+# the tombstone flag of a deleted record in the pulled data
+IS_DELETED_FIELD = "_hoodie_is_deleted"
+
+# (begin_instant, end_instant, columns) -> the changed records
+T_ATHENA_READER = T.Callable[[str, str, T.Optional[T.List[str]]], pl.DataFrame]
+
+
+def to_tombstones_df(keys: T.List[str]) -> pl.DataFrame:
+    return pl.DataFrame(
+        {KEY: keys, IS_DELETED_FIELD: [True] * len(keys)},
+        schema={KEY: pl.Utf8, IS_DELETED_FIELD: pl.Boolean},
+    )
+
+
+@dataclasses.dataclass
+class IncrementalConsumer:
+    """
+    A downstream consumer of the Hudi table and its checkpoint.
+
+    :param consumer_id: unique id of the consumer.
+    :param s3path_checkpoint: where you store the checkpoint data.
+    :param last_pulled_instant: all commits before and at this instant has
+        been consumed.
+    :param last_pulled_at: when the last successful pull happened.
+    """
+
+    # static attributes
+    consumer_id: str = dataclasses.field()
+    s3path_checkpoint: S3Path = dataclasses.field()
+
+    # dynamic attributes
+    last_pulled_instant: str = dataclasses.field(default=EPOCH_INSTANT)
+    last_pulled_at: T.Optional[str] = dataclasses.field(default=None)
+
+    @classmethod
+    def read(
+        cls,
+        bsm: BotoSesManager,
+        consumer_id: str,
+        s3dir_checkpoint: S3Path,
+    ):
+        """
+        Read the checkpoint of the consumer from s3. If not exists, the
+        consumer starts from the beginning of the table.
+        """
+        s3path_checkpoint = s3dir_checkpoint.joinpath(f"{consumer_id}.json")
+        if s3path_checkpoint.exists(bsm=bsm) is False:
+            return cls(
+                consumer_id=consumer_id,
+                s3path_checkpoint=s3path_checkpoint,
+            )
+        else:
+            data = json.loads(s3path_checkpoint.read_text(bsm=bsm))
+            return cls(
+                consumer_id=consumer_id,
+                s3path_checkpoint=s3path_checkpoint,
+                last_pulled_instant=data["last_pulled_instant"],
+                last_pulled_at=data["last_pulled_at"],
+            )
+
+    def write(
+        self,
+        bsm: BotoSesManager,
+    ):
+        """
+        Write the checkpoint data to s3.
+        """
+        self.s3path_checkpoint.write_text(
+            json.dumps(
+                {
+                    "consumer_id": self.consumer_id,
+                    "last_pulled_instant": self.last_pulled_instant,
+                    "last_pulled_at": self.last_pulled_at,
+                },
+                indent=4,
+            ),
+            content_type="application/json",
+            bsm=bsm,
+        )
+
+    def pull(
+        self,
+        reader: HudiSnapshotReader,
+        columns: T.Optional[T.List[str]] = None,
+        athena_reader: T.Optional[T_ATHENA_READER] = None,
+        with_tombstones: bool = True,
+    ) -> T.Tuple[pl.DataFrame, str]:
+        """
+        Read the records written since the last pulled instant. It doesn't
+        advance the checkpoint, call :meth:`commit` after you processed the data.
+
+        A Hudi delete removes the record from the latest file slice, the
+        incremental query itself never returns it. If ``with_tombstones``,
+        the keys deleted in the range are found by
+        :meth:`~dynamodb_to_datalake.hudi_reader.HudiSnapshotReader.read_deleted_keys`
+        and appended as tombstone rows, only ``id`` and
+        ``_hoodie_is_deleted = true`` are set. Otherwise the deletes are
+        dropped. The deletes are missed if the consumer falls behind the
+        cleaner retention.
+
+        :param reader: it is used to find the latest instant, the deleted
+            keys, and read the changed file slices if no ``athena_reader``.
+        :param athena_reader: read the changed records via Athena instead.
+            Athena cannot prune by ``_hoodie_commit_time``, it scans the whole
+            table every pull.
+        :return: the changed records and the end instant of this pull.
+        """
+        end_instant = reader.get_latest_instant()
+        if end_instant is None or end_instant <= self.last_pulled_instant:
+            return pl.DataFrame(), self.last_pulled_instant
+        if athena_reader is not None:
+            df = athena_reader(self.last_pulled_instant, end_instant, columns)
+        else:
+            df = pl.from_arrow(
+                reader.read_incremental(
+                    begin_instant=self.last_pulled_instant,
+                    end_instant=end_instant,
+                    columns=columns,
+                )
+            )
+        if with_tombstones:
+            keys = reader.read_deleted_keys(
+                begin_instant=self.last_pulled_instant,
+                end_instant=end_instant,
+            )
+            if len(keys):
+                if df.width and IS_DELETED_FIELD not in df.columns:
+                    df = df.with_columns(pl.lit(False).alias(IS_DELETED_FIELD))
+                df = pl.concat([df, to_tombstones_df(keys)], how="diagonal")
+        return df, end_instant
+
+    def commit(
+        self,
+        bsm: BotoSesManager,
+        end_instant: str,
+    ):
+        """
+        Advance the checkpoint to the ``end_instant``.
+        """
+        self.last_pulled_instant = end_instant
+        self.last_pulled_at = datetime.utcnow().isoformat()
+        self.write(bsm=bsm)
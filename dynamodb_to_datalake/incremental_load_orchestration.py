@@ -16,6 +16,8 @@ from datetime import datetime, timedelta
 from s3pathlib import S3Path
 from boto_session_manager import BotoSesManager
 
+from .stream_compaction import CompactionManifest, split_into_hours, PARTITION_HOUR_FORMAT
+
 
 class JobRunStateEnum(enum.Enum):
     STARTING = "STARTING"
@@ -34,6 +36,113 @@ YYYY_MM_DD_HH_MM_FORMAT = "%Y-%m-%d %H:%M"
 # max_incremental_interval = 300  # seconds
 max_incremental_interval = 3600 * 24 * 365  # seconds
 max_incremental_files = 100  # n files
+# the minute of the ``update_at``, the same as the minute partition of the
+# dynamodb stream data, see :func:`~dynamodb_to_datalake.stream_partition.get_partition_key`
+UPDATE_AT_MINUTE_FORMAT = "%Y-%m-%dT%H:%M"
+
+
+def is_update_at_in_range(
+    update_at: str,
+    start_after_datetime: datetime,
+    end_before_datetime: datetime,
+) -> bool:
+    """
+    Whether the record is in the ``[start_after_datetime, end_before_datetime)``
+    minute range, the same range :func:`list_stream_files` lists.
+    """
+    minute = update_at[:16]
+    return (
+        start_after_datetime.strftime(UPDATE_AT_MINUTE_FORMAT)
+        <= minute
+        < end_before_datetime.strftime(UPDATE_AT_MINUTE_FORMAT)
+    )
+
+
+def list_stream_files(
+    bsm: BotoSesManager,
+    s3dir_dynamodb_stream: S3Path,
+    start_after_datetime: datetime,
+    end_before_datetime: datetime,
+    s3path_compaction_manifest: T.Optional[S3Path] = None,
+) -> T.List[str]:
+    """
+    List the dynamodb stream data files in the
+    ``[start_after_datetime, end_before_datetime)`` minute range. The
+    compacted hours are read from the compacted files, plus the minute files
+    landed after the compaction (not in the manifest ``sources``), the others
+    are read from the minute files.
+
+    The merged minute files are deleted after the compaction retention, so a
+    compacted hour is read from the compacted files even if the range only
+    covers part of it (a retry, or a lagging run resumes in the middle of the
+    hour). Then the files have records out of the range, the reader has to
+    filter the records by :func:`is_update_at_in_range`.
+    """
+    start_after_key = (
+        s3dir_dynamodb_stream.joinpath(
+            start_after_datetime.strftime(PARTITION_DATETIME_FORMAT)
+        )
+        .to_dir()
+        .key
+    )
+    end_before_key = (
+        s3dir_dynamodb_stream.joinpath(
+            end_before_datetime.strftime(PARTITION_DATETIME_FORMAT)
+        )
+        .to_dir()
+        .key
+    )
+    s3uri_list = list()
+    if s3path_compaction_manifest is None:
+        for s3path in s3dir_dynamodb_stream.iter_objects(
+            start_after=start_after_key,
+            bsm=bsm,
+        ):
+            # s3 list objects is ordered by key, we can stop early
+            if s3path.key >= end_before_key:
+                break
+            s3uri_list.append(s3path.uri)
+        return s3uri_list
+
+    manifest = CompactionManifest.read(
+        bsm=bsm,
+        s3path_manifest=s3path_compaction_manifest,
+    )
+    for start, end, is_full_hour in split_into_hours(
+        start_after_datetime,
+        end_before_datetime,
+    ):
+        s3dir_hour = s3dir_dynamodb_stream.joinpath(
+            start.strftime(PARTITION_HOUR_FORMAT)
+        ).to_dir()
+        if manifest.is_compacted(start):
+            s3uri_list.extend(manifest.get_compacted_s3uri_list(start))
+            sources = manifest.get_sources(start)
+        else:
+            sources = set()
+        if is_full_hour:
+            for s3path in s3dir_hour.iter_objects(bsm=bsm):
+                if s3path.key not in sources:
+                    s3uri_list.append(s3path.uri)
+            continue
+        start_key = (
+            s3dir_dynamodb_stream.joinpath(
+                start.strftime(PARTITION_DATETIME_FORMAT)
+            )
+            .to_dir()
+            .key
+        )
+        end_key = (
+            s3dir_dynamodb_stream.joinpath(
+                end.strftime(PARTITION_DATETIME_FORMAT)
+            )
+            .to_dir()
+            .key
+        )
+        for s3path in s3dir_hour.iter_objects(bsm=bsm):
+            if start_key <= s3path.key < end_key and s3path.key not in sources:
+                s3uri_list.append(s3path.uri)
+    return s3uri_list
 
 
 @dataclasses.dataclass
@@ -61,6 +170,10 @@ class CDCTracker:
         ${s3dir_dynamodb_stream}/.../
     :param glue_job_name: the incremental glue job name.
     :param epoch_processed_partition: where the incremental data from.
+    :param s3path_compaction_manifest: the
+        :class:`~dynamodb_to_datalake.stream_compaction.CompactionManifest`
+        location. If set, the glue job reads the hourly compacted file for
+        the hours fully covered by the batch instead of the minute files.
 
     :param last_glue_job_run_id: the last glue job run id
     :param last_glue_job_run_sequence_id: the last glue job run sequence id
@@ -78,6 +191,7 @@ class CDCTracker:
     s3dir_dynamodb_stream: S3Path = dataclasses.field()
     glue_job_name: str = dataclasses.field()
     epoch_processed_partition: str = dataclasses.field()
+    s3path_compaction_manifest: T.Optional[S3Path] = dataclasses.field(default=None)
 
     # dynamic attributes
     last_glue_job_run_id: T.Optional[str] = dataclasses.field(default=None)
@@ -95,6 +209,7 @@ class CDCTracker:
         s3dir_dynamodb_stream: S3Path,
         glue_job_name: str,
         epoch_processed_partition: str,
+        s3path_compaction_manifest: T.Optional[S3Path] = None,
     ):
         """
         Read the tracker data from s3. If not exists, create a new one with
@@ -108,6 +223,7 @@ class CDCTracker:
                 s3dir_dynamodb_stream=s3dir_dynamodb_stream,
                 glue_job_name=glue_job_name,
                 epoch_processed_partition=epoch_processed_partition,
+                s3path_compaction_manifest=s3path_compaction_manifest,
                 last_glue_job_run_id=None,
                 last_glue_job_run_sequence_id=0,
                 last_processed_partition=epoch_processed_partition,
@@ -124,6 +240,7 @@ class CDCTracker:
                 s3dir_dynamodb_stream=s3dir_dynamodb_stream,
                 glue_job_name=glue_job_name,
                 epoch_processed_partition=epoch_processed_partition,
+                s3path_compaction_manifest=s3path_compaction_manifest,
                 last_glue_job_run_id=data["last_glue_job_run_id"],
                 last_glue_job_run_sequence_id=data["last_glue_job_run_sequence_id"],
                 last_processed_partition=data["last_processed_partition"],
@@ -187,15 +304,29 @@ class CDCTracker:
             sequence_id=self.last_glue_job_run_sequence_id + 1,
         )
 
+    def list_stream_files(
+        self,
+        bsm: BotoSesManager,
+        start_after_datetime: datetime,
+        end_before_datetime: datetime,
+    ) -> T.List[str]:
+        """
+        See :func:`list_stream_files`.
+        """
+        return list_stream_files(
+            bsm=bsm,
+            s3dir_dynamodb_stream=self.s3dir_dynamodb_stream,
+            start_after_datetime=start_after_datetime,
+            end_before_datetime=end_before_datetime,
+            s3path_compaction_manifest=self.s3path_compaction_manifest,
+        )
+
     def run_glue_job(self, bsm: BotoSesManager):
         print("prepare the glue job parameters.")
         # let's say if the last processed partition is 2023-01-01-00-00
         # then we only process incremental files >= 2023-01-01-00-01
         start_after_datetime = self.last_processed_datetime + timedelta(minutes=1)
         start_after_partition = start_after_datetime.strftime(PARTITION_DATETIME_FORMAT)
-        start_after_key = (
-            self.s3dir_dynamodb_stream.joinpath(start_after_partition).to_dir().key
-        )
 
         # let's say if the utc now is 2023-01-01 00:10:30.123456
         # then we only process incremental files < 2023-01-01-00-09
@@ -211,16 +342,12 @@ class CDCTracker:
         next_processed_partition = next_processed_datetime.strftime(PARTITION_DATETIME_FORMAT)
         end_before_datetime = next_processed_datetime + timedelta(minutes=1)
         end_before_partition = end_before_datetime.strftime(PARTITION_DATETIME_FORMAT)
-        end_before_key = (
-            self.s3dir_dynamodb_stream.joinpath(end_before_partition).to_dir().key
-        )
 
-        s3uri_list = list()
-        for s3path in self.s3dir_dynamodb_stream.iter_objects(
-            start_after=start_after_key,
-        ):
-            if s3path.key < end_before_key:
-                s3uri_list.append(s3path.uri)
+        s3uri_list = self.list_stream_files(
+            bsm=bsm,
+            start_after_datetime=start_after_datetime,
+            end_before_datetime=end_before_datetime,
+        )
 
         s3uri_list = s3uri_list[:max_incremental_files]
 
@@ -306,20 +433,31 @@ class CDCTracker:
             )
             state = res["JobRun"]["JobRunState"]
 
-            # if finished (succeeded or failed), update the tracker and run another job
-            if state in [
+            # if succeeded, update the tracker and run another job
+            if state == JobRunStateEnum.SUCCEEDED.value:
+                self.last_processed_partition = self.next_processed_partition
+                self.next_processed_partition = None
+                self.ready_to_run_next_glue_job = True
+                print(
+                    f"previous glue job finished, "
+                    f"status = {state!r}, run another one."
+                )
+                return self.run_glue_job(bsm=bsm)
+            # if failed, for example a Hudi write conflict with a table
+            # service, process the same partitions again, the upsert is
+            # idempotent
+            elif state in [
                 JobRunStateEnum.STOPPED.value,
-                JobRunStateEnum.SUCCEEDED.value,
                 JobRunStateEnum.FAILED.value,
                 JobRunStateEnum.TIMEOUT.value,
                 JobRunStateEnum.ERROR.value,
             ]:
-                self.last_processed_partition = self.next_processed_partition
                 self.next_processed_partition = None
                 self.ready_to_run_next_glue_job = True
                 print(
                     f"previous glue job finished, "
-                    f"status = {state!r}, run another one."
+                    f"status = {state!r}, retry from "
+                    f"{self.last_processed_partition!r}."
                 )
                 return self.run_glue_job(bsm=bsm)
             else:
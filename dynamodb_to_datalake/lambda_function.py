@@ -83,7 +83,7 @@ def create_dynamodb_stream_consumer_lambda_function():
     source_artifacts_deployment = publish_source_artifacts(
         bsm=bsm,
         path_setup_py_or_pyproject_toml=dir_project_root,
-        package_name=function_name,
+        package_name=config.app_name,
         path_lambda_function=path_lbd_func_dynamodb_stream_consumer,
         version="0.1.1",
         dir_build=dir_build_lambda,
@@ -108,6 +108,9 @@ def create_dynamodb_stream_consumer_lambda_function():
             "Variables": {
                 "S3_BUCKET": s3dir_dynamodb_stream.bucket,
                 "S3_PREFIX": s3dir_dynamodb_stream.key,
+                "SINK_TYPE": config.stream_sink_type,
+                "FUNCTION_TIMEOUT": "3",
+                "CHANGED_COLUMNS_ONLY": str(config.enable_changed_columns_only).lower(),
                 "CODE_ETAG": source_artifacts_deployment.s3path_source_zip.etag,
             },
         },
@@ -117,3 +120,5 @@ def create_dynamodb_stream_consumer_lambda_function():
     )
     print("batch size = 100")
     print("buffer seconds = 10 seconds")
+    print("report batch item failures = yes")
+    print("split batch on error = yes")
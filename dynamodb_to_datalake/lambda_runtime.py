@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+"""
+Shared runtime for the Lambda functions. It only depends on the standard
+library and boto3, so importing it is cheap on cold start.
+
+The boto3 clients are created lazily on first use with tuned connection pool,
+timeouts and retries, and cached in the module for the following invocations
+of the same Lambda execution environment. There is no network call at
+import time.
+
+The settings can be overridden by the Lambda environment variables:
+
+- ``MAX_POOL_CONNECTIONS``: default 10
+- ``CONNECT_TIMEOUT``: in seconds, default 2
+- ``READ_TIMEOUT``: in seconds, default 10
+- ``MAX_ATTEMPTS``: default 3, the retry mode is ``standard``
+
+If ``FUNCTION_TIMEOUT`` (the Lambda function timeout in seconds) is set, the
+defaults are derived from it, so all attempts of a call fit in two thirds of
+the function timeout. A hung call still has to be cut by the handler with the
+deadline from :func:`get_deadline`, the retry backoff is not bounded by it.
+"""
+
+import typing as T
+import os
+import time
+import threading
+
+import boto3
+from botocore.config import Config
+
+_lock = threading.Lock()
+_session: T.Optional[boto3.session.Session] = None
+_clients: T.Dict[T.Tuple[str, int], T.Any] = dict()
+
+
+def get_default_timeouts() -> T.Tuple[float, float, int]:
+    """
+    :return: the default connect timeout, read timeout and max attempts.
+    """
+    function_timeout = os.environ.get("FUNCTION_TIMEOUT")
+    if function_timeout is None:
+        return 2, 10, 3
+    budget = float(function_timeout) * 2 / 3
+    max_attempts = 2 if budget < 10 else 3
+    per_attempt = budget / max_attempts
+    connect_timeout = min(2.0, per_attempt / 4)
+    return connect_timeout, per_attempt - connect_timeout, max_attempts
+
+
+def get_client_config(
+    max_pool_connections: T.Optional[int] = None,
+) -> Config:
+    if max_pool_connections is None:
+        max_pool_connections = int(os.environ.get("MAX_POOL_CONNECTIONS", "10"))
+    connect_timeout, read_timeout, max_attempts = get_default_timeouts()
+    return Config(
+        max_pool_connections=max_pool_connections,
+        connect_timeout=float(os.environ.get("CONNECT_TIMEOUT", connect_timeout)),
+        read_timeout=float(os.environ.get("READ_TIMEOUT", read_timeout)),
+        retries={
+            "max_attempts": int(os.environ.get("MAX_ATTEMPTS", max_attempts)),
+            "mode": "standard",
+        },
+    )
+
+
+def get_deadline(context, margin_seconds: float = 0.5) -> T.Optional[float]:
+    """
+    The ``time.monotonic()`` deadline to stop waiting for the writes, so the
+    handler can report the unfinished ones as failures before the function
+    times out. None if there is no Lambda context (local replay).
+    """
+    if context is None:
+        return None
+    remaining = context.get_remaining_time_in_millis() / 1000
+    return time.monotonic() + remaining - margin_seconds
+
+
+def get_session() -> boto3.session.Session:
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = boto3.session.Session()
+    return _session
+
+
+def get_client(
+    service_name: str,
+    max_pool_connections: T.Optional[int] = None,
+):
+    """
+    Get the cached boto3 client, create it on first use. The client is
+    thread safe and can be shared by the worker threads.
+
+    :param max_pool_connections: should be at least the number of threads
+        using this client concurrently.
+    """
+    key = (service_name, max_pool_connections)
+    client = _clients.get(key)
+    if client is None:
+        session = get_session()
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = session.client(
+                    service_name,
+                    config=get_client_config(max_pool_connections),
+                )
+                _clients[key] = client
+    return client
+
+
+def reset_clients():
+    """
+    Drop the cached session and clients, the next :func:`get_client` creates
+    new ones. For tests, a client created outside of a mock keeps talking to
+    the real endpoint.
+    """
+    global _session
+    with _lock:
+        _session = None
+        _clients.clear()
@@ -36,11 +36,16 @@ path_lbd_func_dynamodb_export_to_s3_post_processor_worker = dir_lbd_funcs.joinpa
 
 # glue job source code
 dir_glue_jobs = dir_project_root.joinpath("glue_jobs")
+path_glue_script_utils = dir_glue_jobs.joinpath("glue_utils.py")
 path_glue_script_initial_load = dir_glue_jobs.joinpath("initial_load.py")
 path_glue_script_incremental = dir_glue_jobs.joinpath("incremental.py")
+path_glue_script_clustering = dir_glue_jobs.joinpath("clustering.py")
+path_glue_script_maintenance = dir_glue_jobs.joinpath("maintenance.py")
 
 # lambda function deployment package build directory
 dir_build_lambda = dir_project_root.joinpath("build", "lambda")
 
 # temp athena query result csv file
 path_query_result = dir_project_root.joinpath("query_result.csv")
+# local athena query result cache
+dir_athena_result_cache = dir_project_root.joinpath(".cache", "athena")
@@ -35,11 +35,25 @@ s3dir_data = S3Path(
 s3dir_database = s3dir_data.joinpath("databases", config.glue_database).to_dir()
 # glue catalog table s3 location
 s3dir_table = s3dir_database.joinpath("tables", config.glue_table).to_dir()
+# daily per account aggregate table s3 location
+s3dir_table_daily_account_summary = s3dir_database.joinpath(
+    "tables", config.glue_table_daily_account_summary
+).to_dir()
 # s3 folder to store Athena query results
 s3dir_athena_result = s3dir_data.joinpath("athena", "results").to_dir()
+# s3 folder to store Athena UNLOAD query parquet files
+s3dir_athena_unload = s3dir_data.joinpath("athena", "unload").to_dir()
 
 # s3 folder to store dynamodb stream CDC data
 s3dir_dynamodb_stream = s3dir_data.joinpath("dynamodb_stream").to_dir()
+# s3 folder to store hourly compacted dynamodb stream CDC data
+s3dir_dynamodb_stream_compacted = s3dir_data.joinpath(
+    "dynamodb_stream_compacted"
+).to_dir()
+# s3 path to store the list of compacted hours
+s3path_dynamodb_stream_compaction_manifest = s3dir_data.joinpath(
+    "dynamodb_stream_compaction_manifest.json"
+)
 # s3 folder to store dynamodb export to s3 raw data
 s3dir_dynamodb_export = s3dir_data.joinpath("dynamodb_export").to_dir()
 # s3 folder to store dynamodb export to s3 processed data
@@ -60,3 +74,21 @@ s3path_incremental_glue_job_tracker = s3dir_data.joinpath(
     "glue_jobs",
     "incremental_glue_job_tracker.json",
 )
+
+# s3 path to store incremental compare checkpoint
+s3path_incremental_compare_tracker = s3dir_data.joinpath(
+    "compare",
+    "incremental_compare_tracker.json",
+)
+
+# s3 directory to store hudi incremental pull checkpoint for each consumer
+s3dir_hudi_incremental_pull_checkpoint = s3dir_data.joinpath(
+    "hudi_incremental_pull",
+    "checkpoints",
+).to_dir()
+
+# s3 directory to store table maintenance glue job reports
+s3dir_maintenance_report = s3dir_data.joinpath(
+    "glue_jobs",
+    "maintenance_report",
+).to_dir()
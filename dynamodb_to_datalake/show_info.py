@@ -23,6 +23,7 @@ def show_info():
     print(f"s3path_incremental_glue_job_tracker: {s3paths.s3path_incremental_glue_job_tracker.console_url}")
     print(f"s3dir_database: {s3paths.s3dir_database.console_url}")
     print(f"s3dir_table: {s3paths.s3dir_table.console_url}")
+    print(f"s3dir_table_daily_account_summary: {s3paths.s3dir_table_daily_account_summary.console_url}")
 
     print("------ IAM Role")
     for role_name, description in [
@@ -81,3 +82,15 @@ def show_info():
         job_name=config.glue_job_name_incremental,
     )
     print(f"glue job {config.glue_job_name_incremental!r}: {url}")
+
+    url = get_glue_job_console_url(
+        aws_region=config.aws_region,
+        job_name=config.glue_job_name_clustering,
+    )
+    print(f"glue job {config.glue_job_name_clustering!r}: {url}")
+
+    url = get_glue_job_console_url(
+        aws_region=config.aws_region,
+        job_name=config.glue_job_name_maintenance,
+    )
+    print(f"glue job {config.glue_job_name_maintenance!r}: {url}")
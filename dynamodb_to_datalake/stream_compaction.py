@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compact the small dynamodb stream consumer files into hourly parquet files.
+
+[CN]
+
+DynamoDB Stream Consumer 每次被调用都会在每个分钟级的 partition 下写入一个新的
+小文件. 这个模块将已经关闭的 (不会再有新数据写入的) 小时内的所有小文件合并成
+一个压缩的 parquet 文件, 然后更新 manifest. 由于 S3 的单次 PUT 是原子的, 而且
+我们总是先写 parquet 文件再更新 manifest, 所以 manifest 中出现的文件一定是完整的.
+:class:`~dynamodb_to_datalake.incremental_load_orchestration.CDCTracker` 对于
+被完整覆盖的小时会读取合并后的文件, 以及不在 manifest ``sources`` 中的迟到的小文件.
+被合并的小文件在保留一段时间后会被删除, 这样之后 list 一个已经合并的小时只会返回
+迟到的小文件.
+"""
+
+import typing as T
+import io
+import json
+import uuid
+import dataclasses
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import polars as pl
+from s3pathlib import S3Path
+from boto_session_manager import BotoSesManager
+
+PARTITION_HOUR_FORMAT = "year=%Y/month=%m/day=%d/hour=%H"
+
+# the parquet schema of the compacted files, it has to match the json
+# schema inferred by the incremental glue job, and the parquet sink
+# :data:`~dynamodb_to_datalake.stream_sink.PARQUET_COLUMN_TYPES`
+STREAM_RECORD_SCHEMA = {
+    "account": pl.Utf8,
+    "create_at": pl.Utf8,
+    "update_at": pl.Utf8,
+    "entity": pl.Utf8,
+    "amount": pl.Int64,
+    "is_credit": pl.Int64,
+    "note": pl.Utf8,
+    # tombstone only columns
+    "is_deleted": pl.Boolean,
+    "delete_source": pl.Utf8,
+}
+
+
+def floor_hour(dt: datetime) -> datetime:
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def split_into_hours(
+    start: datetime,
+    end: datetime,
+) -> T.List[T.Tuple[datetime, datetime, bool]]:
+    """
+    Split the ``[start, end)`` minute range by hour.
+
+    :return: list of ``(start, end, is_full_hour)`` tuple.
+    """
+    segments = list()
+    cursor = start
+    while cursor < end:
+        next_hour = floor_hour(cursor) + timedelta(hours=1)
+        segment_end = min(next_hour, end)
+        is_full_hour = (cursor == floor_hour(cursor)) and (segment_end == next_hour)
+        segments.append((cursor, segment_end, is_full_hour))
+        cursor = segment_end
+    return segments
+
+
+def read_stream_file(s3path: S3Path, bsm: BotoSesManager) -> T.List[dict]:
+    """
+    Read one dynamodb stream consumer output file, json lines or parquet
+    (the parquet sink and the compacted files), by the file extension. The
+    null columns of a parquet row are dropped, the same as a json line that
+    doesn't have them (partial update).
+    """
+    if s3path.ext == ".parquet":
+        df = pl.read_parquet(io.BytesIO(s3path.read_bytes(bsm=bsm)))
+        return [
+            {column: value for column, value in row.items() if value is not None}
+            for row in df.to_dicts()
+        ]
+    else:
+        return [
+            json.loads(line)
+            for line in s3path.read_text(bsm=bsm).splitlines()
+            if line
+        ]
+
+
+@dataclasses.dataclass
+class CompactionManifest:
+    """
+    The list of the compacted hours.
+
+    :param s3path_manifest: where you store the manifest.
+    :param hours: the hour partition (in :data:`PARTITION_HOUR_FORMAT`) to the
+        compaction entry mapping. An entry has:
+
+        - ``files``: the compacted parquet file s3 uri list, the first one is
+          the initial compaction, the others are the late files.
+        - ``sources``: the s3 keys of the minute files already merged into
+          ``files`` but not deleted yet.
+        - ``compacted_at``: when the entry was last changed.
+    :param last_compacted_hour: all closed hours before and at this hour
+        has been compacted.
+    """
+
+    s3path_manifest: S3Path = dataclasses.field()
+    hours: T.Dict[str, dict] = dataclasses.field(default_factory=dict)
+    last_compacted_hour: T.Optional[str] = dataclasses.field(default=None)
+
+    @classmethod
+    def read(
+        cls,
+        bsm: BotoSesManager,
+        s3path_manifest: S3Path,
+    ):
+        if s3path_manifest.exists(bsm=bsm) is False:
+            return cls(s3path_manifest=s3path_manifest)
+        else:
+            data = json.loads(s3path_manifest.read_text(bsm=bsm))
+            return cls(
+                s3path_manifest=s3path_manifest,
+                hours=data["hours"],
+                last_compacted_hour=data["last_compacted_hour"],
+            )
+
+    def write(
+        self,
+        bsm: BotoSesManager,
+    ):
+        """
+        Replace the manifest with a single PUT, so the readers either see the
+        old one or the new one.
+        """
+        self.s3path_manifest.write_text(
+            json.dumps(
+                {
+                    "hours": self.hours,
+                    "last_compacted_hour": self.last_compacted_hour,
+                    "updated_at": datetime.utcnow().isoformat(),
+                },
+                indent=4,
+            ),
+            content_type="application/json",
+            bsm=bsm,
+        )
+
+    def is_compacted(self, hour: datetime) -> bool:
+        return hour.strftime(PARTITION_HOUR_FORMAT) in self.hours
+
+    def get_entry(self, hour: datetime) -> dict:
+        return self.hours.setdefault(
+            hour.strftime(PARTITION_HOUR_FORMAT),
+            {"files": [], "sources": [], "compacted_at": None},
+        )
+
+    def get_compacted_s3uri_list(self, hour: datetime) -> T.List[str]:
+        return list(self.hours[hour.strftime(PARTITION_HOUR_FORMAT)]["files"])
+
+    def get_sources(self, hour: datetime) -> T.Set[str]:
+        return set(self.hours[hour.strftime(PARTITION_HOUR_FORMAT)]["sources"])
+
+
+@dataclasses.dataclass
+class StreamCompactor:
+    """
+    Merge the minute files of the closed hours, then delete the merged minute
+    files after ``source_retention_minutes``. A minute file that lands in an
+    hour after it is compacted (Lambda retries, iterator age during catch up)
+    is never lost: the readers read the minute files not in the entry
+    ``sources`` too, and the next runs merge it into another compacted file.
+
+    :param s3dir_dynamodb_stream: where the dynamodb stream consumer writes
+        the minute level small files.
+    :param s3dir_compacted: where you store the hourly parquet files.
+    :param s3path_manifest: where you store the :class:`CompactionManifest`.
+    :param epoch_hour: where the compaction starts from.
+    :param lag_minutes: an hour is closed when it ends more than this minutes
+        ago. It should cover the worst case Lambda retry and iterator age,
+        the later files are still handled but cost one more compacted file.
+    :param late_lookback_hours: look for the late files in the compacted hours
+        in this window.
+    :param source_retention_minutes: keep the merged minute files for a while,
+        an incremental glue job run may have listed them before the compaction.
+    """
+
+    s3dir_dynamodb_stream: S3Path = dataclasses.field()
+    s3dir_compacted: S3Path = dataclasses.field()
+    s3path_manifest: S3Path = dataclasses.field()
+    epoch_hour: datetime = dataclasses.field()
+    lag_minutes: int = dataclasses.field(default=60)
+    late_lookback_hours: int = dataclasses.field(default=24)
+    source_retention_minutes: int = dataclasses.field(default=180)
+
+    def get_closed_hours(
+        self,
+        manifest: CompactionManifest,
+        now: datetime,
+    ) -> T.List[datetime]:
+        if manifest.last_compacted_hour is None:
+            hour = floor_hour(self.epoch_hour)
+        else:
+            hour = datetime.strptime(
+                manifest.last_compacted_hour,
+                PARTITION_HOUR_FORMAT,
+            ) + timedelta(hours=1)
+        hours = list()
+        while hour + timedelta(hours=1, minutes=self.lag_minutes) <= now:
+            hours.append(hour)
+            hour = hour + timedelta(hours=1)
+        return hours
+
+    def list_hour_files(
+        self,
+        bsm: BotoSesManager,
+        hour: datetime,
+    ) -> T.List[S3Path]:
+        return list(
+            self.s3dir_dynamodb_stream.joinpath(hour.strftime(PARTITION_HOUR_FORMAT))
+            .to_dir()
+            .iter_objects(bsm=bsm)
+        )
+
+    def compact_files(
+        self,
+        bsm: BotoSesManager,
+        partition: str,
+        s3path_list: T.List[S3Path],
+        max_workers: int = 16,
+    ) -> S3Path:
+        """
+        Merge the minute files into one zstd compressed parquet file.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            records = [
+                record
+                for record_list in executor.map(
+                    lambda s3path: read_stream_file(s3path, bsm=bsm),
+                    s3path_list,
+                )
+                for record in record_list
+            ]
+        df = pl.DataFrame(records, schema=STREAM_RECORD_SCHEMA)
+        buffer = io.BytesIO()
+        df.write_parquet(buffer, compression="zstd")
+        s3path = self.s3dir_compacted.joinpath(
+            partition, f"{uuid.uuid4().hex}.parquet"
+        )
+        s3path.write_bytes(buffer.getvalue(), bsm=bsm)
+        print(
+            f"compacted {len(s3path_list)} files ({df.shape[0]} records) "
+            f"in {partition!r} into {s3path.uri}"
+        )
+        return s3path
+
+    def compact_hour(
+        self,
+        bsm: BotoSesManager,
+        manifest: CompactionManifest,
+        hour: datetime,
+        now: datetime,
+    ) -> T.Optional[S3Path]:
+        """
+        Merge the minute files in the hour that are not merged yet, and
+        record them in the manifest entry. The manifest is not written.
+
+        :return: the compacted file, None if there is no new minute file.
+        """
+        entry = manifest.get_entry(hour)
+        sources = set(entry["sources"])
+        s3path_list = [
+            s3path
+            for s3path in self.list_hour_files(bsm=bsm, hour=hour)
+            if s3path.key not in sources
+        ]
+        if len(s3path_list) == 0:
+            return None
+        s3path = self.compact_files(
+            bsm=bsm,
+            partition=hour.strftime(PARTITION_HOUR_FORMAT),
+            s3path_list=s3path_list,
+        )
+        entry["files"].append(s3path.uri)
+        entry["sources"].extend([s3path.key for s3path in s3path_list])
+        entry["compacted_at"] = now.isoformat()
+        return s3path
+
+    def delete_sources(
+        self,
+        bsm: BotoSesManager,
+        manifest: CompactionManifest,
+        now: datetime,
+    ) -> int:
+        """
+        Delete the merged minute files older than the retention, so listing a
+        compacted hour only returns the late files.
+
+        :return: number of the deleted files.
+        """
+        n_deleted = 0
+        for partition, entry in manifest.hours.items():
+            if len(entry["sources"]) == 0:
+                continue
+            compacted_at = datetime.fromisoformat(entry["compacted_at"])
+            if compacted_at + timedelta(minutes=self.source_retention_minutes) > now:
+                continue
+            keys = entry["sources"]
+            # delete_objects accepts at most 1000 keys
+            for i in range(0, len(keys), 1000):
+                bsm.s3_client.delete_objects(
+                    Bucket=self.s3dir_dynamodb_stream.bucket,
+                    Delete={
+                        "Objects": [{"Key": key} for key in keys[i : i + 1000]],
+                        "Quiet": True,
+                    },
+                )
+            n_deleted += len(keys)
+            entry["sources"] = []
+            # the manifest is written after each hour, a failure in the
+            # middle only leaves the keys to delete again
+            manifest.write(bsm=bsm)
+            print(f"deleted {len(keys)} compacted minute files in {partition!r}")
+        return n_deleted
+
+    def run(
+        self,
+        bsm: BotoSesManager,
+        max_hours: int = 24,
+        now: T.Optional[datetime] = None,
+    ) -> CompactionManifest:
+        """
+        Compact the closed hours that are not compacted yet, merge the late
+        files of the recently compacted hours, then delete the merged minute
+        files after the retention. The manifest is updated after each hour.
+        """
+        if now is None:
+            now = datetime.utcnow()
+        manifest = CompactionManifest.read(
+            bsm=bsm,
+            s3path_manifest=self.s3path_manifest,
+        )
+
+        # late files
+        lookback_start = floor_hour(now) - timedelta(hours=self.late_lookback_hours)
+        for partition in list(manifest.hours):
+            hour = datetime.strptime(partition, PARTITION_HOUR_FORMAT)
+            if hour < lookback_start:
+                continue
+            if self.compact_hour(bsm=bsm, manifest=manifest, hour=hour, now=now):
+                manifest.write(bsm=bsm)
+
+        # new closed hours
+        for hour in self.get_closed_hours(manifest, now=now)[:max_hours]:
+            self.compact_hour(bsm=bsm, manifest=manifest, hour=hour, now=now)
+            manifest.last_compacted_hour = hour.strftime(PARTITION_HOUR_FORMAT)
+            manifest.write(bsm=bsm)
+
+        self.delete_sources(bsm=bsm, manifest=manifest, now=now)
+        return manifest
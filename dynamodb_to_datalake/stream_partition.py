@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+"""
+Minute level partition key of the dynamodb stream data. It only depends on
+the standard library, so the Lambda function can use it.
+
+The ``update_at`` attribute is written by pynamodb ``UTCDateTimeAttribute``,
+the layout is fixed, for example ``2023-08-01T00:01:02.123456+0000``. The
+partition key can be sliced directly from the string, which is much cheaper
+than ``datetime.strptime``. Any value that doesn't match the layout falls
+back to ``strptime``.
+"""
+
+import typing as T
+import calendar
+from datetime import datetime
+
+UPDATE_AT_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%z"
+
+# the fractional seconds (1 to 6 digits) and the utc offset follow the seconds
+_MIN_LENGTH = len("2023-08-01T00:01:02.0+0000")
+_MAX_LENGTH = len("2023-08-01T00:01:02.123456+0000")
+_DAYS_IN_MONTH = ["31", "28", "31", "30", "31", "30", "31", "31", "30", "31", "30", "31"]
+
+
+def _get_partition_key_slow(update_at: str) -> str:
+    dt = datetime.strptime(update_at, UPDATE_AT_FORMAT)
+    return (
+        f"{str(dt.year).zfill(4)}-{str(dt.month).zfill(2)}-{str(dt.day).zfill(2)}"
+        f"-{str(dt.hour).zfill(2)}-{str(dt.minute).zfill(2)}"
+    )
+
+
+def _get_last_day(year: str, month: str) -> str:
+    if month == "02" and calendar.isleap(int(year)):
+        return "29"
+    return _DAYS_IN_MONTH[int(month) - 1]
+
+
+def get_partition_key(update_at: str) -> str:
+    """
+    Get the ``YYYY-MM-DD-HH-MM`` partition key from the ``update_at`` string.
+    The same as the ``strptime`` result, the time is not converted to UTC.
+
+    Only the exact canonical layout with a valid date and time takes the fast
+    path, anything else (non ASCII digits, a day not in the month, trailing
+    characters, ...) is left to ``strptime``, which raises ``ValueError`` for
+    an invalid value.
+    """
+    if (
+        _MIN_LENGTH <= len(update_at) <= _MAX_LENGTH
+        and update_at.isascii()
+        and update_at[4] == "-"
+        and update_at[7] == "-"
+        and update_at[10] == "T"
+        and update_at[13] == ":"
+        and update_at[16] == ":"
+        and update_at[19] == "."
+        and update_at[-5] in "+-"
+    ):
+        year = update_at[0:4]
+        month = update_at[5:7]
+        day = update_at[8:10]
+        hour = update_at[11:13]
+        minute = update_at[14:16]
+        second = update_at[17:19]
+        fraction = update_at[20:-5]
+        offset = update_at[-4:]
+        # str.isdigit() is only equivalent to [0-9] for ascii strings
+        if (
+            (year + month + day + hour + minute + second + fraction + offset).isdigit()
+            and year >= "0001"
+            and "01" <= month <= "12"
+            and "01" <= day <= _get_last_day(year, month)
+            and hour <= "23"
+            and minute <= "59"
+            and second <= "59"
+            and offset[0:2] <= "23"
+            and offset[2] <= "5"
+        ):
+            return f"{year}-{month}-{day}-{hour}-{minute}"
+    return _get_partition_key_slow(update_at)
+
+
+T_ITEM = T.TypeVar("T_ITEM")
+
+
+def group_by_partition(
+    items: T.Iterable[T_ITEM],
+    get_update_at: T.Callable[[T_ITEM], str],
+) -> T.Dict[str, T.List[T_ITEM]]:
+    """
+    Group the items by the partition key of their ``update_at`` in one pass,
+    the order of the items in each group is preserved.
+    """
+    groups: T.Dict[str, T.List[T_ITEM]] = dict()
+    for item in items:
+        key = get_partition_key(get_update_at(item))
+        group = groups.get(key)
+        if group is None:
+            groups[key] = [item]
+        else:
+            group.append(item)
+    return groups
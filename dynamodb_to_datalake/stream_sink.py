@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+
+"""
+The output of the dynamodb stream consumer. The handler hands the cdc data of
+each minute partition to a sink as a :class:`SinkBatch`. The sink buffers the
+batches and writes them concurrently when the flush policy is met, one object
+per batch. The object name is a hash of the stream and the batch content, so
+a retry that writes the same rows overwrites the same object.
+
+Available sinks, selected by the ``SINK_TYPE`` environment variable:
+
+- ``s3_json``: :class:`S3JsonLinesSink`, the default, what the incremental glue
+  job reads.
+- ``s3_parquet``: :class:`S3ParquetSink`, it needs ``pyarrow`` in the Lambda
+  deployment package or layer (e.g. the AWS SDK for pandas managed layer).
+  It is imported when the sink is created, so a missing layer fails at the
+  cold start instead of failing every batch.
+- ``local``: :class:`LocalSink`, writes to the ``LOCAL_SINK_DIR`` folder, for
+  tests and benchmarks.
+
+Except the parquet sink, it only depends on the standard library and boto3,
+so the Lambda function can use it.
+
+The handler calls :meth:`BaseSink.flush` at the end of each invocation, so
+nothing is buffered across invocations, the flush policy only limits how much
+is buffered within one invocation.
+"""
+
+import typing as T
+import io
+import os
+import json
+import time
+import dataclasses
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from .lambda_runtime import get_client
+
+SINK_TYPE_S3_JSON = "s3_json"
+SINK_TYPE_S3_PARQUET = "s3_parquet"
+SINK_TYPE_LOCAL = "local"
+SINK_TYPE_LIST = [SINK_TYPE_S3_JSON, SINK_TYPE_S3_PARQUET, SINK_TYPE_LOCAL]
+
+
+def get_partition_path(partition: str) -> str:
+    """
+    Convert the ``YYYY-MM-DD-HH-MM`` partition key into the hive style folder.
+    """
+    year, month, day, hour, minute = partition.split("-")
+    return f"year={year}/month={month}/day={day}/hour={hour}/minute={minute}"
+
+
+@dataclasses.dataclass
+class SinkBatch:
+    """
+    The cdc data of one partition.
+
+    :param partition: the ``YYYY-MM-DD-HH-MM`` partition key.
+    :param name: the object name without the file extension.
+    :param rows: the cdc data.
+    :param sequence_numbers: the stream sequence numbers of the rows, they
+        are reported as batch item failures if the write failed.
+    """
+
+    partition: str = dataclasses.field()
+    name: str = dataclasses.field()
+    rows: T.List[dict] = dataclasses.field()
+    sequence_numbers: T.List[str] = dataclasses.field(default_factory=list)
+
+
+@dataclasses.dataclass
+class BaseSink:
+    """
+    Buffer the batches and flush them concurrently.
+
+    :param max_buffer_rows: flush when the buffered number of rows reaches
+        this, 0 means only flush when :meth:`flush` is called.
+    :param max_buffer_seconds: flush when the oldest buffered batch is older
+        than this, 0 means no age limit. It is checked when a batch is put.
+    :param max_workers: number of the concurrent writes.
+    """
+
+    max_buffer_rows: int = dataclasses.field(default=0)
+    max_buffer_seconds: float = dataclasses.field(default=0)
+    max_workers: int = dataclasses.field(default=8)
+
+    _buffer: T.List[SinkBatch] = dataclasses.field(
+        default_factory=list, init=False, repr=False
+    )
+    _buffer_rows: int = dataclasses.field(default=0, init=False, repr=False)
+    _buffer_start: float = dataclasses.field(default=0, init=False, repr=False)
+
+    extension: T.ClassVar[str] = ""
+
+    def write_batch(self, batch: SinkBatch):  # pragma: no cover
+        """
+        Write one batch, raise on failure.
+        """
+        raise NotImplementedError
+
+    def get_relpath(self, batch: SinkBatch) -> str:
+        return f"{get_partition_path(batch.partition)}/{batch.name}{self.extension}"
+
+    def should_flush(self) -> bool:
+        if len(self._buffer) == 0:
+            return False
+        if self.max_buffer_rows and (self._buffer_rows >= self.max_buffer_rows):
+            return True
+        if self.max_buffer_seconds and (
+            time.monotonic() - self._buffer_start >= self.max_buffer_seconds
+        ):
+            return True
+        return False
+
+    def put(
+        self,
+        batch: SinkBatch,
+        deadline: T.Optional[float] = None,
+    ) -> T.List[SinkBatch]:
+        """
+        Add a batch to the buffer, flush if the flush policy is met.
+
+        :param deadline: see :meth:`flush`.
+
+        :return: the failed batches of the flush, if any.
+        """
+        if len(self._buffer) == 0:
+            self._buffer_start = time.monotonic()
+        self._buffer.append(batch)
+        self._buffer_rows += len(batch.rows)
+        if self.should_flush():
+            return self.flush(deadline=deadline)
+        return []
+
+    def _write_or_fail(self, batch: SinkBatch) -> T.Optional[SinkBatch]:
+        try:
+            self.write_batch(batch)
+            return None
+        except Exception as e:
+            print(f"failed to write {self.get_relpath(batch)}: {e!r}")
+            return batch
+
+    def flush(self, deadline: T.Optional[float] = None) -> T.List[SinkBatch]:
+        """
+        Write all buffered batches.
+
+        :param deadline: the ``time.monotonic()`` to stop waiting, the batches
+            not written by then are failed. The object names are idempotent,
+            so a write finishing later is overwritten by the retry.
+
+        :return: the failed batches.
+        """
+        batches = self._buffer
+        self._buffer = list()
+        self._buffer_rows = 0
+        if len(batches) == 0:
+            return []
+        elif (len(batches) == 1) and (deadline is None):
+            results = [self._write_or_fail(batches[0])]
+        else:
+            executor = ThreadPoolExecutor(
+                max_workers=min(self.max_workers, len(batches))
+            )
+            futures = [executor.submit(self._write_or_fail, batch) for batch in batches]
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            wait(futures, timeout=timeout)
+            # don't wait for the hung writes
+            executor.shutdown(wait=False)
+            results = list()
+            for batch, future in zip(batches, futures):
+                if future.done():
+                    results.append(future.result())
+                else:
+                    print(f"timeout to write {self.get_relpath(batch)}")
+                    results.append(batch)
+        return [batch for batch in results if batch is not None]
+
+
+def to_json_lines(rows: T.List[dict]) -> str:
+    return "\n".join([json.dumps(row) for row in rows])
+
+
+@dataclasses.dataclass
+class S3JsonLinesSink(BaseSink):
+    """
+    One JSON object per line.
+
+    :param bucket: the s3 bucket.
+    :param prefix: the s3 folder, without the trailing slash.
+    """
+
+    bucket: str = dataclasses.field(default="")
+    prefix: str = dataclasses.field(default="")
+
+    extension: T.ClassVar[str] = ".json"
+
+    def write_batch(self, batch: SinkBatch):
+        key = f"{self.prefix}/{self.get_relpath(batch)}"
+        print(f"write {len(batch.rows)} records to s3://{self.bucket}/{key}")
+        s3_client = get_client("s3", max_pool_connections=self.max_workers)
+        s3_client.put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=to_json_lines(batch.rows),
+            ContentType="application/json",
+        )
+
+
+# the arrow type of each column, it has to match
+# :data:`~dynamodb_to_datalake.stream_compaction.STREAM_RECORD_SCHEMA`
+PARQUET_COLUMN_TYPES = {
+    "account": "string",
+    "create_at": "string",
+    "update_at": "string",
+    "entity": "string",
+    "amount": "int64",
+    "is_credit": "int64",
+    "note": "string",
+    "is_deleted": "bool_",
+    "delete_source": "string",
+}
+
+
+def get_parquet_schema():
+    import pyarrow as pa
+
+    return pa.schema(
+        [(name, getattr(pa, type_)()) for name, type_ in PARQUET_COLUMN_TYPES.items()]
+    )
+
+
+def to_parquet(rows: T.List[dict]) -> bytes:
+    """
+    Serialize the rows with the compacted file schema, the columns not in
+    the row (partial update) are null.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    buffer = io.BytesIO()
+    table = pa.Table.from_pylist(rows, schema=get_parquet_schema())
+    pq.write_table(table, buffer, compression="zstd")
+    return buffer.getvalue()
+
+
+@dataclasses.dataclass
+class S3ParquetSink(S3JsonLinesSink):
+    """
+    One zstd compressed parquet file per batch.
+    """
+
+    extension: T.ClassVar[str] = ".parquet"
+
+    def write_batch(self, batch: SinkBatch):
+        key = f"{self.prefix}/{self.get_relpath(batch)}"
+        print(f"write {len(batch.rows)} records to s3://{self.bucket}/{key}")
+        s3_client = get_client("s3", max_pool_connections=self.max_workers)
+        s3_client.put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=to_parquet(batch.rows),
+            ContentType="application/x-parquet",
+        )
+
+
+@dataclasses.dataclass
+class LocalSink(BaseSink):
+    """
+    JSON lines files in a local folder, the same layout as the s3 sink.
+
+    :param dir_root: the local folder.
+    """
+
+    dir_root: Path = dataclasses.field(default=Path("."))
+
+    extension: T.ClassVar[str] = ".json"
+
+    def write_batch(self, batch: SinkBatch):
+        path = Path(self.dir_root).joinpath(self.get_relpath(batch))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(to_json_lines(batch.rows))
+
+
+def create_sink(
+    sink_type: str,
+    max_workers: int = 8,
+    max_buffer_rows: int = 0,
+    max_buffer_seconds: float = 0,
+    bucket: T.Optional[str] = None,
+    prefix: T.Optional[str] = None,
+    dir_root: T.Optional[T.Union[str, Path]] = None,
+) -> BaseSink:
+    kwargs = dict(
+        max_workers=max_workers,
+        max_buffer_rows=max_buffer_rows,
+        max_buffer_seconds=max_buffer_seconds,
+    )
+    if sink_type == SINK_TYPE_S3_JSON:
+        return S3JsonLinesSink(bucket=bucket, prefix=prefix.rstrip("/"), **kwargs)
+    elif sink_type == SINK_TYPE_S3_PARQUET:
+        # fail fast if the layer is missing
+        import pyarrow.parquet  # noqa: F401
+
+        return S3ParquetSink(bucket=bucket, prefix=prefix.rstrip("/"), **kwargs)
+    elif sink_type == SINK_TYPE_LOCAL:
+        return LocalSink(dir_root=Path(dir_root), **kwargs)
+    else:
+        raise ValueError(
+            f"invalid sink type {sink_type!r}, has to be one of {SINK_TYPE_LIST}"
+        )
+
+
+def create_sink_from_env() -> BaseSink:
+    """
+    Create the sink from the Lambda environment variables ``SINK_TYPE``,
+    ``MAX_WORKERS``, ``S3_BUCKET``, ``S3_PREFIX`` and ``LOCAL_SINK_DIR``.
+    """
+    return create_sink(
+        sink_type=os.environ.get("SINK_TYPE", SINK_TYPE_S3_JSON),
+        max_workers=int(os.environ.get("MAX_WORKERS", "8")),
+        bucket=os.environ.get("S3_BUCKET"),
+        prefix=os.environ.get("S3_PREFIX"),
+        dir_root=os.environ.get("LOCAL_SINK_DIR"),
+    )
@@ -29,6 +29,10 @@ class Waiter:
                 break
 
         print("after waiter")
+
+    You can also use ``backoff`` to increase the polling interval by a factor
+    after each attempt, up to ``max_delay`` seconds. It is useful when
+    the job may take either a few seconds or a few minutes.
     """
     def __init__(
         self,
@@ -36,13 +40,31 @@ class Waiter:
         timeout: T.Union[int, float],
         indent: int = 0,
         verbose: bool = True,
+        backoff: T.Union[int, float] = 1,
+        max_delay: T.Optional[T.Union[int, float]] = None,
     ):
         self._delays = delays
-        self.delays = itertools.repeat(delays)
+        if backoff == 1:
+            self.delays = itertools.repeat(delays)
+        else:
+            self.delays = self._backoff_delays(delays, backoff, max_delay)
         self.timeout = timeout
         self.tab = " " * indent
         self.verbose = verbose
 
+    @staticmethod
+    def _backoff_delays(
+        delays: T.Union[int, float],
+        backoff: T.Union[int, float],
+        max_delay: T.Optional[T.Union[int, float]],
+    ) -> T.Iterable[float]:
+        delay = delays
+        while 1:
+            if max_delay is not None:
+                delay = min(delay, max_delay)
+            yield delay
+            delay = delay * backoff
+
     def __iter__(self):
         if self.verbose: # pragma: no cover
             sys.stdout.write(
@@ -65,7 +87,7 @@ class Waiter:
                 raise TimeoutError(f"timed out in {self.timeout} seconds!")
             else:
                 time.sleep(min(delay, remaining))
-                elapsed = int(now - start + delay)
+                elapsed = int(time.time() - start)
                 if self.verbose: # pragma: no cover
                     sys.stdout.write(
                         f"\r{self.tab}on {attempt} th attempt, "
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+# standard library
+import sys
+
+# third party library
+import boto3
+
+# pyspark / AWS Glue stuff
+from pyspark import SparkConf
+from pyspark.sql import SparkSession
+
+from awsglue.utils import getResolvedOptions
+from awsglue.context import GlueContext
+from awsglue.job import Job
+
+# shipped with --extra-py-files
+from glue_utils import get_lock_options, get_partition_predicate
+
+# ------------------------------------------------------------------------------
+# create spark session
+# ------------------------------------------------------------------------------
+conf = (
+    SparkConf()
+    .setAppName("MyApp")
+    .setAll(
+        [
+            ("spark.serializer", "org.apache.spark.serializer.KryoSerializer"),
+            ("spark.sql.hive.convertMetastoreParquet", "false"),
+            (
+                "spark.sql.extensions",
+                "org.apache.spark.sql.hudi.HoodieSparkSessionExtension",
+            ),
+        ]
+    )
+)
+spark_ses = SparkSession.builder.config(conf=conf).enableHiveSupport().getOrCreate()
+spark_ctx = spark_ses.sparkContext
+glue_ctx = GlueContext(spark_ctx)
+
+# ------------------------------------------------------------------------------
+# resolve job parameters
+# ------------------------------------------------------------------------------
+args = getResolvedOptions(
+    sys.argv,
+    [
+        "JOB_NAME",
+        "S3URI_TABLE",
+        "DATABASE_NAME",
+        "TABLE_NAME",
+        "SORT_COLUMNS",
+        "LAYOUT_STRATEGY",
+        "MIN_PARTITION_AGE_DAYS",
+        "PARTITION_FIELDS",
+        "LOCK_TABLE_NAME",
+    ],
+)
+job = Job(glue_ctx)
+job.init(args["JOB_NAME"], args)
+
+S3URI_TABLE = args["S3URI_TABLE"]
+DATABASE_NAME = args["DATABASE_NAME"]
+TABLE_NAME = args["TABLE_NAME"]
+SORT_COLUMNS = args["SORT_COLUMNS"]  # e.g. "account,create_at"
+LAYOUT_STRATEGY = args["LAYOUT_STRATEGY"]  # "linear" or "z-order"
+MIN_PARTITION_AGE_DAYS = int(args["MIN_PARTITION_AGE_DAYS"])
+# comma separated, the create_year, ..., create_minute prefix of the granularity
+PARTITION_FIELDS = args["PARTITION_FIELDS"]
+LOCK_TABLE_NAME = args["LOCK_TABLE_NAME"]
+
+# ------------------------------------------------------------------------------
+# create boto3 session
+# ------------------------------------------------------------------------------
+boto_ses = boto3.session.Session()
+sts_client = boto_ses.client("sts")
+aws_account_id = sts_client.get_caller_identity()["Account"]
+aws_region = boto_ses.region_name
+
+print(f"aws_account_id = {aws_account_id}")
+print(f"aws_region = {aws_region}")
+
+
+# ------------------------------------------------------------------------------
+# run clustering
+# rewrite the file groups sorted by account, create_at, so the parquet
+# min / max statistics of account are tight and Athena can skip most of
+# the files for per account queries
+# ------------------------------------------------------------------------------
+predicate = get_partition_predicate(MIN_PARTITION_AGE_DAYS, PARTITION_FIELDS)
+print(f"cluster {S3URI_TABLE} by {SORT_COLUMNS!r} ({LAYOUT_STRATEGY})")
+print(f"partition predicate: {predicate}")
+
+# hudi procedures pick up the hoodie.* configs from the session
+spark_ses.sql(f"SET hoodie.layout.optimize.strategy={LAYOUT_STRATEGY}")
+spark_ses.sql(f"SET hoodie.clustering.plan.strategy.sort.columns={SORT_COLUMNS}")
+spark_ses.sql("SET hoodie.datasource.hive_sync.enable=true")
+spark_ses.sql(f"SET hoodie.datasource.hive_sync.database={DATABASE_NAME}")
+spark_ses.sql(f"SET hoodie.datasource.hive_sync.table={TABLE_NAME}")
+spark_ses.sql("SET hoodie.datasource.hive_sync.mode=hms")
+for key, value in get_lock_options(TABLE_NAME, LOCK_TABLE_NAME, aws_region).items():
+    spark_ses.sql(f"SET {key}={value}")
+
+result = spark_ses.sql(
+    f"""
+    CALL run_clustering(
+        path => '{S3URI_TABLE}',
+        predicate => "{predicate}",
+        order => '{SORT_COLUMNS}',
+        show_involved_partition => true
+    )
+    """
+)
+result.show(truncate=False)
+
+job.commit()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+"""
+The helpers shared by the glue job scripts. It is shipped to the glue jobs
+with ``--extra-py-files``, the scripts import it as ``glue_utils``.
+
+It doesn't depend on pyspark or the glue runtime, so it can be tested
+without AWS.
+"""
+
+from datetime import datetime, timedelta
+
+
+def get_lock_options(
+    table: str,
+    lock_table_name: str,
+    aws_region: str,
+) -> dict:
+    """
+    Hudi optimistic concurrency control options. The incremental, clustering
+    and maintenance jobs may write the table at the same time, the commits are
+    serialized by the DynamoDB based lock, a conflicting commit fails.
+
+    :param table: the lock partition key, one lock per Hudi table.
+    :param lock_table_name: the DynamoDB table of the lock.
+    """
+    return {
+        "hoodie.write.concurrency.mode": "optimistic_concurrency_control",
+        "hoodie.cleaner.policy.failed.writes": "LAZY",
+        "hoodie.write.lock.provider": "org.apache.hudi.aws.transaction.lock.DynamoDBBasedLockProvider",
+        "hoodie.write.lock.dynamodb.table": lock_table_name,
+        "hoodie.write.lock.dynamodb.partition_key": table,
+        "hoodie.write.lock.dynamodb.region": aws_region,
+        "hoodie.write.lock.dynamodb.billing_mode": "PAY_PER_REQUEST",
+    }
+
+
+def get_partition_predicate(
+    min_partition_age_days: int,
+    partition_fields: str,
+) -> str:
+    """
+    Only cluster the partitions older than ``min_partition_age_days``, the
+    recent partitions are still being written by the incremental job.
+
+    The partition values are compared down to the day. A year or month
+    partition is only clustered after the whole year or month is older than
+    the cutoff day, an hour or minute partition is compared by its day.
+    """
+    dt = datetime.utcnow() - timedelta(days=min_partition_age_days)
+    values = [
+        (field, dt.strftime(fmt))
+        for field, fmt in [
+            ("create_year", "%Y"),
+            ("create_month", "%m"),
+            ("create_day", "%d"),
+        ]
+        if field in partition_fields.split(",")
+    ]
+    conditions = list()
+    for i, (field, value) in enumerate(values):
+        parts = [f"{f} = '{v}'" for f, v in values[:i]] + [f"{field} < '{value}'"]
+        conditions.append(f"({' AND '.join(parts)})")
+    return " OR ".join(conditions)
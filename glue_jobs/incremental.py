@@ -3,6 +3,8 @@
 # standard library
 import sys
 import json
+import functools
+from datetime import datetime
 
 # third party library
 import boto3
@@ -17,6 +19,9 @@ from awsglue.utils import getResolvedOptions
 from awsglue.context import GlueContext
 from awsglue.job import Job
 
+# shipped with --extra-py-files
+from glue_utils import get_lock_options
+
 # ------------------------------------------------------------------------------
 # create spark session
 # ------------------------------------------------------------------------------
@@ -46,6 +51,8 @@ args = getResolvedOptions(
         "S3URI_TABLE",
         "DATABASE_NAME",
         "TABLE_NAME",
+        "PARTITION_FIELDS",
+        "LOCK_TABLE_NAME",
     ],
 )
 job = Job(glue_ctx)
@@ -56,6 +63,33 @@ S3URI_INCREMENTAL_GLUE_JOB_TRACKER = args["S3URI_INCREMENTAL_GLUE_JOB_TRACKER"]
 S3URI_TABLE = args["S3URI_TABLE"]
 DATABASE_NAME = args["DATABASE_NAME"]
 TABLE_NAME = args["TABLE_NAME"]
+# comma separated, the create_year, ..., create_minute prefix of the granularity
+PARTITION_FIELDS = args["PARTITION_FIELDS"]
+LOCK_TABLE_NAME = args["LOCK_TABLE_NAME"]
+
+# the stream consumer may only emit the changed columns of a MODIFY event,
+# the missing columns are null and keep their current value in the table
+PARTIAL_UPDATE = False
+if "--PARTIAL_UPDATE" in sys.argv:
+    PARTIAL_UPDATE = (
+        getResolvedOptions(sys.argv, ["PARTIAL_UPDATE"])["PARTIAL_UPDATE"].lower()
+        == "true"
+    )
+
+# the daily per account aggregate table is optional
+ENABLE_AGGREGATES = "--ENABLE_AGGREGATES" in sys.argv
+if ENABLE_AGGREGATES:
+    agg_args = getResolvedOptions(
+        sys.argv,
+        [
+            "ENABLE_AGGREGATES",
+            "S3URI_AGG_TABLE",
+            "AGG_TABLE_NAME",
+        ],
+    )
+    ENABLE_AGGREGATES = agg_args["ENABLE_AGGREGATES"].lower() == "true"
+    S3URI_AGG_TABLE = agg_args["S3URI_AGG_TABLE"]
+    AGG_TABLE_NAME = agg_args["AGG_TABLE_NAME"]
 
 # ------------------------------------------------------------------------------
 # create boto3 session
@@ -72,6 +106,46 @@ print(f"aws_region = {aws_region}")
 # ------------------------------------------------------------------------------
 # ETL Logics
 # ------------------------------------------------------------------------------
+def merge_partial_updates(pdf, value_columns):
+    """
+    The partial versions of the same record carry different columns, every
+    version takes the latest non null value of each column in the batch.
+
+    A null always means "not changed", a partial update cannot set a column
+    to null. It is the same in the Hudi upsert, the
+    ``OverwriteNonDefaultsWithLatestAvroPayload`` keeps the stored value of
+    the null columns.
+    """
+    window = (
+        Window.partitionBy("id")
+        .orderBy(F.col("update_at").desc())
+        .rowsBetween(Window.unboundedPreceding, Window.unboundedFollowing)
+    )
+    for column in value_columns:
+        pdf = pdf.withColumn(column, F.first(column, ignorenulls=True).over(window))
+    return pdf
+
+
+def filter_update_at_range(pdf, start_after_partition, end_before_partition):
+    """
+    Only keep the records in the ``[start_after_partition, end_before_partition)``
+    minute range of this batch. The compacted file of an hour is read even if
+    the batch only covers part of the hour, its merged minute files may have
+    been deleted, the records of the other minutes are processed by the
+    batches they belong to. The minute of the ``update_at`` is the minute
+    partition of the record.
+    """
+    partition_format = "year=%Y/month=%m/day=%d/hour=%H/minute=%M"
+    minute_format = "%Y-%m-%dT%H:%M"
+    start = datetime.strptime(start_after_partition, partition_format)
+    end = datetime.strptime(end_before_partition, partition_format)
+    minute = F.substring(F.col("update_at"), 1, 16)
+    return pdf.filter(
+        (minute >= F.lit(start.strftime(minute_format)))
+        & (minute < F.lit(end.strftime(minute_format)))
+    )
+
+
 def show_df(pdf, n: int = 3):
     pdf.show(n, vertical=True, truncate=False)
 
@@ -83,6 +157,18 @@ def show_df_details(pdf, name: str):
     print(f"{name}.count() = {pdf.count()}")
 
 
+def read_hudi_table(s3uri: str):
+    """
+    Read the hudi table, return None if the table is not created yet.
+    """
+    try:
+        return spark_ses.read.format("hudi").load(s3uri)
+    except Exception as e:
+        if "path does not exist" in str(e).lower():
+            return None
+        raise e
+
+
 # ------------------------------------------------------------------------------
 # parse input data from s3
 # ------------------------------------------------------------------------------
@@ -100,14 +186,33 @@ s3uri_list = input_data["s3uri_list"]
 # ------------------------------------------------------------------------------
 # read data
 # ------------------------------------------------------------------------------
-pdf_incremental = glue_ctx.create_dynamic_frame.from_options(
-    connection_type="s3",
-    connection_options={
-        "paths": s3uri_list,
-    },
-    format="json",
-    format_options={"multiline": True},
-).toDF()
+# the hours fully covered by this batch may come from the hourly compacted
+# parquet files, the others are the minute level json files
+json_s3uri_list = [s3uri for s3uri in s3uri_list if s3uri.endswith(".json")]
+parquet_s3uri_list = [s3uri for s3uri in s3uri_list if s3uri.endswith(".parquet")]
+pdf_list = list()
+if json_s3uri_list:
+    pdf_list.append(
+        glue_ctx.create_dynamic_frame.from_options(
+            connection_type="s3",
+            connection_options={
+                "paths": json_s3uri_list,
+            },
+            format="json",
+            format_options={"multiline": True},
+        ).toDF()
+    )
+if parquet_s3uri_list:
+    pdf_list.append(spark_ses.read.parquet(*parquet_s3uri_list))
+pdf_incremental = functools.reduce(
+    lambda a, b: a.unionByName(b, allowMissingColumns=True),
+    pdf_list,
+)
+pdf_incremental = filter_update_at_range(
+    pdf_incremental,
+    input_data["start_after_partition"],
+    input_data["end_before_partition"],
+)
 pdf_incremental.printSchema()
 # show_df_details(pdf_incremental, "pdf_incremental")
 
@@ -151,6 +256,22 @@ pdf_incremental_1 = (
 # ------------------------------------------------------------------------------
 # only keep the latest version of each record
 # ------------------------------------------------------------------------------
+VALUE_COLUMNS = {
+    "entity": "string",
+    "amount": "long",
+    "is_credit": "long",
+    "note": "string",
+}
+# a column may be missing in the whole batch (partial updates or tombstones),
+# the written schema has to be the same as the table schema
+for column, data_type in VALUE_COLUMNS.items():
+    if column not in pdf_incremental_1.columns:
+        pdf_incremental_1 = pdf_incremental_1.withColumn(
+            column, F.lit(None).cast(data_type)
+        )
+if PARTIAL_UPDATE:
+    pdf_incremental_1 = merge_partial_updates(pdf_incremental_1, VALUE_COLUMNS)
+
 pdf_incremental_2 = (
     pdf_incremental_1.withColumn(
         "row_number",
@@ -163,6 +284,25 @@ pdf_incremental_2 = (
 )
 # show_df_details(pdf_incremental_2, "pdf_incremental_2")
 
+# ------------------------------------------------------------------------------
+# tombstones
+# the REMOVE events are applied in the same upsert commit, hudi deletes the
+# records with _hoodie_is_deleted = true
+#
+# _hoodie_is_deleted is not a hudi meta column, it is a real column of the
+# written schema, so it is in the hudi table schema, the hive synced glue
+# table and the athena query results. The deleted records are never stored,
+# the stored records always have false (null in the base files written before
+# the column was added, the initial load writes it since then)
+# ------------------------------------------------------------------------------
+if "is_deleted" in pdf_incremental_2.columns:
+    is_deleted = F.coalesce(F.col("is_deleted").cast("boolean"), F.lit(False))
+else:
+    is_deleted = F.lit(False)
+pdf_incremental_2 = pdf_incremental_2.withColumn(
+    "_hoodie_is_deleted", is_deleted
+).drop("is_deleted", "delete_source")
+
 # ------------------------------------------------------------------------------
 # write data
 # ------------------------------------------------------------------------------
@@ -175,17 +315,29 @@ additional_options = {
     "hoodie.datasource.write.operation": "upsert",
     "hoodie.datasource.write.recordkey.field": "id",
     "hoodie.datasource.write.precombine.field": "update_at",
-    "hoodie.datasource.write.partitionpath.field": "create_year,create_month,create_day,create_hour,create_minute",
+    "hoodie.datasource.write.partitionpath.field": PARTITION_FIELDS,
     "hoodie.datasource.write.hive_style_partitioning": "true",
     "hoodie.datasource.hive_sync.enable": "true",
     "hoodie.datasource.hive_sync.database": database,
     "hoodie.datasource.hive_sync.table": table,
-    "hoodie.datasource.hive_sync.partition_fields": "create_year,create_month,create_day,create_hour,create_minute",
+    "hoodie.datasource.hive_sync.partition_fields": PARTITION_FIELDS,
     "hoodie.datasource.hive_sync.partition_extractor_class": "org.apache.hudi.hive.MultiPartKeysValueExtractor",
     "hoodie.datasource.hive_sync.use_jdbc": "false",
     "hoodie.datasource.hive_sync.mode": "hms",
     "path": S3URI_TABLE,
+    **get_lock_options(table, LOCK_TABLE_NAME, aws_region),
+    # the upsert may touch a file group being clustered, let it go and let
+    # the clustering fail at the conflict check, the ingestion always wins
+    "hoodie.clustering.updates.strategy": "org.apache.hudi.client.clustering.update.strategy.SparkAllowUpdateStrategy",
 }
+if PARTIAL_UPDATE:
+    # the null columns of the incoming record don't overwrite the current value,
+    # so a column can never be set to null by an update. It is fine for this
+    # table, the stream consumer always emits a non null value for a changed
+    # column, and a removed attribute is not a supported change
+    additional_options[
+        "hoodie.datasource.write.payload.class"
+    ] = "org.apache.hudi.common.model.OverwriteNonDefaultsWithLatestAvroPayload"
 (
     pdf_incremental_2.write.format("hudi")
     .options(**additional_options)
@@ -193,4 +345,115 @@ additional_options = {
     .save()
 )
 
+
+# ------------------------------------------------------------------------------
+# maintain the daily per account aggregate table
+# the aggregates of the (account, create_date) touched by this batch are
+# recomputed from the main table after the upsert, instead of applying the
+# delta of the batch. If the job fails after the main table commit, the retry
+# recomputes the same keys from the same table, so it is idempotent, and the
+# partial updates and tombstones are already merged by hudi
+# ------------------------------------------------------------------------------
+AGG_COLUMNS = ["credit_total", "debit_total", "txn_count"]
+
+
+def compute_daily_account_summary(pdf_table, pdf_keys):
+    """
+    Recompute the daily aggregates of the ``(account, create_date)`` keys
+    from the transactions in the table. A key without transactions (all
+    deleted) gets zero aggregates, so the stale value is overwritten.
+    """
+    amount = F.col("amount").cast("long")
+    is_credit = F.col("is_credit").cast("int") == 1
+    pdf_agg = (
+        pdf_table.withColumn("create_date", F.substring(F.col("create_at"), 1, 10))
+        .join(pdf_keys, on=["account", "create_date"], how="left_semi")
+        .groupBy("account", "create_date")
+        .agg(
+            F.sum(F.when(is_credit, amount).otherwise(F.lit(0))).alias(
+                "credit_total"
+            ),
+            F.sum(F.when(is_credit, F.lit(0)).otherwise(amount)).alias(
+                "debit_total"
+            ),
+            F.count(F.lit(1)).alias("txn_count"),
+        )
+    )
+    return pdf_keys.join(pdf_agg, on=["account", "create_date"], how="left").fillna(
+        0, subset=AGG_COLUMNS
+    )
+
+
+if ENABLE_AGGREGATES:
+    pdf_keys = (
+        pdf_incremental_2.select(
+            "account",
+            F.substring(F.col("create_at"), 1, 10).alias("create_date"),
+        )
+        .distinct()
+        .localCheckpoint(eager=True)
+    )
+    # only scan the daily partitions touched by this batch
+    day_list = (
+        pdf_incremental_2.select("create_year", "create_month", "create_day")
+        .distinct()
+        .collect()
+    )
+    partition_filter = functools.reduce(
+        lambda a, b: a | b,
+        [
+            (F.col("create_year") == row.create_year)
+            & (F.col("create_month") == row.create_month)
+            & (F.col("create_day") == row.create_day)
+            for row in day_list
+        ],
+    )
+    pdf_table = read_hudi_table(S3URI_TABLE).filter(partition_filter)
+    pdf_merged = compute_daily_account_summary(pdf_table, pdf_keys)
+
+    pdf_merged = (
+        pdf_merged.withColumn(
+            "id",
+            F.concat(
+                F.lit("account:"),
+                F.col("account"),
+                F.lit(",create_date:"),
+                F.col("create_date"),
+            ),
+        )
+        .withColumn("balance", F.col("credit_total") - F.col("debit_total"))
+        .withColumn("create_year", F.substring(F.col("create_date"), 1, 4))
+        .withColumn("create_month", F.substring(F.col("create_date"), 6, 2))
+        .withColumn(
+            "update_at",
+            F.lit(datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%fZ")),
+        )
+    )
+    # show_df_details(pdf_merged, "pdf_merged")
+
+    agg_additional_options = {
+        "hoodie.table.name": AGG_TABLE_NAME,
+        "hoodie.datasource.write.storage.type": "COPY_ON_WRITE",
+        "hoodie.datasource.write.operation": "upsert",
+        "hoodie.datasource.write.recordkey.field": "id",
+        "hoodie.datasource.write.precombine.field": "update_at",
+        "hoodie.datasource.write.partitionpath.field": "create_year,create_month",
+        "hoodie.datasource.write.hive_style_partitioning": "true",
+        "hoodie.datasource.hive_sync.enable": "true",
+        "hoodie.datasource.hive_sync.database": database,
+        "hoodie.datasource.hive_sync.table": AGG_TABLE_NAME,
+        "hoodie.datasource.hive_sync.partition_fields": "create_year,create_month",
+        "hoodie.datasource.hive_sync.partition_extractor_class": "org.apache.hudi.hive.MultiPartKeysValueExtractor",
+        "hoodie.datasource.hive_sync.use_jdbc": "false",
+        "hoodie.datasource.hive_sync.mode": "hms",
+        "path": S3URI_AGG_TABLE,
+        **get_lock_options(AGG_TABLE_NAME, LOCK_TABLE_NAME, aws_region),
+    }
+    (
+        pdf_merged.write.format("hudi")
+        .options(**agg_additional_options)
+        .mode("append")
+        .save()
+    )
+
 job.commit()
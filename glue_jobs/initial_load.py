@@ -16,6 +16,9 @@ from awsglue.utils import getResolvedOptions
 from awsglue.context import GlueContext
 from awsglue.job import Job
 
+# shipped with --extra-py-files
+from glue_utils import get_lock_options
+
 # ------------------------------------------------------------------------------
 # create spark session
 # ------------------------------------------------------------------------------
@@ -45,6 +48,8 @@ args = getResolvedOptions(
         "S3URI_TABLE",
         "DATABASE_NAME",
         "TABLE_NAME",
+        "PARTITION_FIELDS",
+        "LOCK_TABLE_NAME",
     ],
 )
 job = Job(glue_ctx)
@@ -55,6 +60,9 @@ S3URI_DYNAMODB_EXPORT_TRACKER = args["S3URI_DYNAMODB_EXPORT_TRACKER"]
 S3URI_TABLE = args["S3URI_TABLE"]
 DATABASE_NAME = args["DATABASE_NAME"]
 TABLE_NAME = args["TABLE_NAME"]
+# comma separated, the create_year, ..., create_minute prefix of the granularity
+PARTITION_FIELDS = args["PARTITION_FIELDS"]
+LOCK_TABLE_NAME = args["LOCK_TABLE_NAME"]
 
 # ------------------------------------------------------------------------------
 # create boto3 session
@@ -151,6 +159,10 @@ pdf_initial = (
         "create_minute",
         F.substring(pdf_initial.create_at, 15, 2),
     )
+    # the incremental glue job writes the tombstones with this column, it is
+    # a real column of the table schema, write it from the first commit so
+    # the schema doesn't change and the old base files don't read it as null
+    .withColumn("_hoodie_is_deleted", F.lit(False))
 )
 # show_df_details(pdf_initial, "pdf_initial")
 
@@ -166,16 +178,17 @@ additional_options = {
     "hoodie.datasource.write.operation": "upsert",
     "hoodie.datasource.write.recordkey.field": "id",
     "hoodie.datasource.write.precombine.field": "update_at",
-    "hoodie.datasource.write.partitionpath.field": "create_year,create_month,create_day,create_hour,create_minute",
+    "hoodie.datasource.write.partitionpath.field": PARTITION_FIELDS,
     "hoodie.datasource.write.hive_style_partitioning": "true",
     "hoodie.datasource.hive_sync.enable": "true",
     "hoodie.datasource.hive_sync.database": database,
     "hoodie.datasource.hive_sync.table": table,
-    "hoodie.datasource.hive_sync.partition_fields": "create_year,create_month,create_day,create_hour,create_minute",
+    "hoodie.datasource.hive_sync.partition_fields": PARTITION_FIELDS,
     "hoodie.datasource.hive_sync.partition_extractor_class": "org.apache.hudi.hive.MultiPartKeysValueExtractor",
     "hoodie.datasource.hive_sync.use_jdbc": "false",
     "hoodie.datasource.hive_sync.mode": "hms",
     "path": S3URI_TABLE,
+    **get_lock_options(table, LOCK_TABLE_NAME, aws_region),
 }
 
 (
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+# standard library
+import sys
+import json
+from datetime import datetime
+
+# third party library
+import boto3
+
+# pyspark / AWS Glue stuff
+from pyspark import SparkConf
+from pyspark.sql import SparkSession
+
+from awsglue.utils import getResolvedOptions
+from awsglue.context import GlueContext
+from awsglue.job import Job
+
+# shipped with --extra-py-files
+from glue_utils import get_lock_options, get_partition_predicate
+
+# ------------------------------------------------------------------------------
+# create spark session
+# ------------------------------------------------------------------------------
+conf = (
+    SparkConf()
+    .setAppName("MyApp")
+    .setAll(
+        [
+            ("spark.serializer", "org.apache.spark.serializer.KryoSerializer"),
+            ("spark.sql.hive.convertMetastoreParquet", "false"),
+            (
+                "spark.sql.extensions",
+                "org.apache.spark.sql.hudi.HoodieSparkSessionExtension",
+            ),
+        ]
+    )
+)
+spark_ses = SparkSession.builder.config(conf=conf).enableHiveSupport().getOrCreate()
+spark_ctx = spark_ses.sparkContext
+glue_ctx = GlueContext(spark_ctx)
+
+# ------------------------------------------------------------------------------
+# resolve job parameters
+# ------------------------------------------------------------------------------
+args = getResolvedOptions(
+    sys.argv,
+    [
+        "JOB_NAME",
+        "S3URI_TABLE",
+        "S3URI_MAINTENANCE_REPORT",
+        "DATABASE_NAME",
+        "TABLE_NAME",
+        "CLEANER_COMMITS_RETAINED",
+        "ARCHIVE_MIN_COMMITS",
+        "ARCHIVE_MAX_COMMITS",
+        "SMALL_FILE_LIMIT_MB",
+        "TARGET_FILE_SIZE_MB",
+        "MIN_PARTITION_AGE_DAYS",
+        "PARTITION_FIELDS",
+        "LOCK_TABLE_NAME",
+    ],
+)
+job = Job(glue_ctx)
+job.init(args["JOB_NAME"], args)
+
+S3URI_TABLE = args["S3URI_TABLE"]
+S3URI_MAINTENANCE_REPORT = args["S3URI_MAINTENANCE_REPORT"]
+DATABASE_NAME = args["DATABASE_NAME"]
+TABLE_NAME = args["TABLE_NAME"]
+CLEANER_COMMITS_RETAINED = int(args["CLEANER_COMMITS_RETAINED"])
+ARCHIVE_MIN_COMMITS = int(args["ARCHIVE_MIN_COMMITS"])
+ARCHIVE_MAX_COMMITS = int(args["ARCHIVE_MAX_COMMITS"])
+SMALL_FILE_LIMIT_MB = int(args["SMALL_FILE_LIMIT_MB"])
+TARGET_FILE_SIZE_MB = int(args["TARGET_FILE_SIZE_MB"])
+MIN_PARTITION_AGE_DAYS = int(args["MIN_PARTITION_AGE_DAYS"])
+# comma separated, the create_year, ..., create_minute prefix of the granularity
+PARTITION_FIELDS = args["PARTITION_FIELDS"]
+LOCK_TABLE_NAME = args["LOCK_TABLE_NAME"]
+
+# ------------------------------------------------------------------------------
+# create boto3 session
+# ------------------------------------------------------------------------------
+boto_ses = boto3.session.Session()
+sts_client = boto_ses.client("sts")
+aws_account_id = sts_client.get_caller_identity()["Account"]
+aws_region = boto_ses.region_name
+
+print(f"aws_account_id = {aws_account_id}")
+print(f"aws_region = {aws_region}")
+
+s3_client = boto_ses.client("s3")
+
+
+# ------------------------------------------------------------------------------
+# ETL Logics
+# ------------------------------------------------------------------------------
+# completed instants of the write actions, ``${instant}.${action}``, the
+# requested and inflight instants have an extra suffix
+COMMIT_ACTIONS = (".commit", ".deltacommit", ".replacecommit")
+
+
+def split_s3uri(s3uri: str):
+    parts = s3uri.split("/", 3)
+    return parts[2], parts[3]
+
+
+def get_table_stats(s3uri_table: str) -> dict:
+    """
+    Count the number of files and bytes of the data files and the active
+    timeline instants of the Hudi table.
+    """
+    bucket, prefix = split_s3uri(s3uri_table)
+    stats = {
+        "n_data_files": 0,
+        "data_bytes": 0,
+        "n_small_data_files": 0,
+        "n_timeline_files": 0,
+        "timeline_bytes": 0,
+        "n_active_commits": 0,
+    }
+    small_file_limit = SMALL_FILE_LIMIT_MB * 1024 * 1024
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            key = obj["Key"][len(prefix) :]
+            if key.startswith(".hoodie/"):
+                # archived instants are not part of the active timeline
+                if key.startswith(".hoodie/archived/") is False:
+                    stats["n_timeline_files"] += 1
+                    stats["timeline_bytes"] += obj["Size"]
+                # the instants directly under .hoodie/, not the metadata table
+                if "/" not in key[len(".hoodie/") :] and key.endswith(
+                    COMMIT_ACTIONS
+                ):
+                    stats["n_active_commits"] += 1
+            elif key.endswith(".parquet"):
+                stats["n_data_files"] += 1
+                stats["data_bytes"] += obj["Size"]
+                if obj["Size"] < small_file_limit:
+                    stats["n_small_data_files"] += 1
+    return stats
+
+
+# ------------------------------------------------------------------------------
+# table services settings
+# hudi procedures pick up the hoodie.* configs from the session, archival
+# runs after the clean and clustering commits
+# ------------------------------------------------------------------------------
+for key, value in [
+    ("hoodie.cleaner.policy", "KEEP_LATEST_COMMITS"),
+    ("hoodie.cleaner.commits.retained", CLEANER_COMMITS_RETAINED),
+    ("hoodie.keep.min.commits", ARCHIVE_MIN_COMMITS),
+    ("hoodie.keep.max.commits", ARCHIVE_MAX_COMMITS),
+    ("hoodie.archive.automatic", "true"),
+    (
+        "hoodie.clustering.plan.strategy.small.file.limit",
+        SMALL_FILE_LIMIT_MB * 1024 * 1024,
+    ),
+    (
+        "hoodie.clustering.plan.strategy.target.file.max.bytes",
+        TARGET_FILE_SIZE_MB * 1024 * 1024,
+    ),
+    ("hoodie.parquet.max.file.size", TARGET_FILE_SIZE_MB * 1024 * 1024),
+    ("hoodie.datasource.hive_sync.enable", "true"),
+    ("hoodie.datasource.hive_sync.database", DATABASE_NAME),
+    ("hoodie.datasource.hive_sync.table", TABLE_NAME),
+    ("hoodie.datasource.hive_sync.mode", "hms"),
+    *get_lock_options(TABLE_NAME, LOCK_TABLE_NAME, aws_region).items(),
+]:
+    spark_ses.sql(f"SET {key}={value}")
+
+stats_before = get_table_stats(S3URI_TABLE)
+print(f"before: {json.dumps(stats_before)}")
+
+# ------------------------------------------------------------------------------
+# cleaning, remove the file versions older than the retained commits
+# ------------------------------------------------------------------------------
+spark_ses.sql(
+    f"""
+    CALL run_clean(
+        table => '{DATABASE_NAME}.{TABLE_NAME}',
+        retain_commits => {CLEANER_COMMITS_RETAINED}
+    )
+    """
+).show(truncate=False)
+
+# ------------------------------------------------------------------------------
+# file sizing, merge the small files into target size files, only in the
+# partitions not being written by the incremental job
+# ------------------------------------------------------------------------------
+predicate = get_partition_predicate(MIN_PARTITION_AGE_DAYS, PARTITION_FIELDS)
+print(f"partition predicate: {predicate}")
+spark_ses.sql(
+    f"""
+    CALL run_clustering(
+        path => '{S3URI_TABLE}',
+        predicate => "{predicate}",
+        show_involved_partition => true
+    )
+    """
+).show(truncate=False)
+
+stats_after = get_table_stats(S3URI_TABLE)
+print(f"after: {json.dumps(stats_after)}")
+
+# ------------------------------------------------------------------------------
+# verify the archival
+# the archival runs after the clean and clustering commits, but it silently
+# stops at a pending instant (for example a failed clustering), the active
+# timeline must not grow beyond ARCHIVE_MAX_COMMITS
+# ------------------------------------------------------------------------------
+is_archival_ok = stats_after["n_active_commits"] <= ARCHIVE_MAX_COMMITS
+print(f"archival ok: {is_archival_ok}")
+
+# ------------------------------------------------------------------------------
+# write the report
+# ------------------------------------------------------------------------------
+now = datetime.utcnow()
+bucket, prefix = split_s3uri(S3URI_MAINTENANCE_REPORT)
+s3_client.put_object(
+    Bucket=bucket,
+    Key=f"{prefix}{now.strftime('%Y-%m-%dT%H-%M-%S')}.json",
+    Body=json.dumps(
+        {
+            "table": f"{DATABASE_NAME}.{TABLE_NAME}",
+            "finished_at": now.isoformat(),
+            "before": stats_before,
+            "after": stats_after,
+            "is_archival_ok": is_archival_ok,
+        },
+        indent=4,
+    ),
+    ContentType="application/json",
+)
+
+if is_archival_ok is False:
+    raise RuntimeError(
+        f"the active timeline has {stats_after['n_active_commits']} commits, "
+        f"more than ARCHIVE_MAX_COMMITS = {ARCHIVE_MAX_COMMITS}, check the "
+        f"pending instants in {S3URI_TABLE}.hoodie/"
+    )
+
+job.commit()
@@ -9,10 +9,8 @@ into a list and send it to the post processor worker lambda function.
 import typing as T
 import json
 import os
-import boto3
 
-s3_client = boto3.client("s3")
-lbd_client = boto3.client("lambda")
+from dynamodb_to_datalake.lambda_runtime import get_client
 
 DYNAMODB_EXPORT_TO_S3_POST_PROCESS_WORKER_FUNCTION_NAME = os.environ[
     "DYNAMODB_EXPORT_TO_S3_POST_PROCESS_WORKER_FUNCTION_NAME"
@@ -58,6 +56,8 @@ def lambda_handler(event, context):
     parts.append("data")
     dynamodb_export_processed_prefix = "/".join(parts)
 
+    s3_client = get_client("s3")
+    lbd_client = get_client("lambda")
     res = s3_client.get_object(Bucket=bucket, Key=key)
     lines = res["Body"].read().splitlines()
 
@@ -8,9 +8,7 @@ coordinator lambda function.
 import json
 import gzip
 
-import boto3
-
-s3_client = boto3.client("s3")
+from dynamodb_to_datalake.lambda_runtime import get_client
 
 
 def lambda_handler(event, context):
@@ -21,6 +19,7 @@ def lambda_handler(event, context):
     bucket = event["bucket"]
     key_list = event["key_list"]
     dynamodb_export_processed_prefix = event["dynamodb_export_processed_prefix"]
+    s3_client = get_client("s3")
 
     lines = list()
     for key in key_list:
@@ -7,25 +7,211 @@ This script reads data from DynamoDB Stream, transform it, and save it to S3.
 
 - batch size: 100
 - batch window: 10 seconds
+- report batch item failures: the failed sequence numbers are returned, so
+  Lambda only retries from the first failed record. The retried batch also
+  carries the records after it, some of them may have been written already,
+  so the output is at least once, the downstream dedups by
+  ``(account, create_at, update_at)``. The Hudi upsert does it with the
+  ``update_at`` precombine field.
+- delete: a ``REMOVE`` event emits a tombstone with the key, the delete time
+  as ``update_at``, ``is_deleted = true`` and ``delete_source`` (``ttl`` or
+  ``user``), the incremental glue job deletes the record from Hudi.
+- sink: the cdc data is written by the sink selected by ``SINK_TYPE``, see
+  :mod:`dynamodb_to_datalake.stream_sink`.
+- timeout: the writes not finished half a second before the function timeout
+  are reported as batch item failures, see
+  :mod:`dynamodb_to_datalake.lambda_runtime`.
+- changed columns only: if ``CHANGED_COLUMNS_ONLY`` is true, a ``MODIFY`` event
+  only emits the key, ``update_at`` and the columns changed compared to the
+  ``OldImage``, the incremental glue job applies it as a partial update. The
+  missing columns keep their stored value, so a column cannot be set to null.
 """
 
 import typing as T
 import os
 import json
-import uuid
-from datetime import datetime
+import hashlib
+from datetime import datetime, timezone
 
-import boto3
+from dynamodb_to_datalake.lambda_runtime import get_deadline
+from dynamodb_to_datalake.stream_partition import group_by_partition
+from dynamodb_to_datalake.stream_sink import SinkBatch, create_sink_from_env
 
-s3_client = boto3.client("s3")
-sts_client = boto3.client("sts")
-aws_account_id = sts_client.get_caller_identity()["Account"]
-aws_region = os.environ["AWS_REGION"]
+CHANGED_COLUMNS_ONLY = os.environ.get("CHANGED_COLUMNS_ONLY", "false").lower() == "true"
+# these columns are always emitted
+KEY_COLUMNS = ("account", "create_at", "update_at")
 
-S3_BUCKET = os.environ["S3_BUCKET"]
-S3_PREFIX = os.environ["S3_PREFIX"]  # processed dynamodb stream data s3 folder
-if S3_PREFIX.endswith("/"):
-    S3_PREFIX = S3_PREFIX[:-1]
+UPDATE_AT_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%z"
+# the SequenceNumber of the oldest version collapsed into the kept record
+FIRST_SEQUENCE_NUMBER = "firstSequenceNumber"
+
+# a batch may span several minute partitions, the sink writes them
+# concurrently with one shared client, MAX_WORKERS controls the concurrency
+sink = create_sink_from_env()
+
+
+def dedup_records(records: T.List[dict]) -> T.Tuple[T.List[dict], int]:
+    """
+    Only keep the newest image of each ``(account, create_at)`` key in the
+    batch, the order is decided by the stream ``SequenceNumber``.
+
+    The kept record of a collapsed key remembers the ``SequenceNumber`` of
+    the oldest version in :data:`FIRST_SEQUENCE_NUMBER`, see
+    :func:`get_checkpoint_sequence_number`.
+
+    :return: the deduplicated records (in stream order) and the number of
+        dropped versions.
+    """
+    earliest: T.Dict[T.Tuple[str, str], dict] = dict()
+    latest: T.Dict[T.Tuple[str, str], dict] = dict()
+    for record in records:
+        keys = record["dynamodb"]["Keys"]
+        key = (keys["account"]["S"], keys["create_at"]["S"])
+        seq = int(record["dynamodb"]["SequenceNumber"])
+        existing = latest.get(key)
+        if (existing is None) or (seq > int(existing["dynamodb"]["SequenceNumber"])):
+            latest[key] = record
+        existing = earliest.get(key)
+        if (existing is None) or (seq < int(existing["dynamodb"]["SequenceNumber"])):
+            earliest[key] = record
+
+    deduped = list()
+    for key, record in latest.items():
+        first = earliest[key]
+        if first is not record:
+            # the changes of the dropped versions are part of the diff between
+            # the image before the first version and the newest image
+            dynamodb_data = dict(record["dynamodb"])
+            if "OldImage" in first["dynamodb"]:
+                dynamodb_data["OldImage"] = first["dynamodb"]["OldImage"]
+            else:
+                dynamodb_data.pop("OldImage", None)
+            record = dict(record, dynamodb=dynamodb_data)
+            record[FIRST_SEQUENCE_NUMBER] = first["dynamodb"]["SequenceNumber"]
+        deduped.append(record)
+    deduped.sort(key=lambda record: int(record["dynamodb"]["SequenceNumber"]))
+    return deduped, len(records) - len(deduped)
+
+
+def get_object_name(
+    event_source_arn: str,
+    rows: T.List[dict],
+) -> str:
+    """
+    The object name is derived from the stream and the content of the
+    partition, so a retry that writes the same rows to the same partition
+    overwrites the object written by the previous attempt.
+
+    It doesn't prevent all duplicates, a retried batch may group the rows
+    differently (more records after the failed one, a different newest
+    version in the batch), the downstream must dedup by
+    ``(account, create_at, update_at)``.
+    """
+    source_hash = hashlib.md5(event_source_arn.encode("utf-8")).hexdigest()[:8]
+    content = "\n".join(sorted(json.dumps(row, sort_keys=True) for row in rows))
+    content_hash = hashlib.md5(content.encode("utf-8")).hexdigest()
+    return f"{source_hash}-{content_hash}"
+
+
+def is_ttl_delete(record: dict) -> bool:
+    """
+    The item deleted by the DynamoDB TTL service has a special user identity.
+
+    Ref: https://docs.aws.amazon.com/amazondynamodb/latest/developerguide/time-to-live-ttl-streams.html
+    """
+    user_identity = record.get("userIdentity") or {}
+    return (user_identity.get("type") == "Service") and (
+        user_identity.get("principalId") == "dynamodb.amazonaws.com"
+    )
+
+
+def get_delete_time(record: dict) -> str:
+    """
+    The delete time in the ``update_at`` layout. It is never earlier than the
+    ``update_at`` of the deleted image, so the tombstone always wins.
+    """
+    dynamodb_data = record["dynamodb"]
+    delete_time = datetime.fromtimestamp(
+        float(dynamodb_data["ApproximateCreationDateTime"]),
+        tz=timezone.utc,
+    ).strftime(UPDATE_AT_FORMAT)
+    old_update_at = (
+        dynamodb_data.get("OldImage", {}).get("update_at", {}).get("S", "")
+    )
+    return max(delete_time, old_update_at)
+
+
+def to_tombstone(record: dict) -> dict:
+    dynamodb_data = record["dynamodb"]
+    return dict(
+        account=dynamodb_data["Keys"]["account"]["S"],
+        create_at=dynamodb_data["Keys"]["create_at"]["S"],
+        update_at=get_delete_time(record),
+        is_deleted=True,
+        delete_source="ttl" if is_ttl_delete(record) else "user",
+    )
+
+
+def to_cdc_data(record: dict) -> dict:
+    """
+    Parse the dynamodb stream record into the cdc data.
+    """
+    if record["eventName"] == "REMOVE":
+        return to_tombstone(record)
+    dynamodb_data = record["dynamodb"]
+    data = dict(
+        account=dynamodb_data["Keys"]["account"]["S"],
+        create_at=dynamodb_data["Keys"]["create_at"]["S"],
+        update_at=dynamodb_data["NewImage"]["update_at"]["S"],
+        entity=dynamodb_data["NewImage"]["entity"]["S"],
+        amount=int(dynamodb_data["NewImage"]["amount"]["N"]),
+        is_credit=int(dynamodb_data["NewImage"]["is_credit"]["N"]),
+        note=dynamodb_data["NewImage"]["note"]["S"],
+    )
+    if CHANGED_COLUMNS_ONLY and ("OldImage" in dynamodb_data):
+        new_image = dynamodb_data["NewImage"]
+        old_image = dynamodb_data["OldImage"]
+        data = {
+            column: value
+            for column, value in data.items()
+            if (column in KEY_COLUMNS)
+            or (new_image.get(column) != old_image.get(column))
+        }
+    return data
+
+
+def get_checkpoint_sequence_number(record: dict) -> str:
+    """
+    The sequence number to report if the record is not written. Lambda
+    retries from the smallest reported one, for a collapsed key it has to be
+    the oldest version. Otherwise the retry starts after the older versions,
+    the ``OldImage`` of the retried record is an intermediate image, and the
+    columns only changed by the older versions are not emitted in the
+    changed columns only mode.
+    """
+    return record.get(FIRST_SEQUENCE_NUMBER, record["dynamodb"]["SequenceNumber"])
+
+
+def get_update_at(record: dict) -> str:
+    if record["eventName"] == "REMOVE":
+        return get_delete_time(record)
+    return record["dynamodb"]["NewImage"]["update_at"]["S"]
+
+
+def to_sink_batch(
+    partition: str,
+    records: T.List[dict],
+) -> SinkBatch:
+    """
+    Convert the stream records of one partition into the sink batch.
+    """
+    rows = [to_cdc_data(record) for record in records]
+    return SinkBatch(
+        partition=partition,
+        name=get_object_name(records[0]["eventSourceARN"], rows),
+        rows=rows,
+        sequence_numbers=[get_checkpoint_sequence_number(record) for record in records],
+    )
 
 
 def lambda_handler(event, context):
@@ -33,58 +219,35 @@ def lambda_handler(event, context):
     print(f"received {len(records)} records")
     # print(records[:3]) # for debug only
 
-    groups: T.Dict[str, T.List[dict]] = dict()  # partition data by update_at
-    for record in records:
-        if record["eventName"] == "REMOVE":  # ignore delete event
-            continue
-
-        # parse dynamodb stream record
-        dynamodb_data = record["dynamodb"]
-        account = dynamodb_data["Keys"]["account"]["S"]
-        create_at = dynamodb_data["Keys"]["create_at"]["S"]
-        update_at = dynamodb_data["NewImage"]["update_at"]["S"]
-        entity = dynamodb_data["NewImage"]["entity"]["S"]
-        amount = int(dynamodb_data["NewImage"]["amount"]["N"])
-        is_credit = int(dynamodb_data["NewImage"]["is_credit"]["N"])
-        note = dynamodb_data["NewImage"]["note"]["S"]
-
-        data = dict(
-            account=account,
-            create_at=create_at,
-            update_at=update_at,
-            entity=entity,
-            amount=amount,
-            is_credit=is_credit,
-            note=note,
-        )
+    # the same key may be updated several times in one batch, only the
+    # newest image (or the tombstone) matters, and it decides the partition
+    # of the record
+    records, n_dropped = dedup_records(records)
+    print(f"dropped {n_dropped} older versions of the same key in the batch")
+    n_tombstones = sum(record["eventName"] == "REMOVE" for record in records)
+    print(f"emit {n_tombstones} tombstones")
 
-        # partition data by update_at, this field indicate when this record is updated
-        update_at_datetime = datetime.strptime(update_at, "%Y-%m-%dT%H:%M:%S.%f%z")
-        year = str(update_at_datetime.year).zfill(4)
-        month = str(update_at_datetime.month).zfill(2)
-        day = str(update_at_datetime.day).zfill(2)
-        hour = str(update_at_datetime.hour).zfill(2)
-        minute = str(update_at_datetime.minute).zfill(2)
-        partition = f"{year}-{month}-{day}-{hour}-{minute}"
-        try:
-            groups[partition].append(data)
-        except KeyError:
-            groups[partition] = [data]
-
-    # write cdc data to s3 by partition
-    for partition, data_list in groups.items():
-        year, month, day, hour, minute = partition.split("-")
-        bucket = S3_BUCKET
-        key = (
-            f"{S3_PREFIX}"
-            f"/year={year}/month={month}/day={day}/hour={hour}/minute={minute}"
-            f"/{uuid.uuid4().hex}.json"
-        )
-        lines = [json.dumps(data) for data in data_list]
-        print(f"write {len(data_list)} records to s3://{bucket}/{key}")
-        s3_client.put_object(
-            Bucket=bucket,
-            Key=key,
-            Body="\n".join(lines),
-            ContentType="application/json",
+    # partition data by update_at, this field indicate when this record is updated
+    groups = group_by_partition(records, get_update_at)
+
+    # write cdc data by partition, the sink flushes the partitions concurrently,
+    # the writes not finished before the deadline are reported as failures
+    # instead of timing out the whole batch
+    deadline = get_deadline(context)
+    failed_batches = list()
+    for partition, group in groups.items():
+        failed_batches.extend(
+            sink.put(to_sink_batch(partition, group), deadline=deadline)
         )
+    failed_batches.extend(sink.flush(deadline=deadline))
+    failed_sequence_numbers = [
+        seq for batch in failed_batches for seq in batch.sequence_numbers
+    ]
+
+    # lambda retries the batch from the smallest failed sequence number
+    failed_sequence_numbers.sort(key=int)
+    return {
+        "batchItemFailures": [
+            {"itemIdentifier": seq} for seq in failed_sequence_numbers
+        ]
+    }
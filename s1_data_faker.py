@@ -1,8 +1,18 @@
 # -*- coding: utf-8 -*-
 
-from dynamodb_to_datalake.data_faker import run_data_faker
+from dynamodb_to_datalake.data_faker import run_data_faker, run_load_generator
 
-run_data_faker(
-    sleep_millisecond=10,
-    # verbose=False,
-)
+# set to True to run the high TPS load test with batch writes instead
+load_test = False
+
+if load_test:
+    run_load_generator(
+        target_tps=1000,
+        n_workers=8,
+        duration_seconds=600,
+    )
+else:
+    run_data_faker(
+        sleep_millisecond=10,
+        # verbose=False,
+    )
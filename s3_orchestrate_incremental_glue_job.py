@@ -1,9 +1,17 @@
 # -*- coding: utf-8 -*-
 
 import time
-from dynamodb_to_datalake.glue_job import run_incremental_glue_job
+from dynamodb_to_datalake.glue_job import (
+    run_stream_compaction,
+    run_incremental_glue_job,
+    run_clustering_glue_job,
+    run_maintenance_glue_job,
+)
 
 while 1:
+    run_stream_compaction(epoch_processed_partition="year=2023/month=08/day=01/hour=00/minute=00")
     run_incremental_glue_job(epoch_processed_partition="year=2023/month=08/day=01/hour=00/minute=00")
+    run_clustering_glue_job()
+    run_maintenance_glue_job()
     print("waiting 60 seconds ...")
     time.sleep(60)
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from dynamodb_to_datalake.lambda_runtime import reset_clients
+
+
+@pytest.fixture(autouse=True)
+def fresh_lambda_clients():
+    """
+    The Lambda runtime caches the boto3 clients in the module, a client
+    created by a test outside of the moto mock must not leak into the others.
+    """
+    reset_clients()
+    yield
+    reset_clients()
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+
+"""
+Local replay harness of the dynamodb stream consumer Lambda function.
+
+It generates realistic DynamoDB stream event payloads (INSERT, MODIFY with
+``OldImage``, user and TTL REMOVE) with configurable volume and key skew, and
+drives the ``lambda_handler`` in process. Use it with a moto S3 backend or
+the local sink, see ``tests/test_dynamodb_stream_consumer.py`` and
+``benchmarks/bench_stream_consumer.py``. It is a test utility, not part of the
+library package.
+
+[CN]
+
+在本地重放 DynamoDB Stream 事件, 不需要部署 Lambda 就能测试 handler 的正确性,
+以及测量 handler 热路径上每个阶段的耗时, 吞吐量和内存分配, 以便在部署前发现
+性能回退.
+"""
+
+import typing as T
+import os
+import sys
+import time
+import random
+import itertools
+import tracemalloc
+import importlib.util
+import dataclasses
+from unittest.mock import patch
+from datetime import datetime, timedelta, timezone
+
+from dynamodb_to_datalake.paths import (
+    dir_project_root,
+    path_lbd_func_dynamodb_stream_consumer,
+)
+
+UPDATE_AT_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%z"
+
+EVENT_SOURCE_ARN = (
+    "arn:aws:dynamodb:us-east-1:111122223333:table/transactions"
+    "/stream/2023-08-01T00:00:00.000"
+)
+
+
+def to_image(item: dict) -> dict:
+    """
+    Serialize the transaction item into the dynamodb json image.
+    """
+    return {
+        "account": {"S": item["account"]},
+        "create_at": {"S": item["create_at"]},
+        "update_at": {"S": item["update_at"]},
+        "entity": {"S": item["entity"]},
+        "amount": {"N": str(item["amount"])},
+        "is_credit": {"N": str(item["is_credit"])},
+        "note": {"S": item["note"]},
+    }
+
+
+def make_stream_record(
+    event_name: str,
+    sequence_number: int,
+    new_item: T.Optional[dict],
+    old_item: T.Optional[dict],
+    approximate_creation_time: datetime,
+    is_ttl: bool = False,
+) -> dict:
+    """
+    Make one DynamoDB stream record with the ``NEW_AND_OLD_IMAGES`` view.
+    """
+    item = new_item if new_item is not None else old_item
+    dynamodb_data = {
+        "ApproximateCreationDateTime": int(approximate_creation_time.timestamp()),
+        "Keys": {
+            "account": {"S": item["account"]},
+            "create_at": {"S": item["create_at"]},
+        },
+        "SequenceNumber": str(sequence_number),
+        "SizeBytes": 256,
+        "StreamViewType": "NEW_AND_OLD_IMAGES",
+    }
+    if new_item is not None:
+        dynamodb_data["NewImage"] = to_image(new_item)
+    if old_item is not None:
+        dynamodb_data["OldImage"] = to_image(old_item)
+    record = {
+        "eventID": str(sequence_number),
+        "eventName": event_name,
+        "eventVersion": "1.1",
+        "eventSource": "aws:dynamodb",
+        "awsRegion": "us-east-1",
+        "dynamodb": dynamodb_data,
+        "eventSourceARN": EVENT_SOURCE_ARN,
+    }
+    if is_ttl:
+        record["userIdentity"] = {
+            "type": "Service",
+            "principalId": "dynamodb.amazonaws.com",
+        }
+    return record
+
+
+@dataclasses.dataclass
+class StreamEventGenerator:
+    """
+    Generate the Lambda event payloads of a DynamoDB stream.
+
+    :param n_accounts: number of distinct accounts.
+    :param skew: the account of a new transaction follows a zipf like
+        distribution, weight = 1 / rank ** skew. 0 means uniform, the larger
+        the more skewed.
+    :param update_ratio: the chance of an event updating an existing item.
+    :param delete_ratio: the chance of an event deleting an existing item.
+    :param ttl_ratio: the chance of a delete being a TTL delete.
+    :param hot_items: the updates and deletes pick from the most recent N
+        items, smaller means more repeated updates of the same key in a batch.
+    :param events_per_second: the pace of the ``update_at`` clock, it decides
+        how many minute partitions a batch spans.
+    :param start: the ``update_at`` of the first event.
+    :param seed: random seed.
+    """
+
+    n_accounts: int = dataclasses.field(default=1000)
+    skew: float = dataclasses.field(default=1.0)
+    update_ratio: float = dataclasses.field(default=0.3)
+    delete_ratio: float = dataclasses.field(default=0.05)
+    ttl_ratio: float = dataclasses.field(default=0.5)
+    hot_items: int = dataclasses.field(default=100)
+    events_per_second: float = dataclasses.field(default=1.0)
+    start: datetime = dataclasses.field(
+        default_factory=lambda: datetime(2023, 8, 1, tzinfo=timezone.utc)
+    )
+    seed: T.Optional[int] = dataclasses.field(default=None)
+
+    def __post_init__(self):
+        self._random = random.Random(self.seed)
+        self._accounts = [f"{i:012d}" for i in range(self.n_accounts)]
+        self._cum_weights = list(
+            itertools.accumulate(
+                1 / (rank**self.skew) for rank in range(1, self.n_accounts + 1)
+            )
+        )
+        self._items: T.List[dict] = list()
+        self._sequence_number = 100000000000000000000
+        self._now = self.start
+
+    def _next_item(self, account: str, create_at: str) -> dict:
+        return {
+            "account": account,
+            "create_at": create_at,
+            "update_at": self._now.strftime(UPDATE_AT_FORMAT),
+            "entity": self._random.choice(["Amazon", "Apple", "Google", "Tesla"]),
+            "amount": self._random.randint(1, 10000),
+            "is_credit": self._random.randint(0, 1),
+            "note": self._random.choice(["", "groceries", "rent", "refund"]),
+        }
+
+    def next_record(self) -> dict:
+        self._sequence_number += 1
+        self._now += timedelta(seconds=1 / self.events_per_second)
+        dice = self._random.random()
+        n_hot_items = min(self.hot_items, len(self._items))
+        if n_hot_items:
+            index = len(self._items) - self._random.randint(1, n_hot_items)
+        if n_hot_items and dice < self.delete_ratio:
+            old_item = self._items.pop(index)
+            return make_stream_record(
+                event_name="REMOVE",
+                sequence_number=self._sequence_number,
+                new_item=None,
+                old_item=old_item,
+                approximate_creation_time=self._now,
+                is_ttl=self._random.random() < self.ttl_ratio,
+            )
+        elif n_hot_items and dice < self.delete_ratio + self.update_ratio:
+            old_item = self._items[index]
+            new_item = self._next_item(old_item["account"], old_item["create_at"])
+            self._items[index] = new_item
+            return make_stream_record(
+                event_name="MODIFY",
+                sequence_number=self._sequence_number,
+                new_item=new_item,
+                old_item=old_item,
+                approximate_creation_time=self._now,
+            )
+        else:
+            account = self._random.choices(
+                self._accounts, cum_weights=self._cum_weights
+            )[0]
+            new_item = self._next_item(account, self._now.strftime(UPDATE_AT_FORMAT))
+            self._items.append(new_item)
+            return make_stream_record(
+                event_name="INSERT",
+                sequence_number=self._sequence_number,
+                new_item=new_item,
+                old_item=None,
+                approximate_creation_time=self._now,
+            )
+
+    def generate_events(
+        self,
+        n_records: int,
+        batch_size: int = 100,
+    ) -> T.List[dict]:
+        """
+        :return: the Lambda event payloads, each one has ``batch_size`` records.
+        """
+        events = list()
+        for i in range(0, n_records, batch_size):
+            records = [
+                self.next_record() for _ in range(min(batch_size, n_records - i))
+            ]
+            events.append({"Records": records})
+        return events
+
+
+def load_handler_module(env: T.Dict[str, str]):
+    """
+    Load a fresh copy of the stream consumer Lambda module with the given
+    environment variables, it reads them at import time. The environment
+    is restored after the import, so it doesn't leak into other tests.
+    """
+    if str(dir_project_root) not in sys.path:
+        sys.path.insert(0, str(dir_project_root))
+    spec = importlib.util.spec_from_file_location(
+        path_lbd_func_dynamodb_stream_consumer.fname,
+        str(path_lbd_func_dynamodb_stream_consumer),
+    )
+    module = importlib.util.module_from_spec(spec)
+    with patch.dict(os.environ, env):
+        spec.loader.exec_module(module)
+    return module
+
+
+@dataclasses.dataclass
+class ReplayReport:
+    """
+    :param n_records: number of the stream records replayed.
+    :param n_events: number of the handler invocations.
+    :param n_failures: number of the reported batch item failures.
+    :param elapsed: the end to end handler time in seconds.
+    :param phases: the phase name to seconds mapping, measured separately.
+    :param peak_memory: the peak traced memory in bytes during the replay.
+    :param n_allocations: number of the memory blocks allocated by the replay
+        that are still alive at the end.
+    """
+
+    n_records: int = dataclasses.field()
+    n_events: int = dataclasses.field()
+    n_failures: int = dataclasses.field()
+    elapsed: float = dataclasses.field()
+    phases: T.Dict[str, float] = dataclasses.field(default_factory=dict)
+    peak_memory: int = dataclasses.field(default=0)
+    n_allocations: int = dataclasses.field(default=0)
+
+    @property
+    def records_per_second(self) -> float:
+        return self.n_records / self.elapsed if self.elapsed else 0.0
+
+
+def replay(module, events: T.List[dict]) -> T.Tuple[int, float]:
+    """
+    Call the ``lambda_handler`` with each event.
+
+    :return: the number of the batch item failures and the elapsed seconds.
+    """
+    n_failures = 0
+    start = time.perf_counter()
+    for event in events:
+        response = module.lambda_handler(event, None)
+        n_failures += len(response["batchItemFailures"])
+    return n_failures, time.perf_counter() - start
+
+
+def profile_phases(module, events: T.List[dict]) -> T.Dict[str, float]:
+    """
+    Run the hot path of the handler phase by phase, in the same order as
+    ``lambda_handler``, and sum the time of each phase.
+    """
+    phases = dict(dedup=0.0, partition=0.0, serialize=0.0, write=0.0)
+    for event in events:
+        start = time.perf_counter()
+        records, _ = module.dedup_records(event["Records"])
+        phases["dedup"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        groups = module.group_by_partition(records, module.get_update_at)
+        phases["partition"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        batches = [
+            module.to_sink_batch(partition, group)
+            for partition, group in groups.items()
+        ]
+        phases["serialize"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        for batch in batches:
+            module.sink.put(batch)
+        module.sink.flush()
+        phases["write"] += time.perf_counter() - start
+    return phases
+
+
+def run_replay(
+    module,
+    events: T.List[dict],
+    trace_memory: bool = True,
+) -> ReplayReport:
+    """
+    Replay the events and collect the throughput, per phase timings and
+    memory allocations. Each one is measured in its own pass, so tracing
+    doesn't slow down the throughput measurement. The sink writes are
+    idempotent, replaying the same events several times is safe.
+    """
+    n_failures, elapsed = replay(module, events)
+    phases = profile_phases(module, events)
+    peak_memory = 0
+    n_allocations = 0
+    if trace_memory:
+        tracemalloc.start()
+        snapshot_before = tracemalloc.take_snapshot()
+        replay(module, events)
+        snapshot_after = tracemalloc.take_snapshot()
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        n_allocations = sum(
+            stat.count_diff
+            for stat in snapshot_after.compare_to(snapshot_before, "filename")
+        )
+    return ReplayReport(
+        n_records=sum(len(event["Records"]) for event in events),
+        n_events=len(events),
+        n_failures=n_failures,
+        elapsed=elapsed,
+        phases=phases,
+        peak_memory=peak_memory,
+        n_allocations=n_allocations,
+    )
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+from s3pathlib import S3Path
+
+from dynamodb_to_datalake.athena_sql import wrap_unload, normalize_sql
+
+
+def test_normalize_sql():
+    sql = """
+    SELECT  *
+    FROM db.t
+    WHERE note = 'a  b'   ;
+    """
+    assert normalize_sql(sql) == "SELECT * FROM db.t WHERE note = 'a  b'"
+    assert normalize_sql("SELECT\t1;") == normalize_sql("SELECT 1")
+    # the white spaces in the string literals are kept, '' is an escaped quote
+    assert (
+        normalize_sql("SELECT 'it''s  ok',\n 'x  y'")
+        == "SELECT 'it''s  ok', 'x  y'"
+    )
+    assert normalize_sql("SELECT ';'") == "SELECT ';'"
+
+
+def test_wrap_unload():
+    s3dir = S3Path("s3://bucket/unload/abc/")
+    assert wrap_unload("SELECT 1;\n", s3dir) == (
+        "UNLOAD (SELECT 1) TO 's3://bucket/unload/abc/' "
+        "WITH (format = 'PARQUET', compression = 'SNAPPY')"
+    )
+
+
+if __name__ == "__main__":
+    from dynamodb_to_datalake.tests.helper import run_cov_test
+
+    run_cov_test(__file__, "dynamodb_to_datalake.athena_sql")
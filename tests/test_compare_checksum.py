@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+"""
+The Athena SQL twins are executed in sqlite with the Presto functions they
+use registered as python functions.
+"""
+
+import math
+import sqlite3
+import hashlib
+
+import pytest
+
+from dynamodb_to_datalake.compare_diff import KEY
+from dynamodb_to_datalake.compare_checksum import (
+    row_hash,
+    row_hash_sql,
+    Bucketizer,
+    merge_checksums,
+    to_checksum_df,
+    find_mismatch_buckets,
+    ChecksumSpill,
+    checksum_records,
+)
+
+rows = [
+    {
+        KEY: f"account:{account},create_at:{create_at}",
+        "account": account,
+        "create_at": create_at,
+        "update_at": create_at,
+        "entity": entity,
+        "amount": amount,
+        "is_credit": is_credit,
+        "note": note,
+    }
+    for account, create_at, entity, amount, is_credit, note in [
+        ("a", "2023-08-01T00:00:00.000000+0000", "Amazon", 10, 1, "x"),
+        ("a", "2023-08-01T13:07:00.000000+0000", "Apple", -3, 0, None),
+        ("b", "2023-12-31T23:59:59.999999+0000", None, None, None, None),
+        ("ü", "2024-02-29T01:02:03.000000+0000", "Café", 0, 1, "|"),
+    ]
+]
+rows += [
+    dict(rows[0], **{KEY: f"account:a,create_at:{i}"}) for i in range(200)
+]
+
+
+def presto_mod(a: int, b: int) -> int:
+    # presto mod has the sign of the dividend
+    return int(math.fmod(a, b))
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.create_function("md5", 1, lambda b: hashlib.md5(b).digest())
+    conn.create_function("to_utf8", 1, lambda s: s.encode("utf-8"))
+    conn.create_function(
+        "from_big_endian_64", 1, lambda b: int.from_bytes(b, "big", signed=True)
+    )
+    conn.create_function(
+        "from_big_endian_32", 1, lambda b: int.from_bytes(b, "big", signed=True)
+    )
+    conn.create_function("concat", -1, lambda *args: "".join(args))
+    conn.create_function("mod", 2, presto_mod)
+    conn.execute(
+        "CREATE TABLE t (id TEXT, account TEXT, create_at TEXT, update_at TEXT, "
+        "entity TEXT, amount INTEGER, is_credit INTEGER, note TEXT, "
+        "create_year TEXT, create_month TEXT, create_day TEXT, "
+        "create_hour TEXT, create_minute TEXT)"
+    )
+    conn.executemany(
+        "INSERT INTO t VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (
+                row[KEY],
+                row["account"],
+                row["create_at"],
+                row["update_at"],
+                row["entity"],
+                row["amount"],
+                row["is_credit"],
+                row["note"],
+                row["create_at"][0:4],
+                row["create_at"][5:7],
+                row["create_at"][8:10],
+                row["create_at"][11:13],
+                row["create_at"][14:16],
+            )
+            for row in rows
+        ],
+    )
+    yield conn
+    conn.close()
+
+
+def test_row_hash_sql(conn):
+    results = conn.execute(f"SELECT {row_hash_sql()} FROM t").fetchall()
+    assert [result[0] for result in results] == [row_hash(row) for row in rows]
+
+
+@pytest.mark.parametrize(
+    "bucketizer",
+    [
+        Bucketizer(n_buckets=7),
+        Bucketizer(n_buckets=1024),
+        Bucketizer(bucket_by="partition", granularity="year"),
+        Bucketizer(bucket_by="partition", granularity="day"),
+        Bucketizer(bucket_by="partition", granularity="minute"),
+    ],
+)
+def test_bucket_sql(conn, bucketizer):
+    results = conn.execute(f"SELECT {bucketizer.bucket_sql()} FROM t").fetchall()
+    assert [result[0] for result in results] == [
+        bucketizer.get_bucket(row) for row in rows
+    ]
+
+
+def test_bucketizer_validation():
+    with pytest.raises(ValueError):
+        Bucketizer(bucket_by="hash")
+    with pytest.raises(ValueError):
+        Bucketizer(granularity="second")
+
+
+def test_checksum_and_spill(tmp_path):
+    bucketizer = Bucketizer(n_buckets=8)
+    spill = ChecksumSpill(dir_root=tmp_path)
+    assert spill.read(["0"]).shape[0] == 0
+
+    # the checksum doesn't depend on how the rows are batched
+    checksums = dict()
+    for i in range(0, len(rows), 50):
+        other = dict()
+        checksum_records(rows[i : i + 50], bucketizer, other, spill=spill)
+        merge_checksums(checksums, other)
+    expected = dict()
+    checksum_records(rows, bucketizer, expected)
+    assert checksums == expected
+    assert sum(n_rows for n_rows, _ in checksums.values()) == len(rows)
+
+    df_source = to_checksum_df(checksums)
+    changed_row = dict(rows[5], amount=999)
+    df_hudi = to_checksum_df(
+        {
+            bucket: (n_rows, checksum ^ row_hash(rows[5]) ^ row_hash(changed_row))
+            if bucket == bucketizer.get_bucket(rows[5])
+            else (n_rows, checksum)
+            for bucket, (n_rows, checksum) in checksums.items()
+        }
+    )
+    buckets = find_mismatch_buckets(df_source, df_hudi)
+    assert buckets == [bucketizer.get_bucket(rows[5])]
+
+    # only the rows in the mismatch buckets are read back
+    df = spill.read(buckets)
+    assert df.shape[0] == checksums[buckets[0]][0]
+    assert rows[5][KEY] in df[KEY].to_list()
+    assert "bucket" not in df.columns
+
+
+if __name__ == "__main__":
+    from dynamodb_to_datalake.tests.helper import run_cov_test
+
+    run_cov_test(__file__, "dynamodb_to_datalake.compare_checksum")
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+from datetime import datetime
+
+import polars as pl
+
+from dynamodb_to_datalake.compare_diff import (
+    KEY,
+    HUDI_SUFFIX,
+    to_df,
+    _is_different,
+    DiffResult,
+    diff,
+    make_id,
+    watermark_to_instant,
+    cap_watermark,
+    exclude_changed_after,
+    BucketSpill,
+    diff_by_bucket,
+)
+
+
+def make_row(i: int, **kwargs) -> dict:
+    row = {
+        KEY: make_id("a", str(i)),
+        "account": "a",
+        "create_at": str(i),
+        "update_at": str(i),
+        "entity": "Amazon",
+        "amount": i,
+        "is_credit": 1,
+        "note": None,
+    }
+    row.update(kwargs)
+    return row
+
+
+def test_is_different():
+    df = pl.DataFrame(
+        {
+            "note": [None, None, "a", "a", "a"],
+            f"note{HUDI_SUFFIX}": [None, "a", None, "a", "b"],
+        }
+    )
+    assert df.select(_is_different("note").alias("x"))["x"].to_list() == [
+        False,
+        True,
+        True,
+        False,
+        True,
+    ]
+
+
+def test_diff():
+    df_dynamodb = to_df([make_row(1), make_row(2), make_row(3, note="x")])
+    df_hudi = to_df([make_row(2), make_row(3), make_row(4)])
+    diff_result = diff(df_dynamodb, df_hudi)
+    assert diff_result.missing[KEY].to_list() == [make_row(1)[KEY]]
+    assert diff_result.extra[KEY].to_list() == [make_row(4)[KEY]]
+    assert diff_result.changed[KEY].to_list() == [make_row(3)[KEY]]
+    assert diff_result.changed[f"note{HUDI_SUFFIX}"].to_list() == [None]
+    assert diff_result.is_same is False
+
+    # the column order and data type of the query result don't matter
+    df_hudi = df_dynamodb.select(list(reversed(df_dynamodb.columns))).with_columns(
+        pl.col("amount").cast(pl.Utf8)
+    )
+    assert diff(df_dynamodb, df_hudi).is_same
+    assert diff(to_df([]), pl.DataFrame()).is_same
+
+
+def test_watermark_to_instant():
+    assert (
+        watermark_to_instant("2023-08-01T10:20:30.123456+0000")
+        == "20230801102030123"
+    )
+    assert (
+        watermark_to_instant("2023-08-01T10:20:30.123456+0800")
+        == "20230801022030123"
+    )
+
+
+
+def test_cap_watermark():
+    watermark = "2023-08-01T10:20:30.123456+0000"
+    # hudi has loaded the stream data after the watermark
+    assert cap_watermark(watermark, datetime(2023, 8, 1, 10, 21)) == watermark
+    assert cap_watermark(watermark, datetime(2023, 8, 1, 10, 20)) == watermark
+    # hudi lags behind, the changes after the last processed minute are excluded
+    assert (
+        cap_watermark(watermark, datetime(2023, 8, 1, 10, 15))
+        == "2023-08-01T10:15:59.999999+0000"
+    )
+    assert (
+        cap_watermark("2023-08-01T18:20:30.123456+0800", datetime(2023, 8, 1, 10, 19))
+        == "2023-08-01T10:19:59.999999+0000"
+    )
+
+
+def test_exclude_changed_after():
+    watermark = "5"
+    df_source = to_df([make_row(1), make_row(2), make_row(3), make_row(4)])
+    df_hudi = to_df(
+        [
+            make_row(1),
+            # updated after the export
+            make_row(2, update_at="6", amount=-1),
+            # row 3 is deleted after the export, row 4 is not changed
+            make_row(4),
+        ]
+    )
+    assert diff(df_source, df_hudi).is_same is False
+
+    # only the hudi side updates are known without the stream data
+    df_source_, df_hudi_ = exclude_changed_after(df_source, df_hudi, watermark)
+    diff_result = diff(df_source_, df_hudi_)
+    assert diff_result.missing[KEY].to_list() == [make_id("a", "3")]
+    assert diff_result.changed.shape[0] == 0
+
+    # the tombstone in the stream data excludes the deleted record
+    df_source_, df_hudi_ = exclude_changed_after(
+        df_source,
+        df_hudi,
+        watermark,
+        changed_keys={make_id("a", "2"), make_id("a", "3")},
+    )
+    assert diff(df_source_, df_hudi_).is_same
+    assert df_source_[KEY].to_list() == [make_id("a", "1"), make_id("a", "4")]
+
+    # row 1 is updated before the watermark, but hudi hasn't loaded it yet
+    df_hudi = to_df([make_row(1, amount=-1), make_row(2), make_row(3)])
+    df_source = to_df([make_row(1, update_at="4"), make_row(2), make_row(3)])
+    df_source_, df_hudi_ = exclude_changed_after(
+        df_source,
+        df_hudi,
+        watermark="3",
+        changed_keys={make_id("a", "1")},
+    )
+    assert diff(df_source_, df_hudi_).is_same
+    assert df_source_[KEY].to_list() == [make_id("a", "2"), make_id("a", "3")]
+
+
+def test_diff_by_bucket(tmp_path):
+    rows_dynamodb = [make_row(i) for i in range(100)]
+    rows_hudi = [
+        make_row(i, amount=-1) if i % 10 == 0 else make_row(i)
+        for i in range(5, 105)
+    ]
+    spill_dynamodb = BucketSpill(tmp_path.joinpath("dynamodb"), n_buckets=8)
+    spill_hudi = BucketSpill(tmp_path.joinpath("hudi"), n_buckets=8)
+    # many batches
+    for i in range(0, 100, 30):
+        spill_dynamodb.write(to_df(rows_dynamodb[i : i + 30]))
+        spill_hudi.write(to_df(rows_hudi[i : i + 30]))
+    assert sum(spill_dynamodb.read(bucket).shape[0] for bucket in range(8)) == 100
+
+    expected = diff(to_df(rows_dynamodb), to_df(rows_hudi))
+    diff_result = diff_by_bucket(spill_dynamodb, spill_hudi)
+    for name in ["missing", "extra", "changed"]:
+        assert sorted(getattr(diff_result, name)[KEY].to_list()) == sorted(
+            getattr(expected, name)[KEY].to_list()
+        )
+    assert diff_result.changed.shape[0] == 9
+
+    def prepare(df_dynamodb, df_hudi):
+        return df_dynamodb.filter(pl.col("amount") >= 5), df_hudi
+
+    diff_result = diff_by_bucket(spill_dynamodb, spill_hudi, prepare=prepare)
+    assert diff_result.missing.shape[0] == 0
+
+
+def test_diff_by_bucket_same(tmp_path):
+    spill_dynamodb = BucketSpill(tmp_path.joinpath("dynamodb"), n_buckets=4)
+    spill_hudi = BucketSpill(tmp_path.joinpath("hudi"), n_buckets=4)
+    spill_dynamodb.write_batches([to_df([make_row(1)]), to_df([])])
+    spill_hudi.write(to_df([make_row(1)]))
+    assert diff_by_bucket(spill_dynamodb, spill_hudi).is_same
+    assert DiffResult.concat([]).is_same
+
+
+if __name__ == "__main__":
+    from dynamodb_to_datalake.tests.helper import run_cov_test
+
+    run_cov_test(__file__, "dynamodb_to_datalake.compare_diff")
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from dynamodb_to_datalake.config_define import Config
+
+
+def test_partition_granularity():
+    # the default is the layout of the existing tables
+    config = Config(app_name="app", aws_profile="default")
+    assert config.hudi_partition_fields == (
+        "create_year,create_month,create_day,create_hour,create_minute"
+    )
+    config = Config(app_name="app", aws_profile="default", partition_granularity="day")
+    assert config.hudi_partition_fields == "create_year,create_month,create_day"
+    with pytest.raises(ValueError):
+        Config(app_name="app", aws_profile="default", partition_granularity="week")
+
+
+if __name__ == "__main__":
+    from dynamodb_to_datalake.tests.helper import run_cov_test
+
+    run_cov_test(__file__, "dynamodb_to_datalake.config_define")
@@ -7,6 +7,25 @@ def test():
     _ = config
     _ = config.app_name
     _ = config.aws_profile
+    _ = config.partition_granularity
+    _ = config.hudi_partition_fields
+    _ = config.enable_partition_projection
+    _ = config.enable_aggregates
+    _ = config.clustering_sort_columns
+    _ = config.clustering_layout_strategy
+    _ = config.clustering_min_partition_age_days
+    _ = config.clustering_interval_hours
+    _ = config.enable_changed_columns_only
+    _ = config.enable_stream_compaction
+    _ = config.stream_compaction_lag_minutes
+    _ = config.stream_compaction_source_retention_minutes
+    _ = config.stream_sink_type
+    _ = config.maintenance_interval_hours
+    _ = config.maintenance_cleaner_commits_retained
+    _ = config.maintenance_archive_min_commits
+    _ = config.maintenance_archive_max_commits
+    _ = config.maintenance_small_file_limit_mb
+    _ = config.maintenance_target_file_size_mb
     _ = config.bsm
     _ = config.aws_account_id
     _ = config.aws_region
@@ -21,11 +40,15 @@ def test():
     _ = config.cloudformation_stack_name
     _ = config.glue_database
     _ = config.glue_table
+    _ = config.glue_table_daily_account_summary
+    _ = config.hudi_lock_table
     _ = config.lambda_function_name_dynamodb_stream_consumer
     _ = config.lambda_function_name_dynamodb_export_to_s3_post_process_coordinator
     _ = config.lambda_function_name_dynamodb_export_to_s3_post_process_worker
     _ = config.glue_job_name_initial_load
     _ = config.glue_job_name_incremental
+    _ = config.glue_job_name_clustering
+    _ = config.glue_job_name_maintenance
     _ = config.s3_bucket_artifacts
     _ = config.s3_bucket_data
     _ = config.s3_bucket_glue_assets
@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+
+import json
+from datetime import datetime, timezone
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from stream_replay import (
+    StreamEventGenerator,
+    make_stream_record,
+    load_handler_module,
+    replay,
+    run_replay,
+)
+
+BUCKET = "test-bucket"
+PREFIX = "dynamodb_stream"
+SINK_ENV = {"S3_BUCKET": BUCKET, "S3_PREFIX": f"{PREFIX}/", "SINK_TYPE": "s3_json"}
+
+
+@pytest.fixture
+def s3_client(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        s3_client = boto3.client("s3")
+        s3_client.create_bucket(Bucket=BUCKET)
+        yield s3_client
+
+
+def read_all_rows(s3_client) -> list:
+    rows = list()
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=BUCKET, Prefix=f"{PREFIX}/"):
+        for obj in page.get("Contents", []):
+            body = s3_client.get_object(Bucket=BUCKET, Key=obj["Key"])["Body"]
+            rows.extend(json.loads(line) for line in body.read().splitlines())
+    return rows
+
+
+def test_lambda_handler(s3_client, monkeypatch):
+    monkeypatch.setenv("CHANGED_COLUMNS_ONLY", "false")
+    module = load_handler_module(
+        {"S3_BUCKET": BUCKET, "S3_PREFIX": f"{PREFIX}/", "SINK_TYPE": "s3_json"}
+    )
+    generator = StreamEventGenerator(
+        n_accounts=10,
+        hot_items=5,
+        events_per_second=0.5,
+        seed=1,
+    )
+    events = generator.generate_events(n_records=300, batch_size=100)
+    n_failures, _ = replay(module, events)
+    assert n_failures == 0
+
+    # one row per distinct key in each batch, the replay is idempotent
+    expected = sum(
+        len(module.dedup_records(event["Records"])[0]) for event in events
+    )
+    assert len(read_all_rows(s3_client)) == expected
+    report = run_replay(module, events)
+    assert report.n_records == 300
+    assert set(report.phases) == {"dedup", "partition", "serialize", "write"}
+    assert len(read_all_rows(s3_client)) == expected
+
+    rows = read_all_rows(s3_client)
+    tombstones = [row for row in rows if row.get("is_deleted")]
+    assert tombstones
+    assert {row["delete_source"] for row in tombstones} <= {"ttl", "user"}
+
+
+def test_lambda_handler_retry(s3_client, monkeypatch):
+    monkeypatch.setenv("CHANGED_COLUMNS_ONLY", "false")
+    module = load_handler_module(
+        {"S3_BUCKET": BUCKET, "S3_PREFIX": f"{PREFIX}/", "SINK_TYPE": "s3_json"}
+    )
+    (event,) = StreamEventGenerator(n_accounts=5, seed=1).generate_events(
+        n_records=100, batch_size=100
+    )
+    assert module.lambda_handler(event, None) == {"batchItemFailures": []}
+    rows = read_all_rows(s3_client)
+
+    # the same batch overwrites the same objects
+    module.lambda_handler(event, None)
+    assert len(read_all_rows(s3_client)) == len(rows)
+
+    # lambda retries from a failed record in the middle, the partitions are
+    # grouped differently and some rows are written twice
+    retry_event = dict(event, Records=event["Records"][50:])
+    module.lambda_handler(retry_event, None)
+    rows_after_retry = read_all_rows(s3_client)
+    assert len(rows_after_retry) > len(rows)
+
+    # they are the same after dedup by (account, create_at, update_at)
+    def dedup(rows):
+        return {
+            (row["account"], row["create_at"], row["update_at"]): row for row in rows
+        }
+
+    assert dedup(rows_after_retry) == dedup(rows)
+
+
+def make_item(update_at: str, **kwargs) -> dict:
+    item = {
+        "account": "a",
+        "create_at": "2023-08-01T00:00:00.000000+0000",
+        "update_at": update_at,
+        "entity": "Amazon",
+        "amount": 1,
+        "is_credit": 0,
+        "note": "",
+    }
+    item.update(kwargs)
+    return item
+
+
+def make_modify(sequence_number: int, old_item: dict, new_item: dict) -> dict:
+    return make_stream_record(
+        event_name="MODIFY",
+        sequence_number=sequence_number,
+        new_item=new_item,
+        old_item=old_item,
+        approximate_creation_time=datetime(2023, 8, 1, tzinfo=timezone.utc),
+    )
+
+
+def test_to_cdc_data_changed_columns_only():
+    module = load_handler_module({**SINK_ENV, "CHANGED_COLUMNS_ONLY": "true"})
+    v0 = make_item("2023-08-01T00:00:00.000000+0000")
+    v1 = make_item("2023-08-01T00:00:01.000000+0000", note="rent")
+    assert module.to_cdc_data(make_modify(1, v0, v1)) == {
+        "account": v1["account"],
+        "create_at": v1["create_at"],
+        "update_at": v1["update_at"],
+        "note": "rent",
+    }
+    # the INSERT doesn't have the OldImage, all columns are emitted
+    record = make_stream_record(
+        event_name="INSERT",
+        sequence_number=1,
+        new_item=v0,
+        old_item=None,
+        approximate_creation_time=datetime(2023, 8, 1, tzinfo=timezone.utc),
+    )
+    assert module.to_cdc_data(record) == v0
+
+    module = load_handler_module({**SINK_ENV, "CHANGED_COLUMNS_ONLY": "false"})
+    assert module.to_cdc_data(make_modify(1, v0, v1)) == v1
+
+
+def test_dedup_records_first_old_image():
+    module = load_handler_module({**SINK_ENV, "CHANGED_COLUMNS_ONLY": "true"})
+    v0 = make_item("2023-08-01T00:00:00.000000+0000")
+    v1 = make_item("2023-08-01T00:00:01.000000+0000", amount=2)
+    v2 = make_item("2023-08-01T00:00:02.000000+0000", amount=2, note="rent")
+    records, n_dropped = module.dedup_records(
+        [make_modify(2, v1, v2), make_modify(1, v0, v1)]
+    )
+    assert n_dropped == 1
+    (record,) = records
+    assert record["dynamodb"]["SequenceNumber"] == "2"
+    # the amount changed by the dropped version is not lost
+    assert record["dynamodb"]["OldImage"]["amount"] == {"N": "1"}
+    assert module.to_cdc_data(record) == {
+        "account": v2["account"],
+        "create_at": v2["create_at"],
+        "update_at": v2["update_at"],
+        "amount": 2,
+        "note": "rent",
+    }
+
+    # created in the same batch, the newest image is emitted as a whole
+    insert = make_stream_record(
+        event_name="INSERT",
+        sequence_number=1,
+        new_item=v1,
+        old_item=None,
+        approximate_creation_time=datetime(2023, 8, 1, tzinfo=timezone.utc),
+    )
+    (record,), _ = module.dedup_records([insert, make_modify(2, v1, v2)])
+    assert "OldImage" not in record["dynamodb"]
+    assert module.to_cdc_data(record) == v2
+
+
+def make_remove(old_item: dict, delete_time: datetime, is_ttl: bool) -> dict:
+    return make_stream_record(
+        event_name="REMOVE",
+        sequence_number=1,
+        new_item=None,
+        old_item=old_item,
+        approximate_creation_time=delete_time,
+        is_ttl=is_ttl,
+    )
+
+
+def test_get_delete_time():
+    module = load_handler_module(SINK_ENV)
+    old_item = make_item("2023-08-01T00:00:01.500000+0000")
+    record = make_remove(
+        old_item, datetime(2023, 8, 1, 0, 0, 5, tzinfo=timezone.utc), is_ttl=False
+    )
+    assert module.get_delete_time(record) == "2023-08-01T00:00:05.000000+0000"
+
+    # ApproximateCreationDateTime is rounded down to the second, the delete
+    # happened right after the last update in the same second
+    record = make_remove(
+        old_item, datetime(2023, 8, 1, 0, 0, 1, tzinfo=timezone.utc), is_ttl=False
+    )
+    assert module.get_delete_time(record) == old_item["update_at"]
+    assert module.get_update_at(record) == old_item["update_at"]
+
+
+def test_to_tombstone():
+    module = load_handler_module(SINK_ENV)
+    old_item = make_item("2023-08-01T00:00:00.000000+0000")
+    delete_time = datetime(2023, 8, 1, 0, 1, tzinfo=timezone.utc)
+    expected = {
+        "account": old_item["account"],
+        "create_at": old_item["create_at"],
+        "update_at": "2023-08-01T00:01:00.000000+0000",
+        "is_deleted": True,
+    }
+    record = make_remove(old_item, delete_time, is_ttl=True)
+    assert module.is_ttl_delete(record) is True
+    assert module.to_cdc_data(record) == {**expected, "delete_source": "ttl"}
+
+    record = make_remove(old_item, delete_time, is_ttl=False)
+    assert module.is_ttl_delete(record) is False
+    assert module.to_cdc_data(record) == {**expected, "delete_source": "user"}
+
+    # only the dynamodb service principal is the TTL delete
+    record["userIdentity"] = {"type": "Service", "principalId": "lambda.amazonaws.com"}
+    assert module.is_ttl_delete(record) is False
+
+
+def merge_cdc_rows(rows: list) -> dict:
+    """
+    Apply the cdc rows the way the incremental glue job and Hudi do in
+    partial update mode, the null (missing) columns keep the stored value.
+    """
+    table = dict()
+    for row in sorted(rows, key=lambda row: row["update_at"]):
+        key = (row["account"], row["create_at"])
+        if row.get("is_deleted"):
+            table.pop(key, None)
+        else:
+            table[key] = {**table.get(key, {}), **row}
+    return table
+
+
+def test_lambda_handler_changed_columns_only(s3_client):
+    module = load_handler_module({**SINK_ENV, "CHANGED_COLUMNS_ONLY": "true"})
+    generator = StreamEventGenerator(
+        n_accounts=10,
+        update_ratio=0.6,
+        hot_items=5,
+        events_per_second=0.5,
+        seed=2,
+    )
+    events = generator.generate_events(n_records=500, batch_size=50)
+    n_failures, _ = replay(module, events)
+    assert n_failures == 0
+
+    rows = read_all_rows(s3_client)
+    # some updates only carry the changed columns
+    assert any("entity" not in row for row in rows if not row.get("is_deleted"))
+    expected = {
+        (item["account"], item["create_at"]): item for item in generator._items
+    }
+    assert merge_cdc_rows(rows) == expected
+
+
+def test_lambda_handler_failure(s3_client, monkeypatch):
+    module = load_handler_module(
+        {"S3_BUCKET": "not-exists-bucket", "S3_PREFIX": PREFIX, "SINK_TYPE": "s3_json"}
+    )
+    events = StreamEventGenerator(seed=1).generate_events(n_records=10)
+    records, _ = module.dedup_records(events[0]["Records"])
+    response = module.lambda_handler(events[0], None)
+    assert [item["itemIdentifier"] for item in response["batchItemFailures"]] == sorted(
+        [module.get_checkpoint_sequence_number(record) for record in records],
+        key=int,
+    )
+
+
+def test_lambda_handler_failure_collapsed_key(s3_client):
+    v0 = make_item("2023-08-01T00:00:00.000000+0000")
+    v1 = make_item("2023-08-01T00:00:01.000000+0000", amount=2)
+    v2 = make_item("2023-08-01T00:00:02.000000+0000", amount=2, note="rent")
+    event = {
+        "Records": [
+            dict(make_modify(1, v0, v1), eventSourceARN="arn"),
+            dict(make_modify(2, v1, v2), eventSourceARN="arn"),
+        ]
+    }
+
+    # the sink fails, the oldest version of the collapsed key is reported
+    module = load_handler_module(
+        {**SINK_ENV, "S3_BUCKET": "not-exists-bucket", "CHANGED_COLUMNS_ONLY": "true"}
+    )
+    response = module.lambda_handler(event, None)
+    assert response == {"batchItemFailures": [{"itemIdentifier": "1"}]}
+
+    # lambda replays from the reported checkpoint, both changes are emitted
+    module = load_handler_module({**SINK_ENV, "CHANGED_COLUMNS_ONLY": "true"})
+    checkpoint = int(response["batchItemFailures"][0]["itemIdentifier"])
+    retry_event = dict(
+        event,
+        Records=[
+            record
+            for record in event["Records"]
+            if int(record["dynamodb"]["SequenceNumber"]) >= checkpoint
+        ],
+    )
+    assert module.lambda_handler(retry_event, None) == {"batchItemFailures": []}
+    (row,) = read_all_rows(s3_client)
+    assert row["amount"] == 2
+    assert row["note"] == "rent"
+
+
+if __name__ == "__main__":
+    from dynamodb_to_datalake.tests.helper import run_cov_test
+
+    run_cov_test(__file__, "lambda_functions.dynamodb_stream_consumer")
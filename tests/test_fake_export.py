@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import json
+import base64
+import hashlib
+from datetime import datetime
+
+import pytest
+from moto import mock_aws
+from boto_session_manager import BotoSesManager
+
+from dynamodb_to_datalake.compare_diff import DATE_FORMAT
+from dynamodb_to_datalake.fake_export import (
+    FakeExportGenerator,
+    get_zipf_cum_weights,
+)
+from dynamodb_to_datalake.vendor.aws_dynamodb_export_to_s3 import Export
+
+BUCKET = "test-bucket"
+PREFIX = "exports"
+
+
+def get_md5_checksum(content: bytes) -> str:
+    return base64.b64encode(hashlib.md5(content).digest()).decode("utf-8")
+
+
+def test_get_zipf_cum_weights():
+    assert get_zipf_cum_weights(3, 0) == [1, 2, 3]
+    assert get_zipf_cum_weights(3, 1) == pytest.approx([1, 1.5, 1.5 + 1 / 3])
+
+
+def test_generate_data_file():
+    generator = FakeExportGenerator(n_items=10, n_files=3, seed=1)
+    assert [generator.get_file_item_count(ith) for ith in range(3)] == [4, 3, 3]
+    # the same seed generates the same file
+    assert generator.generate_data_file(0) == FakeExportGenerator(
+        n_items=10, n_files=3, seed=1
+    ).generate_data_file(0)
+
+    _, content, n_items = generator.generate_data_file(0)
+    items = [
+        json.loads(line)["Item"]
+        for line in gzip.decompress(content).decode("utf-8").splitlines()
+    ]
+    assert len(items) == n_items == 4
+    for item in items:
+        create_at = datetime.strptime(item["create_at"]["S"], DATE_FORMAT)
+        update_at = datetime.strptime(item["update_at"]["S"], DATE_FORMAT)
+        assert generator.start <= create_at <= update_at <= generator.end
+        assert item["account"]["S"] in generator._accounts
+
+
+def test_write_to_dir(tmp_path):
+    generator = FakeExportGenerator(n_items=50, n_files=3, seed=1)
+    summary = generator.write_to_dir(tmp_path, s3_prefix=PREFIX, verbose=False)
+    assert summary["itemCount"] == 50
+
+    manifest_files = tmp_path.joinpath(summary["manifestFilesS3Key"])
+    n_items = 0
+    for line in manifest_files.read_text().splitlines():
+        data = json.loads(line)
+        content = tmp_path.joinpath(data["dataFileS3Key"]).read_bytes()
+        assert data["md5Checksum"] == get_md5_checksum(content)
+        assert data["etag"] == hashlib.md5(content).hexdigest()
+        lines = gzip.decompress(content).decode("utf-8").splitlines()
+        assert len(lines) == data["itemCount"]
+        n_items += data["itemCount"]
+    assert n_items == summary["itemCount"]
+
+
+@pytest.fixture
+def bsm():
+    with mock_aws():
+        bsm = BotoSesManager(region_name="us-east-1")
+        bsm.s3_client.create_bucket(Bucket=BUCKET)
+        yield bsm
+
+
+def test_write_to_s3(bsm):
+    generator = FakeExportGenerator(n_items=100, n_files=4, seed=1)
+    summary = generator.write_to_s3(bsm.s3_client, BUCKET, PREFIX, verbose=False)
+
+    # read it back with the same code that reads the real export
+    export = Export(
+        arn=generator.export_arn,
+        status="COMPLETED",
+        s3_bucket=BUCKET,
+        s3_prefix=PREFIX,
+        export_format="DYNAMODB_JSON",
+    )
+    manifest_summary = export.get_manifest_summary(None, bsm.s3_client)
+    assert manifest_summary.item_count == 100
+    assert manifest_summary.output_format == "DYNAMODB_JSON"
+    assert manifest_summary.export_time == generator.end
+    assert manifest_summary.start_time <= manifest_summary.end_time
+    assert manifest_summary.billed_size_bytes == summary["billedSizeBytes"]
+
+    data_files = export.get_data_files(None, bsm.s3_client)
+    assert len(data_files) == 4
+    assert sum(data_file.item_count for data_file in data_files) == 100
+    for data_file in data_files:
+        content = bsm.s3_client.get_object(Bucket=BUCKET, Key=data_file.s3_key)[
+            "Body"
+        ].read()
+        assert data_file.md5 == get_md5_checksum(content)
+        assert len(data_file.read_items(bsm.s3_client)) == data_file.item_count
+
+    items = list(export.read_items(None, bsm.s3_client))
+    assert len(items) == 100
+    assert set(items[0]) == {
+        "account",
+        "create_at",
+        "update_at",
+        "entity",
+        "amount",
+        "is_credit",
+        "note",
+    }
+
+
+if __name__ == "__main__":
+    from dynamodb_to_datalake.tests.helper import run_cov_test
+
+    run_cov_test(__file__, "dynamodb_to_datalake.fake_export")
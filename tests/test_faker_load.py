@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+
+import pytest
+
+from dynamodb_to_datalake.faker_load import (
+    RateLimiter,
+    LoadStats,
+    get_percentile,
+)
+
+
+def test_rate_limiter():
+    rate_limiter = RateLimiter(rate=1000)
+    n_threads, n_acquire = 4, 25
+
+    def worker():
+        for _ in range(n_acquire):
+            rate_limiter.acquire(1)
+
+    threads = [threading.Thread(target=worker) for _ in range(n_threads)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+    # 100 permits at 1000 per second across all the threads
+    assert 0.09 <= elapsed < 0.5
+
+
+def test_rate_limiter_no_burst():
+    rate_limiter = RateLimiter(rate=100)
+    rate_limiter.acquire(1)
+    # the workers fall behind, the unused permits are not accumulated
+    time.sleep(0.1)
+    start = time.monotonic()
+    rate_limiter.acquire(1)
+    rate_limiter.acquire(5)
+    rate_limiter.acquire(1)
+    assert time.monotonic() - start >= 0.05
+
+
+def test_load_stats():
+    stats = LoadStats()
+
+    def worker():
+        for _ in range(1000):
+            stats.add("insert", 2, 0.01)
+            stats.add("update", 1, 0.02)
+            stats.add_conflict(1)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats.add("delete", 1, 0.03)
+    stats.add_error(2)
+
+    assert (stats.n_insert, stats.n_update, stats.n_delete) == (8000, 4000, 1)
+    assert stats.n_conflict == 4000
+    assert stats.n_error == 2
+    # the conflicts are not writes
+    assert stats.n_total == 12001
+    assert len(stats.pop_latencies()) == 8001
+    assert stats.pop_latencies() == []
+
+
+def test_get_percentile():
+    assert get_percentile([], 0.5) == 0.0
+    values = [float(i) for i in range(1, 101)]
+    assert get_percentile(values, 0.5) == 51.0
+    assert get_percentile(values, 0.99) == 100.0
+    assert get_percentile(values, 1.0) == 100.0
+    assert get_percentile([1.0], 0.99) == pytest.approx(1.0)
+
+
+if __name__ == "__main__":
+    from dynamodb_to_datalake.tests.helper import run_cov_test
+
+    run_cov_test(__file__, "dynamodb_to_datalake.faker_load")
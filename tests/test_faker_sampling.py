@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import random
+import sqlite3
+import hashlib
+import dataclasses
+from collections import Counter
+
+from dynamodb_to_datalake.faker_sampling import (
+    AccountReservoir,
+    RecentTransactionCache,
+    AccountHashSample,
+    get_sample_accounts_sql,
+)
+
+
+@dataclasses.dataclass
+class Txn:
+    account: str
+    create_at: int
+    note: str = ""
+
+
+def test_account_reservoir():
+    reservoir = AccountReservoir(max_size=10, rnd=random.Random(1))
+    for i in range(5):
+        reservoir.add(f"a{i}")
+    reservoir.add("a0")
+    assert len(reservoir) == 5
+    assert reservoir.n_seen == 5
+
+    for i in range(5, 1000):
+        reservoir.add(f"a{i}")
+    assert len(reservoir) == 10
+    assert reservoir.n_seen == 1000
+    assert len(set(reservoir[i] for i in range(10))) == 10
+    assert all(reservoir[i] in reservoir for i in range(10))
+
+
+def test_account_reservoir_uniform():
+    counter = Counter()
+    rnd = random.Random(1)
+    n_round = 2000
+    for _ in range(n_round):
+        reservoir = AccountReservoir(max_size=5, rnd=rnd)
+        for i in range(20):
+            reservoir.add(str(i))
+        counter.update(reservoir[i] for i in range(5))
+    # every account is kept with probability 5 / 20
+    for i in range(20):
+        assert abs(counter[str(i)] / n_round - 0.25) < 0.05
+
+
+def test_recent_transaction_cache():
+    cache = RecentTransactionCache(max_accounts=2, n_per_account=2)
+    assert cache.pick() is None
+
+    cache.put(Txn("a", 1))
+    cache.put(Txn("a", 2))
+    cache.put(Txn("a", 3))
+    assert [t.create_at for t in cache.get("a")] == [2, 3]
+    # the update of the same transaction replaces the old version
+    cache.put(Txn("a", 2, note="updated"))
+    assert [(t.create_at, t.note) for t in cache.get("a")] == [(3, ""), (2, "updated")]
+
+    cache.put(Txn("b", 1))
+    cache.put(Txn("a", 4))  # a is the most recent
+    cache.put(Txn("c", 1))  # b is evicted
+    assert len(cache) == 2
+    assert cache.get("b") == []
+    assert sorted(cache._accounts) == ["a", "c"]
+    assert {k: cache._accounts[v] for k, v in cache._account_index.items()} == {
+        "a": "a",
+        "c": "c",
+    }
+
+
+def test_recent_transaction_cache_pick():
+    cache = RecentTransactionCache(max_accounts=50, n_per_account=3)
+    rnd = random.Random(1)
+    for i in range(500):
+        cache.put(Txn(f"a{rnd.randrange(100)}", i))
+        assert len(cache._accounts) == len(cache) <= 50
+    for _ in range(1000):
+        txn = cache.pick(rnd)
+        assert txn in cache.get(txn.account)
+    # every cached account can be picked
+    picked = {cache.pick(rnd).account for _ in range(5000)}
+    assert picked == set(cache._accounts)
+
+
+def make_accounts(n: int):
+    rnd = random.Random(1)
+    return [f"{rnd.randrange(1000):03d}-{rnd.randrange(10000):04d}" for _ in range(n)]
+
+
+def test_account_hash_sample():
+    accounts = make_accounts(3000)
+    sample = AccountHashSample(max_size=100, seed=7)
+    sample.add_many(accounts)
+    assert len(sample.accounts) == 100
+    assert len(set(sample.accounts)) == 100
+
+    # the duplicates and the order of the input don't change the sample
+    other = AccountHashSample(max_size=100, seed=7)
+    other.add_many(reversed(accounts + accounts[:500]))
+    assert other.accounts == sample.accounts
+
+    # the same as sorting all the distinct accounts by the hash
+    def key(account):
+        return hashlib.md5(f"7:{account}".encode("utf-8")).digest()
+
+    assert sample.accounts == sorted(set(accounts), key=key)[:100]
+    # a different seed is a different sample
+    other = AccountHashSample(max_size=100, seed=8)
+    other.add_many(accounts)
+    assert other.accounts != sample.accounts
+
+
+def test_get_sample_accounts_sql():
+    accounts = make_accounts(3000)
+    # run the sql in sqlite with the presto functions it uses
+    conn = sqlite3.connect(":memory:")
+    conn.create_function("to_utf8", 1, lambda s: s.encode("utf-8"))
+    conn.create_function("md5", 1, lambda b: hashlib.md5(b).digest())
+    conn.create_function("concat", 2, lambda a, b: a + b)
+    conn.execute("ATTACH DATABASE ':memory:' AS db")
+    conn.execute("CREATE TABLE db.t (account TEXT)")
+    conn.executemany("INSERT INTO db.t VALUES (?)", [(a,) for a in accounts])
+
+    sql = get_sample_accounts_sql(database="db", table="t", n_sample=100, seed=7)
+    rows = [row[0] for row in conn.execute(sql)]
+    sample = AccountHashSample(max_size=100, seed=7)
+    sample.add_many(accounts)
+    assert rows == sample.accounts
+
+
+if __name__ == "__main__":
+    from dynamodb_to_datalake.tests.helper import run_cov_test
+
+    run_cov_test(__file__, "dynamodb_to_datalake.faker_sampling")
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from dynamodb_to_datalake.glue_catalog import (
+    get_partition_fields,
+    get_partition_projection_parameters,
+    update_glue_table_parameters,
+)
+
+
+def test_get_partition_fields():
+    assert get_partition_fields("year") == ["create_year"]
+    assert get_partition_fields("day") == ["create_year", "create_month", "create_day"]
+    assert len(get_partition_fields("minute")) == 5
+    with pytest.raises(ValueError):
+        get_partition_fields("second")
+
+
+def test_get_partition_projection_parameters():
+    # the default is the minute partitions of the existing tables
+    parameters = get_partition_projection_parameters("s3://bucket/table")
+    assert parameters["storage.location.template"].endswith(
+        "/create_minute=${create_minute}/"
+    )
+
+    parameters = get_partition_projection_parameters(
+        "s3://bucket/table",
+        partition_fields=get_partition_fields("day"),
+    )
+    assert parameters["projection.enabled"] == "true"
+    assert parameters["projection.create_day.range"] == "1,31"
+    assert parameters["projection.create_month.digits"] == "2"
+    assert "projection.create_hour.type" not in parameters
+    assert parameters["storage.location.template"] == (
+        "s3://bucket/table/create_year=${create_year}"
+        "/create_month=${create_month}/create_day=${create_day}/"
+    )
+
+    parameters = get_partition_projection_parameters(
+        "s3://bucket/table/",
+        partition_fields=get_partition_fields("minute"),
+        year_range="2023,2030",
+    )
+    assert parameters["projection.create_year.range"] == "2023,2030"
+    assert parameters["projection.create_minute.range"] == "0,59"
+    assert parameters["storage.location.template"].endswith(
+        "/create_minute=${create_minute}/"
+    )
+
+    with pytest.raises(ValueError):
+        get_partition_projection_parameters(
+            "s3://bucket/table/",
+            partition_fields=["create_year", "create_day"],
+        )
+
+
+class FakeGlueClient:
+    """
+    Only the ``get_table`` and ``update_table`` calls used by the tests.
+    """
+
+    def __init__(self, table: dict):
+        self.table = table
+        self.n_updates = 0
+
+    def get_table(self, DatabaseName: str, Name: str):
+        if Name != self.table["Name"]:
+            raise Exception("EntityNotFoundException: Table not found")
+        return {"Table": dict(self.table, DatabaseName=DatabaseName)}
+
+    def update_table(self, DatabaseName: str, TableInput: dict):
+        self.table = TableInput
+        self.n_updates += 1
+
+
+def test_update_glue_table_parameters():
+    glue_client = FakeGlueClient(
+        {"Name": "t", "TableType": "EXTERNAL_TABLE", "Parameters": {"a": "1"}}
+    )
+    assert update_glue_table_parameters(glue_client, "db", "t", {"b": "2"})
+    # the existing parameters are kept, the read only keys are not sent
+    assert glue_client.table == {
+        "Name": "t",
+        "TableType": "EXTERNAL_TABLE",
+        "Parameters": {"a": "1", "b": "2"},
+    }
+    # already up-to-date
+    assert update_glue_table_parameters(glue_client, "db", "t", {"b": "2"}) is False
+    assert update_glue_table_parameters(glue_client, "db", "x", {"b": "2"}) is False
+    assert glue_client.n_updates == 1
+
+
+if __name__ == "__main__":
+    from dynamodb_to_datalake.tests.helper import run_cov_test
+
+    run_cov_test(__file__, "dynamodb_to_datalake.glue_catalog")
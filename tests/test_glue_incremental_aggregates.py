@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+"""
+The glue job script runs top level code at import, we only load the
+aggregate function definitions from it and run them with a local spark.
+"""
+
+import ast
+
+import pytest
+
+pyspark = pytest.importorskip("pyspark")
+
+from pyspark.sql import SparkSession
+from pyspark.sql import functions as F
+
+from dynamodb_to_datalake.paths import dir_project_root
+
+path_glue_script = dir_project_root.joinpath("glue_jobs", "incremental.py")
+
+
+def load_functions(*names: str) -> dict:
+    tree = ast.parse(path_glue_script.read_text())
+    nodes = [
+        node
+        for node in tree.body
+        if (isinstance(node, ast.FunctionDef) and node.name in names)
+        or (
+            isinstance(node, ast.Assign)
+            and any(
+                getattr(target, "id", None) == "AGG_COLUMNS"
+                for target in node.targets
+            )
+        )
+    ]
+    namespace = {"F": F}
+    code = compile(
+        ast.Module(body=nodes, type_ignores=[]),
+        str(path_glue_script),
+        "exec",
+    )
+    exec(code, namespace)
+    return namespace
+
+
+@pytest.fixture(scope="module")
+def spark():
+    spark = SparkSession.builder.master("local[1]").getOrCreate()
+    yield spark
+    spark.stop()
+
+
+def to_dict(pdf) -> dict:
+    return {
+        (row.account, row.create_date): (
+            row.credit_total,
+            row.debit_total,
+            row.txn_count,
+        )
+        for row in pdf.collect()
+    }
+
+
+def test_compute_daily_account_summary_retry(spark):
+    compute_daily_account_summary = load_functions("compute_daily_account_summary")[
+        "compute_daily_account_summary"
+    ]
+    columns = ["account", "create_at", "amount", "is_credit"]
+    # the main table after the batch is upserted, the transaction
+    # ("b", "2023-08-01T02") is deleted by the batch
+    pdf_table = spark.createDataFrame(
+        [
+            ("a", "2023-08-01T00", 10, 1),
+            ("a", "2023-08-01T01", 3, 0),
+            ("a", "2023-08-02T00", 7, 1),
+        ],
+        columns,
+    )
+    pdf_keys = spark.createDataFrame(
+        [("a", "2023-08-01"), ("b", "2023-08-01")],
+        ["account", "create_date"],
+    )
+    expected = {
+        ("a", "2023-08-01"): (10, 3, 2),
+        ("b", "2023-08-01"): (0, 0, 0),
+    }
+    assert to_dict(compute_daily_account_summary(pdf_table, pdf_keys)) == expected
+    # the aggregate write failed after the main table commit, the retry
+    # upserts the same batch again (no-op) and recomputes the same result
+    assert to_dict(compute_daily_account_summary(pdf_table, pdf_keys)) == expected
+
+
+if __name__ == "__main__":
+    from dynamodb_to_datalake.tests.helper import run_cov_test
+
+    run_cov_test(__file__, "glue_jobs.incremental")
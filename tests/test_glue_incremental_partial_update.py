@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+"""
+The glue job script runs top level code at import, we only load the
+functions under test from it and run them with a local spark.
+"""
+
+import ast
+from datetime import datetime
+
+import pytest
+
+pyspark = pytest.importorskip("pyspark")
+
+from pyspark.sql import SparkSession
+from pyspark.sql import functions as F
+from pyspark.sql.window import Window
+
+from dynamodb_to_datalake.paths import dir_project_root
+
+path_glue_script = dir_project_root.joinpath("glue_jobs", "incremental.py")
+
+
+def load_function(name: str):
+    tree = ast.parse(path_glue_script.read_text())
+    nodes = [
+        node
+        for node in tree.body
+        if isinstance(node, ast.FunctionDef) and node.name == name
+    ]
+    namespace = {"F": F, "Window": Window, "datetime": datetime}
+    code = compile(
+        ast.Module(body=nodes, type_ignores=[]),
+        str(path_glue_script),
+        "exec",
+    )
+    exec(code, namespace)
+    return namespace[name]
+
+
+def load_merge_partial_updates():
+    return load_function("merge_partial_updates")
+
+
+@pytest.fixture(scope="module")
+def spark():
+    spark = SparkSession.builder.master("local[1]").getOrCreate()
+    yield spark
+    spark.stop()
+
+
+def test_merge_partial_updates(spark):
+    merge_partial_updates = load_merge_partial_updates()
+    pdf = spark.createDataFrame(
+        [
+            # full version, then two partial updates
+            ("a", "1", "Amazon", 1, ""),
+            ("a", "3", None, None, "rent"),
+            ("a", "2", None, 2, None),
+            # only one partial update in the batch
+            ("b", "1", None, 5, None),
+        ],
+        "id string, update_at string, entity string, amount long, note string",
+    )
+    pdf = merge_partial_updates(pdf, ["entity", "amount", "note"])
+    rows = {
+        (row.id, row.update_at): (row.entity, row.amount, row.note)
+        for row in pdf.collect()
+    }
+    # every version of a carries the merged values, the latest one is kept
+    assert rows[("a", "3")] == ("Amazon", 2, "rent")
+    assert rows[("a", "1")] == ("Amazon", 2, "rent")
+    # the columns not in the batch stay null, hudi keeps the stored value
+    assert rows[("b", "1")] == (None, 5, None)
+
+
+def test_filter_update_at_range(spark):
+    filter_update_at_range = load_function("filter_update_at_range")
+    pdf = spark.createDataFrame(
+        [
+            ("a", "2023-08-01T01:10:00.000000+0000"),
+            ("b", "2023-08-01T01:21:00.000000+0000"),
+            ("c", "2023-08-01T01:39:59.000000+0000"),
+            ("d", "2023-08-01T01:40:00.000000+0000"),
+        ],
+        "id string, update_at string",
+    )
+    pdf = filter_update_at_range(
+        pdf,
+        "year=2023/month=08/day=01/hour=01/minute=21",
+        "year=2023/month=08/day=01/hour=01/minute=40",
+    )
+    assert sorted(row.id for row in pdf.collect()) == ["b", "c"]
+
+
+if __name__ == "__main__":
+    from dynamodb_to_datalake.tests.helper import run_cov_test
+
+    run_cov_test(__file__, "glue_jobs.incremental")
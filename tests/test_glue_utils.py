@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+from datetime import datetime, timedelta
+
+from glue_jobs.glue_utils import get_lock_options, get_partition_predicate
+
+
+def test_get_lock_options():
+    options = get_lock_options("transactions", "my_app-hudi_lock", "us-east-1")
+    assert options["hoodie.write.lock.dynamodb.table"] == "my_app-hudi_lock"
+    assert options["hoodie.write.lock.dynamodb.partition_key"] == "transactions"
+    assert options["hoodie.write.lock.dynamodb.region"] == "us-east-1"
+    assert (
+        options["hoodie.write.concurrency.mode"] == "optimistic_concurrency_control"
+    )
+
+
+def test_get_partition_predicate():
+    dt = datetime.utcnow() - timedelta(days=3)
+    year, month, day = dt.strftime("%Y"), dt.strftime("%m"), dt.strftime("%d")
+
+    assert get_partition_predicate(3, "create_year") == f"(create_year < '{year}')"
+    assert get_partition_predicate(3, "create_year,create_month") == (
+        f"(create_year < '{year}')"
+        f" OR (create_year = '{year}' AND create_month < '{month}')"
+    )
+    expected = (
+        f"(create_year < '{year}')"
+        f" OR (create_year = '{year}' AND create_month < '{month}')"
+        f" OR (create_year = '{year}' AND create_month = '{month}'"
+        f" AND create_day < '{day}')"
+    )
+    assert get_partition_predicate(3, "create_year,create_month,create_day") == expected
+    # the finer partitions are compared by their day
+    assert (
+        get_partition_predicate(
+            3, "create_year,create_month,create_day,create_hour,create_minute"
+        )
+        == expected
+    )
+
+
+if __name__ == "__main__":
+    from dynamodb_to_datalake.tests.helper import run_cov_test
+
+    run_cov_test(__file__, "glue_jobs.glue_utils")
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from dynamodb_to_datalake.hudi_reader import (
+    Instant,
+    BaseFile,
+    parse_partition,
+    HudiSnapshotReader,
+)
+
+
+def write_base_file(dir_table, partition, file_id, instant_time, ids, note):
+    dir_partition = dir_table.joinpath(partition)
+    dir_partition.mkdir(parents=True, exist_ok=True)
+    dir_partition.joinpath(".hoodie_partition_metadata").write_text("")
+    # hoodie.partition.metafile.use.base.format = true
+    pq.write_table(
+        pa.table({"commitTime": [instant_time]}),
+        str(dir_partition.joinpath(".hoodie_partition_metadata.parquet")),
+    )
+    table = pa.table(
+        {
+            "_hoodie_commit_time": [instant_time] * len(ids),
+            "id": ids,
+            "note": [note] * len(ids),
+        }
+    )
+    pq.write_table(
+        table,
+        str(dir_partition.joinpath(f"{file_id}_0-1-0_{instant_time}.parquet")),
+    )
+
+
+def create_table(dir_table):
+    dir_hoodie = dir_table.joinpath(".hoodie")
+    dir_hoodie.mkdir(parents=True)
+    dir_hoodie.joinpath("hoodie.properties").write_text(
+        "hoodie.table.name=transactions\n"
+        "hoodie.table.partition.fields=create_year,create_month\n"
+    )
+    p1 = "create_year=2023/create_month=07"
+    p2 = "create_year=2023/create_month=08"
+
+    # commit 1: two file groups
+    dir_hoodie.joinpath("20230801000000000.commit").write_text("{}")
+    write_base_file(dir_table, p1, "fg1", "20230801000000000", ["a", "b"], "v1")
+    write_base_file(dir_table, p2, "fg2", "20230801000000000", ["c"], "v1")
+
+    # commit 2: update fg1
+    dir_hoodie.joinpath("20230801000100000.commit").write_text("{}")
+    write_base_file(dir_table, p1, "fg1", "20230801000100000", ["a", "b"], "v2")
+
+    # failed commit 3: inflight, should be ignored
+    dir_hoodie.joinpath("20230801000200000.inflight").write_text("")
+    write_base_file(dir_table, p1, "fg1", "20230801000200000", ["a", "b"], "v3")
+
+    # replace commit 4: replace fg2 with fg3
+    dir_hoodie.joinpath("20230801000300000.replacecommit").write_text(
+        json.dumps({"partitionToReplaceFileIds": {p2: ["fg2"]}})
+    )
+    write_base_file(dir_table, p2, "fg3", "20230801000300000", ["c"], "v4")
+
+
+def test_instant():
+    instant = Instant.from_filename("20230801000000000.commit")
+    assert instant.is_completed
+    assert instant.action == "commit"
+    instant = Instant.from_filename("20230801000000000.inflight")
+    assert instant.is_completed is False
+    assert instant.action == "commit"
+    instant = Instant.from_filename("20230801000000000.replacecommit.requested")
+    assert instant.state == "requested"
+    assert Instant.from_filename("hoodie.properties") is None
+
+
+def test_base_file():
+    base_file = BaseFile.from_path(
+        "/table/p/a1b2-0_0-1-0_20230801000000000.parquet", "p"
+    )
+    assert base_file.file_id == "a1b2-0"
+    assert base_file.instant_time == "20230801000000000"
+    assert BaseFile.from_path("/table/p/.hoodie_partition_metadata.parquet", "p") is None
+    assert BaseFile.from_path("/table/p/.hoodie_partition_metadata", "p") is None
+    assert BaseFile.from_path("/table/p/part-00000.parquet", "p") is None
+
+
+def test_parse_partition():
+    assert parse_partition("create_year=2023/create_month=08") == {
+        "create_year": "2023",
+        "create_month": "08",
+    }
+
+
+def test_hudi_snapshot_reader(tmp_path):
+    dir_table = tmp_path.joinpath("transactions")
+    create_table(dir_table)
+    reader = HudiSnapshotReader(table_path=str(dir_table))
+    assert reader.partition_fields == ["create_year", "create_month"]
+    assert reader.get_latest_instant() == "20230801000300000"
+
+    # snapshot
+    table = reader.read(columns=["id", "note"])
+    assert table.column_names == ["id", "note"]
+    rows = sorted(table.to_pylist(), key=lambda row: row["id"])
+    assert rows == [
+        {"id": "a", "note": "v2"},
+        {"id": "b", "note": "v2"},
+        {"id": "c", "note": "v4"},
+    ]
+
+    # partition filter
+    table = reader.read(partition_filter={"create_year": "2023", "create_month": "08"})
+    assert table["note"].to_pylist() == ["v4"]
+    table = reader.read(partition_filter=lambda values: values["create_month"] == "07")
+    assert table.num_rows == 2
+
+    # time travel
+    table = reader.read(as_of_instant="20230801000000000")
+    rows = sorted(table.to_pylist(), key=lambda row: row["id"])
+    assert [row["note"] for row in rows] == ["v1", "v1", "v1"]
+
+    # count from the parquet footers
+    assert reader.count() == 3
+    assert reader.count(partition_filter={"create_month": "07"}) == 2
+
+    # one base file at a time
+    reader.max_workers = 1
+    tables = list(reader.iter_batches(columns=["id"]))
+    assert [table.num_rows for table in tables] == [2, 1]
+    batches = reader.iter_batches()
+    assert next(batches).num_rows == 2
+    batches.close()
+
+
+def test_hudi_incremental_read(tmp_path):
+    dir_table = tmp_path.joinpath("transactions")
+    create_table(dir_table)
+    reader = HudiSnapshotReader(table_path=str(dir_table))
+
+    table = reader.read_incremental(begin_instant="20230801000000000")
+    assert sorted(table["note"].to_pylist()) == ["v2", "v2", "v4"]
+
+    table = reader.read_incremental(
+        begin_instant="20230801000000000",
+        end_instant="20230801000100000",
+        columns=["id"],
+    )
+    assert table.column_names == ["id"]
+    assert sorted(table["id"].to_pylist()) == ["a", "b"]
+
+    table = reader.read_incremental(begin_instant="20230801000300000")
+    assert table.num_rows == 0
+
+    # the replace commit moves c to a new file group, it is not a delete
+    assert (
+        reader.read_deleted_keys(begin_instant="20230801000000000", key_column="id")
+        == []
+    )
+
+
+if __name__ == "__main__":
+    from dynamodb_to_datalake.tests.helper import run_cov_test
+
+    run_cov_test(__file__, "dynamodb_to_datalake.hudi_reader")
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+import json
+from datetime import datetime
+
+import polars as pl
+
+import pytest
+from moto import mock_aws
+from s3pathlib import S3Path
+from boto_session_manager import BotoSesManager
+
+from dynamodb_to_datalake.compare_diff import make_id, to_df
+from dynamodb_to_datalake.stream_sink import to_parquet
+from dynamodb_to_datalake.stream_compaction import StreamCompactor
+from dynamodb_to_datalake.incremental_compare_diff import (
+    IS_DELETED,
+    read_cdc_file,
+    to_changes_df,
+    get_latest_version,
+    diff_changes,
+    CompareTracker,
+)
+
+BUCKET = "bucket"
+s3dir_stream = S3Path(f"s3://{BUCKET}/dynamodb_stream/")
+s3dir_compacted = S3Path(f"s3://{BUCKET}/dynamodb_stream_compacted/")
+s3path_manifest = S3Path(f"s3://{BUCKET}/manifest.json")
+s3path_tracker = S3Path(f"s3://{BUCKET}/incremental_compare_tracker.json")
+
+
+def make_row(create_at, update_at, **kwargs):
+    row = {
+        "account": "a",
+        "create_at": create_at,
+        "update_at": update_at,
+        "entity": "e",
+        "amount": 1,
+        "is_credit": 0,
+        "note": "n",
+    }
+    row.update(kwargs)
+    return row
+
+
+def hudify(row):
+    row = {k: v for k, v in row.items() if k not in [IS_DELETED, "delete_source"]}
+    row["id"] = make_id(row["account"], row["create_at"])
+    return row
+
+
+def test_get_latest_version():
+    df = to_changes_df(
+        [
+            hudify(make_row("1", "1")),
+            # partial updates, only the changed columns
+            {"id": make_id("a", "1"), "update_at": "3", "note": "n3"},
+            {"id": make_id("a", "1"), "update_at": "2", "amount": 2},
+            # deleted after it is updated
+            hudify(make_row("2", "1")),
+            {"id": make_id("a", "2"), "update_at": "2", IS_DELETED: True},
+        ]
+    )
+    rows = get_latest_version(df).to_dicts()
+    assert rows[0] == {
+        **hudify(make_row("1", "3", amount=2, note="n3")),
+        IS_DELETED: False,
+    }
+    assert rows[1]["id"] == make_id("a", "2")
+    assert rows[1]["update_at"] == "2"
+    assert rows[1][IS_DELETED] is True
+
+
+def test_diff_changes():
+    same = hudify(make_row("1", "2"))
+    partial = hudify(make_row("2", "2"))
+    newer = hudify(make_row("3", "2"))
+    missing = hudify(make_row("4", "2"))
+    changed = hudify(make_row("5", "2"))
+    deleted = hudify(make_row("6", "2"))
+    recreated = hudify(make_row("7", "2"))
+    df_changes = pl.concat(
+        [
+            to_changes_df([same, newer, missing, changed]),
+            # the partial update doesn't have note, it is taken from hudi
+            to_changes_df([{**partial, "note": None}]),
+            to_changes_df([{**deleted, IS_DELETED: True}]),
+            to_changes_df([{**recreated, IS_DELETED: True}]),
+        ]
+    )
+    df_hudi = to_df(
+        [
+            same,
+            {**partial, "note": "from hudi"},
+            {**newer, "update_at": "3", "amount": 3},
+            {**changed, "amount": 5},
+            deleted,
+            {**recreated, "update_at": "3"},
+        ]
+    )
+    diff_result = diff_changes(df_changes, df_hudi)
+    assert diff_result.missing["id"].to_list() == [missing["id"]]
+    assert diff_result.extra["id"].to_list() == [deleted["id"]]
+    assert diff_result.changed["id"].to_list() == [changed["id"]]
+    assert diff_result.changed["amount_hudi"].to_list() == [5]
+
+    diff_result = diff_changes(
+        to_changes_df([same, {**deleted, IS_DELETED: True}]),
+        to_df([same]),
+    )
+    assert diff_result.is_same
+
+
+@pytest.fixture
+def bsm():
+    with mock_aws():
+        bsm = BotoSesManager(region_name="us-east-1")
+        bsm.s3_client.create_bucket(Bucket=BUCKET)
+        yield bsm
+
+
+def test_read_cdc_file(bsm):
+    row = make_row("1", "1")
+    s3path_json = s3dir_stream.joinpath("f1.json")
+    s3path_json.write_text(json.dumps(row), bsm=bsm)
+    s3path_parquet = s3dir_stream.joinpath("f2.parquet")
+    s3path_parquet.write_bytes(to_parquet([row]), bsm=bsm)
+    for s3path in [s3path_json, s3path_parquet]:
+        assert read_cdc_file(s3path, bsm=bsm) == [hudify(row)]
+
+
+def test_compare_tracker(bsm):
+    # hour 01 is compacted and its minute files are deleted
+    row_1 = make_row("2023-08-01T01:01:00", "2023-08-01T01:01:00")
+    s3dir_stream.joinpath(
+        "year=2023/month=08/day=01/hour=01/minute=01/f1.parquet"
+    ).write_bytes(to_parquet([row_1]), bsm=bsm)
+    compactor = StreamCompactor(
+        s3dir_dynamodb_stream=s3dir_stream,
+        s3dir_compacted=s3dir_compacted,
+        s3path_manifest=s3path_manifest,
+        epoch_hour=datetime(2023, 8, 1, 1),
+        source_retention_minutes=0,
+    )
+    compactor.run(bsm=bsm, now=datetime(2023, 8, 1, 3))
+    compactor.run(bsm=bsm, now=datetime(2023, 8, 1, 4))
+    assert len(list(s3dir_stream.iter_objects(bsm=bsm))) == 0
+
+    # hour 02 is not compacted
+    row_2 = make_row("2023-08-01T02:05:00", "2023-08-01T02:05:00")
+    s3dir_stream.joinpath(
+        "year=2023/month=08/day=01/hour=02/minute=05/f2.json"
+    ).write_text(json.dumps(row_2), bsm=bsm)
+    row_3 = make_row("2023-08-01T02:30:00", "2023-08-01T02:30:00")
+    s3dir_stream.joinpath(
+        "year=2023/month=08/day=01/hour=02/minute=30/f3.json"
+    ).write_text(json.dumps(row_3), bsm=bsm)
+
+    tracker = CompareTracker.read(
+        bsm=bsm,
+        s3path_tracker=s3path_tracker,
+        s3dir_dynamodb_stream=s3dir_stream,
+        epoch_verified_partition="year=2023/month=08/day=01/hour=00/minute=59",
+        s3path_compaction_manifest=s3path_manifest,
+    )
+    s3path_list = tracker.list_cdc_files(
+        bsm=bsm,
+        end_partition="year=2023/month=08/day=01/hour=02/minute=10",
+    )
+    assert len(s3path_list) == 2
+    assert s3path_list[0].uri.startswith(s3dir_compacted.uri)
+
+    hudi = {row["id"]: row for row in map(hudify, [row_1, row_2, row_3])}
+
+    def hudi_reader(ids):
+        return to_df([hudi[id] for id in ids if id in hudi])
+
+    # verified, advance the checkpoint
+    diff_result = tracker.verify(
+        bsm=bsm,
+        end_partition="year=2023/month=08/day=01/hour=02/minute=10",
+        hudi_reader=hudi_reader,
+    )
+    assert diff_result.is_same
+    tracker = CompareTracker.read(
+        bsm=bsm,
+        s3path_tracker=s3path_tracker,
+        s3dir_dynamodb_stream=s3dir_stream,
+        epoch_verified_partition="year=2023/month=08/day=01/hour=00/minute=59",
+        s3path_compaction_manifest=s3path_manifest,
+    )
+    assert tracker.last_verified_partition == (
+        "year=2023/month=08/day=01/hour=02/minute=10"
+    )
+
+    # row 3 is not loaded into hudi, keep the checkpoint
+    hudi.pop(hudify(row_3)["id"])
+    diff_result = tracker.verify(
+        bsm=bsm,
+        end_partition="year=2023/month=08/day=01/hour=02/minute=59",
+        hudi_reader=hudi_reader,
+    )
+    assert diff_result.missing["id"].to_list() == [hudify(row_3)["id"]]
+    assert tracker.last_verified_partition == (
+        "year=2023/month=08/day=01/hour=02/minute=10"
+    )
+
+    # nothing to verify
+    diff_result = tracker.verify(
+        bsm=bsm,
+        end_partition="year=2023/month=08/day=01/hour=02/minute=10",
+        hudi_reader=hudi_reader,
+    )
+    assert diff_result.is_same
+
+
+if __name__ == "__main__":
+    from dynamodb_to_datalake.tests.helper import run_cov_test
+
+    run_cov_test(__file__, "dynamodb_to_datalake.incremental_compare_diff")
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import pytest
+from moto import mock_aws
+from s3pathlib import S3Path
+from boto_session_manager import BotoSesManager
+
+from dynamodb_to_datalake.hudi_reader import HudiSnapshotReader
+from dynamodb_to_datalake.incremental_consumer import (
+    EPOCH_INSTANT,
+    IS_DELETED_FIELD,
+    IncrementalConsumer,
+)
+
+BUCKET = "bucket"
+s3dir_checkpoint = S3Path(f"s3://{BUCKET}/hudi_incremental_pull/")
+PARTITION = "create_year=2023/create_month=08"
+
+
+@pytest.fixture
+def bsm():
+    with mock_aws():
+        bsm = BotoSesManager(region_name="us-east-1")
+        bsm.s3_client.create_bucket(Bucket=BUCKET)
+        yield bsm
+
+
+def commit(dir_table, file_id, instant_time, rows):
+    dir_table.joinpath(".hoodie", f"{instant_time}.commit").write_text("{}")
+    dir_partition = dir_table.joinpath(PARTITION)
+    dir_partition.mkdir(parents=True, exist_ok=True)
+    pq.write_table(
+        pa.table(
+            {
+                "_hoodie_commit_time": [instant_time] * len(rows),
+                "_hoodie_record_key": [id for id, _ in rows],
+                "id": [id for id, _ in rows],
+                "note": [note for _, note in rows],
+            }
+        ),
+        str(dir_partition.joinpath(f"{file_id}_0-1-0_{instant_time}.parquet")),
+    )
+
+
+def create_table(dir_table):
+    dir_table.joinpath(".hoodie").mkdir(parents=True)
+    dir_table.joinpath(".hoodie", "hoodie.properties").write_text(
+        "hoodie.table.partition.fields=create_year,create_month\n"
+    )
+    return HudiSnapshotReader(table_path=str(dir_table))
+
+
+def test_read_deleted_keys(tmp_path):
+    dir_table = tmp_path.joinpath("transactions")
+    reader = create_table(dir_table)
+    commit(dir_table, "fg1", "20230801000000000", [("a", "v1"), ("b", "v1")])
+    assert reader.read_deleted_keys(begin_instant=EPOCH_INSTANT) == []
+
+    # update a, delete b
+    commit(dir_table, "fg1", "20230801000100000", [("a", "v2")])
+    assert reader.read_deleted_keys(begin_instant="20230801000000000") == ["b"]
+    assert reader.read_deleted_keys(begin_instant="20230801000100000") == []
+    assert (
+        reader.read_deleted_keys(
+            begin_instant="20230801000000000",
+            partition_filter={"create_month": "07"},
+        )
+        == []
+    )
+
+
+def test_incremental_consumer(bsm, tmp_path):
+    dir_table = tmp_path.joinpath("transactions")
+    reader = create_table(dir_table)
+
+    consumer = IncrementalConsumer.read(
+        bsm=bsm, consumer_id="c1", s3dir_checkpoint=s3dir_checkpoint
+    )
+    assert consumer.last_pulled_instant == EPOCH_INSTANT
+    df, end_instant = consumer.pull(reader)
+    assert df.shape[0] == 0
+    assert end_instant == EPOCH_INSTANT
+
+    # commit 1: insert a, b
+    commit(dir_table, "fg1", "20230801000000000", [("a", "v1"), ("b", "v1")])
+    df, end_instant = consumer.pull(reader, columns=["id", "note"])
+    assert end_instant == "20230801000000000"
+    assert sorted(df["id"].to_list()) == ["a", "b"]
+    consumer.commit(bsm=bsm, end_instant=end_instant)
+
+    # commit 2: update a, delete b
+    commit(dir_table, "fg1", "20230801000100000", [("a", "v2")])
+
+    # resume from the checkpoint on s3
+    consumer = IncrementalConsumer.read(
+        bsm=bsm, consumer_id="c1", s3dir_checkpoint=s3dir_checkpoint
+    )
+    assert consumer.last_pulled_instant == "20230801000000000"
+    df, end_instant = consumer.pull(reader, columns=["id", "note"])
+    assert end_instant == "20230801000100000"
+    rows = sorted(df.to_dicts(), key=lambda row: row["id"])
+    assert rows == [
+        {"id": "a", "note": "v2", IS_DELETED_FIELD: False},
+        {"id": "b", "note": None, IS_DELETED_FIELD: True},
+    ]
+    df, _ = consumer.pull(reader, columns=["id", "note"], with_tombstones=False)
+    assert df["id"].to_list() == ["a"]
+
+    # the callback failed, not committed, the next pull returns the same data
+    consumer = IncrementalConsumer.read(
+        bsm=bsm, consumer_id="c1", s3dir_checkpoint=s3dir_checkpoint
+    )
+    df_retry, end_instant_retry = consumer.pull(reader, columns=["id", "note"])
+    assert end_instant_retry == end_instant
+    assert sorted(df_retry.to_dicts(), key=lambda row: row["id"]) == rows
+
+    # committed, nothing new to pull
+    consumer.commit(bsm=bsm, end_instant=end_instant)
+    consumer = IncrementalConsumer.read(
+        bsm=bsm, consumer_id="c1", s3dir_checkpoint=s3dir_checkpoint
+    )
+    assert consumer.last_pulled_instant == "20230801000100000"
+    assert consumer.last_pulled_at is not None
+    df, end_instant = consumer.pull(reader)
+    assert df.shape[0] == 0
+    assert end_instant == "20230801000100000"
+
+
+def test_incremental_consumer_athena_reader(bsm, tmp_path):
+    dir_table = tmp_path.joinpath("transactions")
+    reader = create_table(dir_table)
+    commit(dir_table, "fg1", "20230801000000000", [("a", "v1")])
+    consumer = IncrementalConsumer.read(
+        bsm=bsm, consumer_id="c2", s3dir_checkpoint=s3dir_checkpoint
+    )
+    calls = list()
+
+    def athena_reader(begin_instant, end_instant, columns):
+        calls.append((begin_instant, end_instant, columns))
+        return pl.DataFrame({"id": ["a"]})
+
+    df, end_instant = consumer.pull(reader, columns=["id"], athena_reader=athena_reader)
+    assert calls == [(EPOCH_INSTANT, "20230801000000000", ["id"])]
+    assert df["id"].to_list() == ["a"]
+
+
+if __name__ == "__main__":
+    from dynamodb_to_datalake.tests.helper import run_cov_test
+
+    run_cov_test(__file__, "dynamodb_to_datalake.incremental_consumer")
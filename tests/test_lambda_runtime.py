@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from dynamodb_to_datalake.lambda_runtime import (
+    get_default_timeouts,
+    get_client_config,
+    get_deadline,
+    get_client,
+    reset_clients,
+)
+
+
+def test_get_client_config(monkeypatch):
+    monkeypatch.setenv("MAX_ATTEMPTS", "5")
+    config = get_client_config(max_pool_connections=16)
+    assert config.max_pool_connections == 16
+    assert config.retries == {"max_attempts": 5, "mode": "standard"}
+
+
+def test_get_client(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    s3_client = get_client("s3", max_pool_connections=8)
+    assert get_client("s3", max_pool_connections=8) is s3_client
+    assert get_client("s3") is not s3_client
+    reset_clients()
+    assert get_client("s3", max_pool_connections=8) is not s3_client
+
+
+def test_get_default_timeouts(monkeypatch):
+    monkeypatch.delenv("FUNCTION_TIMEOUT", raising=False)
+    assert get_default_timeouts() == (2, 10, 3)
+    monkeypatch.setenv("FUNCTION_TIMEOUT", "3")
+    connect_timeout, read_timeout, max_attempts = get_default_timeouts()
+    assert max_attempts == 2
+    assert (connect_timeout + read_timeout) * max_attempts <= 2
+    config = get_client_config()
+    assert config.read_timeout == read_timeout
+
+
+class FakeContext:
+    def get_remaining_time_in_millis(self) -> int:
+        return 3000
+
+
+def test_get_deadline():
+    assert get_deadline(None) is None
+    deadline = get_deadline(FakeContext(), margin_seconds=0.5)
+    assert 2 < deadline - time.monotonic() <= 2.5
+
+
+if __name__ == "__main__":
+    from dynamodb_to_datalake.tests.helper import run_cov_test
+
+    run_cov_test(__file__, "dynamodb_to_datalake.lambda_runtime")
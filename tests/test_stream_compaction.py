@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+import io
+import json
+from datetime import datetime, timedelta
+
+import polars as pl
+
+import pytest
+from moto import mock_aws
+from s3pathlib import S3Path
+from boto_session_manager import BotoSesManager
+
+from dynamodb_to_datalake.stream_compaction import (
+    split_into_hours,
+    read_stream_file,
+    CompactionManifest,
+    StreamCompactor,
+)
+from dynamodb_to_datalake.stream_sink import to_parquet
+from dynamodb_to_datalake.incremental_load_orchestration import (
+    CDCTracker,
+    is_update_at_in_range,
+)
+
+BUCKET = "bucket"
+s3dir_stream = S3Path(f"s3://{BUCKET}/dynamodb_stream/")
+s3dir_compacted = S3Path(f"s3://{BUCKET}/dynamodb_stream_compacted/")
+s3path_manifest = S3Path(f"s3://{BUCKET}/manifest.json")
+
+
+def test_split_into_hours():
+    segments = split_into_hours(
+        datetime(2023, 8, 1, 0, 30),
+        datetime(2023, 8, 1, 3, 15),
+    )
+    assert segments == [
+        (datetime(2023, 8, 1, 0, 30), datetime(2023, 8, 1, 1), False),
+        (datetime(2023, 8, 1, 1), datetime(2023, 8, 1, 2), True),
+        (datetime(2023, 8, 1, 2), datetime(2023, 8, 1, 3), True),
+        (datetime(2023, 8, 1, 3), datetime(2023, 8, 1, 3, 15), False),
+    ]
+    assert split_into_hours(
+        datetime(2023, 8, 1, 1),
+        datetime(2023, 8, 1, 2),
+    ) == [(datetime(2023, 8, 1, 1), datetime(2023, 8, 1, 2), True)]
+    assert split_into_hours(
+        datetime(2023, 8, 1, 1),
+        datetime(2023, 8, 1, 1),
+    ) == []
+
+
+def test_get_closed_hours():
+    compactor = StreamCompactor(
+        s3dir_dynamodb_stream=s3dir_stream,
+        s3dir_compacted=s3dir_compacted,
+        s3path_manifest=s3path_manifest,
+        epoch_hour=datetime(2023, 8, 1, 0, 30),
+        lag_minutes=2,
+    )
+    manifest = CompactionManifest(s3path_manifest=compactor.s3path_manifest)
+    hours = compactor.get_closed_hours(manifest, now=datetime(2023, 8, 1, 3, 1))
+    assert hours == [datetime(2023, 8, 1, 0), datetime(2023, 8, 1, 1)]
+
+    manifest.get_entry(datetime(2023, 8, 1, 1))
+    manifest.last_compacted_hour = "year=2023/month=08/day=01/hour=01"
+    assert manifest.is_compacted(datetime(2023, 8, 1, 1))
+    assert manifest.get_compacted_s3uri_list(datetime(2023, 8, 1, 1)) == []
+    hours = compactor.get_closed_hours(manifest, now=datetime(2023, 8, 1, 3, 2))
+    assert hours == [datetime(2023, 8, 1, 2)]
+
+
+@pytest.fixture
+def bsm():
+    with mock_aws():
+        bsm = BotoSesManager(region_name="us-east-1")
+        bsm.s3_client.create_bucket(Bucket=BUCKET)
+        yield bsm
+
+
+def put_minute_file(bsm, minute: str, name: str, create_at: str):
+    record = {
+        "account": "a",
+        "create_at": create_at,
+        "update_at": create_at,
+        "amount": 1,
+    }
+    s3path = s3dir_stream.joinpath(
+        f"year=2023/month=08/day=01/hour=01/minute={minute}/{name}.json"
+    )
+    s3path.write_text(json.dumps(record), bsm=bsm)
+    return s3path
+
+
+def test_late_file(bsm):
+    compactor = StreamCompactor(
+        s3dir_dynamodb_stream=s3dir_stream,
+        s3dir_compacted=s3dir_compacted,
+        s3path_manifest=s3path_manifest,
+        epoch_hour=datetime(2023, 8, 1, 1),
+        lag_minutes=60,
+        source_retention_minutes=180,
+    )
+    tracker = CDCTracker(
+        s3path_tracker=S3Path(f"s3://{BUCKET}/tracker.json"),
+        s3dir_glue_job_input=S3Path(f"s3://{BUCKET}/glue_job_input/"),
+        s3dir_dynamodb_stream=s3dir_stream,
+        glue_job_name="incremental",
+        epoch_processed_partition="year=2023/month=08/day=01/hour=01/minute=00",
+        s3path_compaction_manifest=s3path_manifest,
+    )
+
+    def list_hour():
+        return tracker.list_stream_files(
+            bsm=bsm,
+            start_after_datetime=datetime(2023, 8, 1, 1),
+            end_before_datetime=datetime(2023, 8, 1, 2),
+        )
+
+    s3path_1 = put_minute_file(bsm, "01", "f1", "2023-08-01T01:01:00")
+    s3path_2 = put_minute_file(bsm, "59", "f2", "2023-08-01T01:59:00")
+
+    # the hour is not closed yet
+    manifest = compactor.run(bsm=bsm, now=datetime(2023, 8, 1, 2, 30))
+    assert manifest.hours == {}
+    assert list_hour() == [s3path_1.uri, s3path_2.uri]
+
+    manifest = compactor.run(bsm=bsm, now=datetime(2023, 8, 1, 3, 0))
+    files = manifest.get_compacted_s3uri_list(datetime(2023, 8, 1, 1))
+    assert len(files) == 1
+    assert list_hour() == files
+
+    # a lambda retry lands a file after the compaction
+    s3path_3 = put_minute_file(bsm, "30", "f3", "2023-08-01T01:30:00")
+    assert list_hour() == files + [s3path_3.uri]
+
+    # the next run merges it into another compacted file
+    manifest = compactor.run(bsm=bsm, now=datetime(2023, 8, 1, 4, 0))
+    files = manifest.get_compacted_s3uri_list(datetime(2023, 8, 1, 1))
+    assert len(files) == 2
+    assert list_hour() == files
+    assert s3path_1.exists(bsm=bsm)
+
+    # the merged minute files are deleted after the retention
+    manifest = compactor.run(bsm=bsm, now=datetime(2023, 8, 1, 7, 0))
+    assert manifest.get_sources(datetime(2023, 8, 1, 1)) == set()
+    for s3path in [s3path_1, s3path_2, s3path_3]:
+        assert s3path.exists(bsm=bsm) is False
+    assert list_hour() == files
+    manifest = CompactionManifest.read(bsm=bsm, s3path_manifest=s3path_manifest)
+    assert manifest.get_compacted_s3uri_list(datetime(2023, 8, 1, 1)) == files
+
+
+def test_resume_in_the_middle_of_compacted_hour(bsm):
+    compactor = StreamCompactor(
+        s3dir_dynamodb_stream=s3dir_stream,
+        s3dir_compacted=s3dir_compacted,
+        s3path_manifest=s3path_manifest,
+        epoch_hour=datetime(2023, 8, 1, 1),
+        lag_minutes=60,
+        source_retention_minutes=180,
+    )
+    tracker = CDCTracker(
+        s3path_tracker=S3Path(f"s3://{BUCKET}/tracker.json"),
+        s3dir_glue_job_input=S3Path(f"s3://{BUCKET}/glue_job_input/"),
+        s3dir_dynamodb_stream=s3dir_stream,
+        glue_job_name="incremental",
+        epoch_processed_partition="year=2023/month=08/day=01/hour=01/minute=00",
+        s3path_compaction_manifest=s3path_manifest,
+        # the last run processed until 01:20
+        last_processed_partition="year=2023/month=08/day=01/hour=01/minute=20",
+    )
+    for minute in ["10", "30", "59"]:
+        put_minute_file(bsm, minute, f"f{minute}", f"2023-08-01T01:{minute}:00")
+
+    # the merged minute files are deleted before the lagging run resumes
+    compactor.run(bsm=bsm, now=datetime(2023, 8, 1, 3, 0))
+    manifest = compactor.run(bsm=bsm, now=datetime(2023, 8, 1, 7, 0))
+    assert manifest.get_sources(datetime(2023, 8, 1, 1)) == set()
+
+    start_after_datetime = tracker.last_processed_datetime + timedelta(minutes=1)
+    end_before_datetime = datetime(2023, 8, 1, 1, 40)
+    s3uri_list = tracker.list_stream_files(
+        bsm=bsm,
+        start_after_datetime=start_after_datetime,
+        end_before_datetime=end_before_datetime,
+    )
+    assert s3uri_list == manifest.get_compacted_s3uri_list(datetime(2023, 8, 1, 1))
+    records = [
+        record
+        for s3uri in s3uri_list
+        for record in read_stream_file(S3Path(s3uri), bsm=bsm)
+        if is_update_at_in_range(
+            record["update_at"], start_after_datetime, end_before_datetime
+        )
+    ]
+    assert [record["update_at"] for record in records] == ["2023-08-01T01:30:00"]
+
+    # a late file in the range is read too, the one out of the range is not
+    s3path_late = put_minute_file(bsm, "35", "late", "2023-08-01T01:35:00")
+    put_minute_file(bsm, "45", "late", "2023-08-01T01:45:00")
+    assert tracker.list_stream_files(
+        bsm=bsm,
+        start_after_datetime=start_after_datetime,
+        end_before_datetime=end_before_datetime,
+    ) == s3uri_list + [s3path_late.uri]
+
+
+def test_is_update_at_in_range():
+    start, end = datetime(2023, 8, 1, 1, 21), datetime(2023, 8, 1, 1, 40)
+    assert is_update_at_in_range("2023-08-01T01:21:00.000000+0000", start, end)
+    assert is_update_at_in_range("2023-08-01T01:39:59.999999+0000", start, end)
+    assert not is_update_at_in_range("2023-08-01T01:20:59.999999+0000", start, end)
+    assert not is_update_at_in_range("2023-08-01T01:40:00.000000+0000", start, end)
+
+
+def test_compact_parquet_sink_output(bsm):
+    s3dir_hour = s3dir_stream.joinpath("year=2023/month=08/day=01/hour=01/")
+    s3dir_hour.joinpath("minute=01/f1.json").write_text(
+        json.dumps({"account": "a", "create_at": "1", "update_at": "1", "amount": 1}),
+        bsm=bsm,
+    )
+    rows = [
+        # partial update
+        {"account": "a", "create_at": "2", "update_at": "2", "note": "rent"},
+        {
+            "account": "a",
+            "create_at": "3",
+            "update_at": "3",
+            "is_deleted": True,
+            "delete_source": "ttl",
+        },
+    ]
+    s3path_parquet = s3dir_hour.joinpath("minute=02/f2.parquet")
+    s3path_parquet.write_bytes(to_parquet(rows), bsm=bsm)
+    assert read_stream_file(s3path_parquet, bsm=bsm) == rows
+
+    compactor = StreamCompactor(
+        s3dir_dynamodb_stream=s3dir_stream,
+        s3dir_compacted=s3dir_compacted,
+        s3path_manifest=s3path_manifest,
+        epoch_hour=datetime(2023, 8, 1, 1),
+    )
+    manifest = compactor.run(bsm=bsm, now=datetime(2023, 8, 1, 3))
+    (s3uri,) = manifest.get_compacted_s3uri_list(datetime(2023, 8, 1, 1))
+    df = pl.read_parquet(io.BytesIO(S3Path(s3uri).read_bytes(bsm=bsm)))
+    assert df["create_at"].to_list() == ["1", "2", "3"]
+    assert df["amount"].to_list() == [1, None, None]
+    assert df["note"].to_list() == [None, "rent", None]
+    assert df["is_deleted"].to_list() == [None, None, True]
+
+
+if __name__ == "__main__":
+    from dynamodb_to_datalake.tests.helper import run_cov_test
+
+    run_cov_test(__file__, "dynamodb_to_datalake.stream_compaction")
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+import random
+
+import pytest
+
+from dynamodb_to_datalake.stream_partition import (
+    _get_partition_key_slow,
+    get_partition_key,
+    group_by_partition,
+)
+
+
+def test_get_partition_key():
+    for update_at in [
+        "2023-08-01T00:01:02.123456+0000",
+        "2023-12-31T23:59:59.000000+0800",
+        "2023-08-01T00:01:02.1+0000",
+    ]:
+        assert get_partition_key(update_at) == _get_partition_key_slow(update_at)
+    assert get_partition_key("2023-08-01T00:01:02.123456+0000") == "2023-08-01-00-01"
+    # non canonical input goes to the strptime fallback
+    assert get_partition_key("2023-8-1T0:1:02.123456+0000") == "2023-08-01-00-01"
+
+
+def test_get_partition_key_leap_year():
+    for update_at in [
+        "2024-02-29T00:01:02.123456+0000",
+        "2000-02-29T00:01:02.123456+0000",
+        "2023-01-31T00:01:02.123456+0000",
+        "2023-04-30T00:01:02.123456+0000",
+    ]:
+        assert get_partition_key(update_at) == update_at[:10] + "-00-01"
+    for update_at in [
+        "2023-02-29T00:01:02.123456+0000",
+        "1900-02-29T00:01:02.123456+0000",
+        "2024-02-30T00:01:02.123456+0000",
+        "2023-04-31T00:01:02.123456+0000",
+        "2023-06-31T00:01:02.123456+0000",
+    ]:
+        with pytest.raises(ValueError):
+            get_partition_key(update_at)
+
+
+def test_get_partition_key_invalid():
+    for update_at in [
+        # trailing garbage
+        "2023-08-01T00:01:02.123456+0000x",
+        "2023-08-01T00:01:02.123456+0000 ",
+        "2023-08-01T00:01:02.1234567+0000",
+        # invalid time and offset
+        "2023-08-01T00:01:60.123456+0000",
+        "2023-08-01T24:01:02.123456+0000",
+        "2023-08-01T00:01:02.123456+2400",
+        "2023-08-01T00:01:02.123456+0060",
+        "0000-08-01T00:01:02.123456+0000",
+        "2023-08-01T00:01:02+0000",
+    ]:
+        with pytest.raises(ValueError):
+            get_partition_key(update_at)
+    # non ascii digits never take the fast path
+    update_at = "\uff12\uff10\uff12\uff13-08-01T00:01:02.123456+0000"
+    assert get_partition_key(update_at) == "2023-08-01-00-01"
+    for update_at in [
+        "2023-08-01T00:01:02.\u0661\u0662+0000",
+        "2023-08-\u00b9\u00b2T00:01:02.123456+0000",
+    ]:
+        with pytest.raises(ValueError):
+            get_partition_key(update_at)
+
+
+def test_get_partition_key_same_as_strptime():
+    rnd = random.Random(1)
+    chars = "0123456789-T:.+ Z"
+    for _ in range(20000):
+        chars_list = list("2023-02-28T23:59:59.123456+0000")
+        for _ in range(rnd.randint(1, 2)):
+            chars_list[rnd.randrange(len(chars_list))] = rnd.choice(chars)
+        update_at = "".join(chars_list)[: rnd.randint(24, 31)]
+        try:
+            expected = _get_partition_key_slow(update_at)
+        except ValueError:
+            with pytest.raises(ValueError):
+                get_partition_key(update_at)
+        else:
+            assert get_partition_key(update_at) == expected
+
+
+def test_group_by_partition():
+    items = [
+        ("a", "2023-08-01T00:01:02.000000+0000"),
+        ("b", "2023-08-01T00:02:02.000000+0000"),
+        ("c", "2023-08-01T00:01:59.000000+0000"),
+    ]
+    groups = group_by_partition(items, lambda item: item[1])
+    assert {key: [item[0] for item in group] for key, group in groups.items()} == {
+        "2023-08-01-00-01": ["a", "c"],
+        "2023-08-01-00-02": ["b"],
+    }
+
+
+if __name__ == "__main__":
+    from dynamodb_to_datalake.tests.helper import run_cov_test
+
+    run_cov_test(__file__, "dynamodb_to_datalake.stream_partition")
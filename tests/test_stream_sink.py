@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+import io
+import json
+import time
+
+import pytest
+import polars as pl
+
+from dynamodb_to_datalake.stream_sink import (
+    get_partition_path,
+    SinkBatch,
+    LocalSink,
+    to_parquet,
+    create_sink,
+)
+
+
+def make_batch(partition: str, name: str, n: int) -> SinkBatch:
+    return SinkBatch(
+        partition=partition,
+        name=name,
+        rows=[{"account": "a", "create_at": str(i)} for i in range(n)],
+        sequence_numbers=[str(i) for i in range(n)],
+    )
+
+
+def test_get_partition_path():
+    assert (
+        get_partition_path("2023-08-01-00-01")
+        == "year=2023/month=08/day=01/hour=00/minute=01"
+    )
+
+
+def test_local_sink(tmp_path):
+    sink = LocalSink(dir_root=tmp_path, max_buffer_rows=3)
+    assert sink.put(make_batch("2023-08-01-00-01", "b1", 2)) == []
+    assert len(list(tmp_path.rglob("*.json"))) == 0  # buffered
+    assert sink.put(make_batch("2023-08-01-00-02", "b2", 1)) == []
+    assert len(list(tmp_path.rglob("*.json"))) == 2  # flushed by row count
+    path = tmp_path.joinpath("year=2023/month=08/day=01/hour=00/minute=01/b1.json")
+    lines = path.read_text().splitlines()
+    assert [json.loads(line)["create_at"] for line in lines] == ["0", "1"]
+    assert sink.flush() == []
+
+
+def test_failed_batch(tmp_path):
+    # the parent folder is a file, the write fails
+    tmp_path.joinpath("year=2023").write_text("")
+    sink = LocalSink(dir_root=tmp_path)
+    sink.put(make_batch("2023-08-01-00-01", "b1", 2))
+    sink.put(make_batch("2023-08-01-00-02", "b2", 1))
+    failed = sink.flush()
+    assert sorted(batch.name for batch in failed) == ["b1", "b2"]
+
+
+def test_flush_deadline(tmp_path):
+    class SlowSink(LocalSink):
+        def write_batch(self, batch: SinkBatch):
+            if batch.name == "hung":
+                time.sleep(1)
+            super().write_batch(batch)
+
+    sink = SlowSink(dir_root=tmp_path)
+    sink.put(make_batch("2023-08-01-00-01", "hung", 2))
+    sink.put(make_batch("2023-08-01-00-02", "b2", 1))
+    start = time.monotonic()
+    failed = sink.flush(deadline=time.monotonic() + 0.2)
+    assert time.monotonic() - start < 0.5
+    assert [batch.name for batch in failed] == ["hung"]
+
+
+def test_to_parquet():
+    rows = [
+        {"account": "a", "create_at": "c", "update_at": "u", "amount": 1},
+        {"account": "a", "create_at": "c", "update_at": "u", "is_deleted": True},
+    ]
+    df = pl.read_parquet(io.BytesIO(to_parquet(rows)))
+    assert df["amount"].to_list() == [1, None]
+    assert df["is_deleted"].to_list() == [None, True]
+
+
+def test_parquet_schema():
+    from dynamodb_to_datalake.stream_compaction import STREAM_RECORD_SCHEMA
+
+    df = pl.read_parquet(io.BytesIO(to_parquet([])))
+    assert dict(df.schema) == STREAM_RECORD_SCHEMA
+
+
+def test_create_sink(tmp_path):
+    sink = create_sink("s3_json", bucket="bucket", prefix="prefix/")
+    assert sink.prefix == "prefix"
+    assert isinstance(create_sink("local", dir_root=tmp_path), LocalSink)
+    with pytest.raises(ValueError, match="s3_parquet"):
+        create_sink("kinesis")
+
+
+if __name__ == "__main__":
+    from dynamodb_to_datalake.tests.helper import run_cov_test
+
+    run_cov_test(__file__, "dynamodb_to_datalake.stream_sink")
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+import types
+import itertools
+
+import pytest
+
+import dynamodb_to_datalake.waiter as waiter_module
+from dynamodb_to_datalake.waiter import Waiter
+
+
+def test_backoff_delays():
+    waiter = Waiter(delays=1, timeout=10, verbose=False)
+    assert list(itertools.islice(waiter.delays, 3)) == [1, 1, 1]
+
+    waiter = Waiter(delays=1, timeout=10, verbose=False, backoff=2, max_delay=5)
+    assert list(itertools.islice(waiter.delays, 6)) == [1, 2, 4, 5, 5, 5]
+
+    waiter = Waiter(delays=0.5, timeout=10, verbose=False, backoff=3)
+    assert list(itertools.islice(waiter.delays, 4)) == [0.5, 1.5, 4.5, 13.5]
+
+
+def mock_time(monkeypatch, tick: float = 0.0) -> list:
+    """
+    Replace the time module seen by the waiter with a fake clock, the sleep
+    moves it forward, every read moves it by ``tick`` like the real one.
+
+    :return: the list of the sleep seconds.
+    """
+    clock = [0.0]
+    sleeps = list()
+
+    def time_func():
+        clock[0] += tick
+        return clock[0]
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        clock[0] += seconds
+
+    monkeypatch.setattr(
+        waiter_module, "time", types.SimpleNamespace(time=time_func, sleep=sleep)
+    )
+    return sleeps
+
+
+def test_waiter(monkeypatch):
+    sleeps = mock_time(monkeypatch)
+    attempts = list()
+    for attempt, elapsed in Waiter(
+        delays=1, timeout=100, verbose=False, backoff=2, max_delay=8
+    ):
+        attempts.append((attempt, elapsed))
+        if attempt == 5:
+            break
+    assert sleeps == [1, 2, 4, 8, 8]
+    assert attempts == [(1, 1), (2, 3), (3, 7), (4, 15), (5, 23)]
+
+
+def test_waiter_timeout(monkeypatch):
+    sleeps = mock_time(monkeypatch, tick=0.001)
+    with pytest.raises(TimeoutError):
+        for _ in Waiter(delays=1, timeout=10, verbose=False, backoff=2):
+            pass
+    # the last sleep is cut to the remaining time
+    assert sleeps[:3] == [1, 2, 4]
+    assert sleeps[3] == pytest.approx(3, abs=0.01)
+    assert len(sleeps) == 4
+
+
+if __name__ == "__main__":
+    from dynamodb_to_datalake.tests.helper import run_cov_test
+
+    run_cov_test(__file__, "dynamodb_to_datalake.waiter")